@@ -0,0 +1,338 @@
+# bench_mqtt.py
+# Message-rate / latency benchmarks for the iot_mqtt device wrappers.
+#
+# Runs against the in-process mqtt_sim.SimLab by default (no hardware, no
+# network), or against a real broker with --broker/--port.
+#
+# Measures:
+#   - publish throughput of _BaseDevice._publish (QoS 0/1, print_publish on/off)
+#   - get_base_temp request/response latency (p50/p90/p99), idle and under load
+#   - CPU time per message (process_time)
+#   - memory growth during a long watch() session (tracemalloc)
+#
+# Results are written as JSON so regressions can be tracked, e.g.
+#   python bench_mqtt.py --out bench_results.json
+#   python bench_mqtt.py --quick --compare bench_results.json
+
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime
+from typing import Callable, Optional
+
+from iot_mqtt import HeatMQTT, PumpMQTT
+
+# -----------------------------------------------------------------------------
+# Helpers
+# -----------------------------------------------------------------------------
+def _percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile (values need not be sorted)."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def _latency_summary(samples_s: list[float]) -> dict:
+    ms = [s * 1000.0 for s in samples_s]
+    return {
+        "n": len(ms),
+        "p50_ms": _percentile(ms, 50),
+        "p90_ms": _percentile(ms, 90),
+        "p99_ms": _percentile(ms, 99),
+        "max_ms": max(ms) if ms else float("nan"),
+        "mean_ms": statistics.fmean(ms) if ms else float("nan"),
+    }
+
+
+class _Load:
+    """Background publisher generating `rate` commands/s on a separate client."""
+
+    def __init__(self, dev: PumpMQTT, rate: float) -> None:
+        self.dev = dev
+        self.rate = rate
+        self.sent = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        period = 1.0 / self.rate if self.rate > 0 else 0.0
+        t_next = time.perf_counter()
+        while not self._stop.is_set():
+            self.dev._publish("load", "x" * 16)
+            self.sent += 1
+            t_next += period
+            delay = t_next - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+
+    def __enter__(self) -> "_Load":
+        if self.rate > 0:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+
+
+# -----------------------------------------------------------------------------
+# Benchmarks
+# -----------------------------------------------------------------------------
+def bench_publish(make: Callable[..., PumpMQTT], count: int, qos: int, print_publish: bool) -> dict:
+    """Back-to-back publishes through _publish; QoS 1 waits for every PUBACK at the end."""
+    dev = make(client_id="bench-pub", print_publish=print_publish)
+    dev.start()
+    try:
+        infos = []
+        sink = io.StringIO() if print_publish else None
+        cpu0, t0 = time.process_time(), time.perf_counter()
+        with contextlib.redirect_stdout(sink) if sink is not None else contextlib.nullcontext():
+            for i in range(count):
+                infos.append(dev._publish("bench", str(i), qos=qos))
+        for info in infos:
+            if qos > 0:
+                info.wait_for_publish(timeout=10.0)
+        wall = time.perf_counter() - t0
+        cpu = time.process_time() - cpu0
+    finally:
+        dev.disconnect()
+    return {
+        "count": count,
+        "qos": qos,
+        "print_publish": print_publish,
+        "wall_s": wall,
+        "msgs_per_s": count / wall if wall > 0 else float("inf"),
+        "cpu_us_per_msg": cpu / count * 1e6,
+    }
+
+
+def bench_get_temp(make_heat: Callable[..., HeatMQTT], make_pump: Callable[..., PumpMQTT],
+                   count: int, load_rate: float) -> dict:
+    """Round-trip latency of get_base_temp(), optionally with background command load."""
+    heat = make_heat(client_id="bench-heat", print_publish=False)
+    heat.start()
+    load_dev = make_pump(client_id="bench-load", print_publish=False)
+    load_dev.start()
+    samples: list[float] = []
+    timeouts = 0
+    try:
+        with _Load(load_dev, load_rate) as load:
+            cpu0 = time.process_time()
+            for _ in range(count):
+                t0 = time.perf_counter()
+                try:
+                    heat.get_base_temp(1, timeout_s=2.0)
+                except TimeoutError:
+                    timeouts += 1
+                    continue
+                samples.append(time.perf_counter() - t0)
+            cpu = time.process_time() - cpu0
+            load_sent = load.sent
+    finally:
+        heat.disconnect()
+        load_dev.disconnect()
+    out = _latency_summary(samples)
+    out.update({
+        "load_rate_per_s": load_rate,
+        "load_sent": load_sent,
+        "timeouts": timeouts,
+        "cpu_us_per_request": cpu / max(1, count) * 1e6,
+    })
+    return out
+
+
+def bench_watch_memory(make_heat: Callable[..., HeatMQTT], lab, seconds: float, rate: float) -> dict:
+    """
+    Keep a watch() session open while `rate` msgs/s arrive under base/#,
+    and report traced memory growth (Python allocations only).
+    """
+    heat = make_heat(client_id="bench-watch", print_publish=False)
+    heat.start()
+    received = [0]
+
+    def _cb(_topic: str, _payload: bytes) -> None:
+        received[0] += 1
+
+    tracemalloc.start()
+    try:
+        heat.watch(on_message=_cb)
+        time.sleep(0.2)
+        base_mem, _ = tracemalloc.get_traced_memory()
+        samples = []
+        t_end = time.perf_counter() + seconds
+        period = 1.0 / rate
+        t_next = time.perf_counter()
+        t_sample = time.perf_counter()
+        while time.perf_counter() < t_end:
+            lab.broker.publish(f"{heat.base}/temp/1", b"25.00")
+            t_next += period
+            now = time.perf_counter()
+            if now - t_sample >= 1.0:
+                samples.append(tracemalloc.get_traced_memory()[0] - base_mem)
+                t_sample = now
+            if t_next > now:
+                time.sleep(t_next - now)
+        time.sleep(0.2)
+        end_mem, peak_mem = tracemalloc.get_traced_memory()
+    finally:
+        heat.watch_stop()
+        tracemalloc.stop()
+        heat.disconnect()
+    return {
+        "seconds": seconds,
+        "rate_per_s": rate,
+        "received": received[0],
+        "mem_growth_bytes": end_mem - base_mem,
+        "peak_bytes": peak_mem - base_mem,
+        "growth_samples_bytes": samples,
+    }
+
+
+# -----------------------------------------------------------------------------
+# Runner
+# -----------------------------------------------------------------------------
+def run(args) -> dict:
+    lab = None
+    broker, port = args.broker, args.port
+    if broker is None:
+        from mqtt_sim import SimLab
+        with contextlib.redirect_stdout(io.StringIO()):
+            lab = SimLab(time_scale=0.01, heartbeat_s=None).start()
+        broker, port = "127.0.0.1", lab.port
+
+    def make_pump(**kw) -> PumpMQTT:
+        return PumpMQTT(broker=broker, port=port, base_topic="pumps/01", **kw)
+
+    def make_heat(**kw) -> HeatMQTT:
+        return HeatMQTT(broker=broker, port=port, base_topic="heat/01", **kw)
+
+    n = 500 if args.quick else args.count
+    results: dict = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "broker": "embedded" if lab is not None else f"{broker}:{port}",
+            "quick": bool(args.quick),
+        },
+        "publish": [],
+        "get_base_temp": [],
+    }
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for qos in (0, 1):
+                for pp in (False, True):
+                    results["publish"].append(bench_publish(make_pump, n, qos, pp))
+            for rate in (0.0, args.load_rate):
+                results["get_base_temp"].append(
+                    bench_get_temp(make_heat, make_pump, max(20, n // 10), rate)
+                )
+            if lab is not None:
+                results["watch_memory"] = bench_watch_memory(
+                    make_heat, lab, 3.0 if args.quick else args.watch_seconds, args.watch_rate
+                )
+    finally:
+        if lab is not None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                lab.stop()
+    return results
+
+
+def _flatten(results: dict) -> dict[str, float]:
+    """Key metrics for regression comparison (higher-is-better keys end in _per_s)."""
+    flat: dict[str, float] = {}
+    for r in results.get("publish", []):
+        flat[f"publish.qos{r['qos']}.print{int(r['print_publish'])}.msgs_per_s"] = r["msgs_per_s"]
+    for r in results.get("get_base_temp", []):
+        tag = f"get_base_temp.load{int(r['load_rate_per_s'])}"
+        flat[f"{tag}.p50_ms"] = r["p50_ms"]
+        flat[f"{tag}.p99_ms"] = r["p99_ms"]
+    if "watch_memory" in results:
+        flat["watch_memory.mem_growth_bytes"] = results["watch_memory"]["mem_growth_bytes"]
+    return flat
+
+
+MEM_NOISE_BYTES = 256 * 1024
+
+
+def compare(new: dict, old: dict, tolerance: float) -> list[str]:
+    """Return human-readable regressions beyond `tolerance` (fraction)."""
+    regressions = []
+    a, b = _flatten(old), _flatten(new)
+    for key, old_val in a.items():
+        new_val = b.get(key)
+        if new_val is None or not old_val:
+            continue
+        change = (new_val - old_val) / abs(old_val)
+        worse = -change if key.endswith("_per_s") else change
+        if key.endswith("_bytes") and new_val - old_val < MEM_NOISE_BYTES:
+            continue  # tracemalloc growth is noisy at small sizes
+        if worse > tolerance:
+            regressions.append(f"{key}: {old_val:.3g} -> {new_val:.3g} ({change:+.0%})")
+    return regressions
+
+
+def _print_summary(results: dict) -> None:
+    print("[bench] publish throughput")
+    for r in results["publish"]:
+        print(f"[bench]   qos={r['qos']} print_publish={r['print_publish']!s:5}: "
+              f"{r['msgs_per_s']:9.0f} msg/s  {r['cpu_us_per_msg']:7.1f} us CPU/msg")
+    print("[bench] get_base_temp latency")
+    for r in results["get_base_temp"]:
+        print(f"[bench]   load={r['load_rate_per_s']:6.0f}/s: p50={r['p50_ms']:.2f} ms  "
+              f"p99={r['p99_ms']:.2f} ms  timeouts={r['timeouts']}")
+    if "watch_memory" in results:
+        w = results["watch_memory"]
+        print(f"[bench] watch(): {w['received']} msgs in {w['seconds']:.0f}s, "
+              f"memory growth {w['mem_growth_bytes'] / 1024:.1f} KiB")
+
+
+cli = ArgumentParser(description="Benchmark iot_mqtt publish throughput and request/response latency.")
+cli.add_argument("--broker", default=None, help="External broker host (default: embedded SimLab).")
+cli.add_argument("--port", type=int, default=1883, help="External broker port.")
+cli.add_argument("--count", type=int, default=5000, help="Publishes per throughput run.")
+cli.add_argument("--load-rate", type=float, default=500.0, dest="load_rate",
+                 help="Background command rate (msg/s) for the loaded latency run.")
+cli.add_argument("--watch-seconds", type=float, default=30.0, dest="watch_seconds",
+                 help="Duration of the watch() memory run.")
+cli.add_argument("--watch-rate", type=float, default=200.0, dest="watch_rate",
+                 help="Message rate during the watch() memory run.")
+cli.add_argument("--quick", action="store_true", help="Small counts for smoke runs / CI.")
+cli.add_argument("--out", default=None, help="Write JSON results to this file.")
+cli.add_argument("--compare", default=None, help="Previous JSON results to check for regressions.")
+cli.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression (default 0.25).")
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = cli.parse_args(argv)
+    results = run(args)
+    _print_summary(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"[bench] Results written to {os.path.abspath(args.out)}")
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        regressions = compare(results, old, args.tolerance)
+        for line in regressions:
+            print(f"[bench] REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,449 @@
+# camera_service.py
+# Persistent Raspberry Pi camera session for take_picture().
+#
+# A small capture daemon is uploaded to the Pi once and started over ONE SSH
+# exec channel. It keeps Picamera2 configured and running ("warm") and answers
+# line-based requests on stdin:
+#
+#   CAPTURE [settle_s]   -> "OK <nbytes>\n" + <JPEG bytes>   (or "ERR <msg>\n")
+#   SNAP [settle_s]      -> "ID <n>\n"  (JPEG kept in Pi memory, fetched later)
+#   FETCH <n>            -> "OK <nbytes>\n" + <JPEG bytes>
+#   QUIT                 -> daemon closes the camera and exits
+#
+# JPEG bytes are streamed straight from the channel into the destination
+# file: no remote temp file, no SFTP round trip, no per-shot interpreter start.
+#
+# Requires: paramiko (host), picamera2 (Pi)
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
+from typing import Callable, Optional
+
+import paramiko
+
+# -----------------------------------------------------------------------------
+# Daemon source (runs on the Pi)
+# -----------------------------------------------------------------------------
+DAEMON_SOURCE = r'''
+import io, sys, time
+from picamera2 import Picamera2
+
+width, height, warmup_s = int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3])
+picam2 = Picamera2()
+picam2.configure(picam2.create_still_configuration(main={'size': (width, height)}))
+picam2.set_controls({'AwbEnable': True})
+picam2.start()
+time.sleep(warmup_s)
+
+def snap(parts):
+    if len(parts) > 1:
+        time.sleep(float(parts[1]))  # let AE/AWB adapt to new lighting
+    buf = io.BytesIO()
+    picam2.capture_file(buf, format='jpeg')
+    return buf.getvalue()
+
+held, next_id, MAX_HELD = {}, 1, 16
+out = sys.stdout.buffer
+out.write(b'READY\n')
+out.flush()
+try:
+    for line in sys.stdin:
+        parts = line.split()
+        if not parts:
+            continue
+        if parts[0] == 'QUIT':
+            break
+        try:
+            if parts[0] == 'CAPTURE':
+                data = snap(parts)
+                out.write(b'OK %d\n' % len(data))
+                out.write(data)
+            elif parts[0] == 'SNAP':
+                held[next_id] = snap(parts)
+                out.write(b'ID %d\n' % next_id)
+                next_id += 1
+                while len(held) > MAX_HELD:
+                    held.pop(min(held))
+            elif parts[0] == 'FETCH':
+                data = held.pop(int(parts[1]), None)
+                if data is None:
+                    out.write(b'ERR unknown image id\n')
+                else:
+                    out.write(b'OK %d\n' % len(data))
+                    out.write(data)
+            else:
+                out.write(b'ERR unknown command\n')
+        except Exception as e:
+            out.write(('ERR %s\n' % str(e).replace('\n', ' ')).encode())
+        out.flush()
+finally:
+    picam2.close()
+'''
+
+_DAEMON_HASH = hashlib.sha1(DAEMON_SOURCE.encode()).hexdigest()[:10]
+
+
+# -----------------------------------------------------------------------------
+# Client
+# -----------------------------------------------------------------------------
+class PiCamera:
+    """
+    Host-side client for the capture daemon. One SSH connection and one exec
+    channel are kept open between shots; capture() is thread-safe.
+    """
+
+    def __init__(
+        self,
+        hostname: str,
+        username: str,
+        password: Optional[str] = None,
+        *,
+        size: tuple[int, int] = (2028, 1520),
+        warmup_s: float = 2.0,
+        remote_dir: Optional[str] = None,
+        python: str = "python3",
+        connect_timeout: float = 10.0,
+    ) -> None:
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.size = size
+        self.warmup_s = warmup_s
+        self.remote_dir = remote_dir or f"/home/{username}"
+        self.python = python
+        self.connect_timeout = connect_timeout
+
+        self._ssh: Optional[paramiko.SSHClient] = None
+        self._chan: Optional[paramiko.Channel] = None
+        self._stdin = None
+        self._stdout = None
+        self._stderr_tail: deque[str] = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._chan is not None and not self._chan.closed
+
+    @property
+    def _remote_script(self) -> str:
+        return f"{self.remote_dir}/ot2_capture_daemon_{_DAEMON_HASH}.py"
+
+    # Connection handling
+    def connect(self) -> None:
+        """Open SSH, upload the daemon if needed, start it and wait for READY."""
+        if self.connected:
+            return
+        print(f"[cam] Connecting to {self.hostname}...")
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(self.hostname, username=self.username, password=self.password,
+                    timeout=self.connect_timeout)
+        self._ssh = ssh
+
+        # upload once per daemon version (file name carries the source hash)
+        sftp = ssh.open_sftp()
+        try:
+            try:
+                sftp.stat(self._remote_script)
+            except IOError:
+                sftp.putfo(io.BytesIO(DAEMON_SOURCE.encode()), self._remote_script)
+        finally:
+            sftp.close()
+
+        transport = ssh.get_transport()
+        assert transport is not None
+        chan = transport.open_session()
+        w, h = self.size
+        chan.exec_command(f"{self.python} -u {self._remote_script} {w} {h} {self.warmup_s}")
+        self._chan = chan
+        self._stdin = chan.makefile_stdin("wb")
+        self._stdout = chan.makefile("rb")
+        # stdout carries binary JPEG frames, so stderr cannot be merged into
+        # it; drain it instead, or the daemon blocks once its buffer is full
+        self._stderr_tail.clear()
+        drain = threading.Thread(target=self._drain_stderr, args=(chan,), daemon=True,
+                                 name=f"cam-stderr-{self.hostname}")
+        drain.start()
+
+        line = self._stdout.readline()
+        if line.strip() != b"READY":
+            drain.join(1.0)  # the daemon exited: collect its traceback
+            err = "\n".join(self._stderr_tail)
+            self.close()
+            raise RuntimeError(f"Camera daemon failed to start: {line!r} {err}")
+        print("[cam] Camera daemon ready (camera warm).")
+
+    def _drain_stderr(self, chan: "paramiko.Channel") -> None:
+        # runs until the channel closes; keeps the last lines for error messages
+        pending = b""
+        while True:
+            try:
+                data = chan.recv_stderr(4096)
+            except Exception:
+                break
+            if not data:
+                break
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            for raw in lines:
+                text = raw.decode(errors="ignore").rstrip()
+                self._stderr_tail.append(text)
+                logging.debug("[cam %s] %s", self.hostname, text)
+        if pending:
+            self._stderr_tail.append(pending.decode(errors="ignore").rstrip())
+
+    def close(self) -> None:
+        """Stop the daemon and close the SSH connection."""
+        try:
+            if self._stdin is not None and self.connected:
+                self._stdin.write(b"QUIT\n")
+                self._stdin.flush()
+        except Exception:
+            pass
+        for obj in (self._chan, self._ssh):
+            try:
+                if obj is not None:
+                    obj.close()
+            except Exception:
+                pass
+        self._chan = self._ssh = self._stdin = self._stdout = None
+
+    def __enter__(self) -> "PiCamera":
+        self.connect()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+    # Capture
+    def _request(self, settle_s: float) -> int:
+        header = self._command(f"CAPTURE {settle_s:.3f}")
+        parts = header.split(maxsplit=1)
+        if parts[0] != b"OK":
+            raise RuntimeError(f"Capture failed: {header.decode(errors='ignore').strip()}")
+        return int(parts[1])
+
+    def _command(self, line: str) -> bytes:
+        assert self._stdin is not None and self._stdout is not None
+        self._stdin.write(line.encode() + b"\n")
+        self._stdin.flush()
+        header = self._stdout.readline()
+        if not header:
+            raise ConnectionError("Camera daemon closed the channel")
+        return header
+
+    def _stream_to(self, nbytes: int, dest) -> None:
+        assert self._stdout is not None
+        remaining = nbytes
+        while remaining:
+            chunk = self._stdout.read(min(remaining, 256 * 1024))
+            if not chunk:
+                raise ConnectionError("Camera channel closed mid-image")
+            dest.write(chunk)
+            remaining -= len(chunk)
+
+    def capture_bytes(self, settle_s: float = 1.0) -> bytes:
+        """Capture one JPEG and return its bytes."""
+        buf = io.BytesIO()
+        self._capture(buf, settle_s)
+        return buf.getvalue()
+
+    def capture(self, local_path: str, settle_s: float = 1.0) -> str:
+        """Capture one JPEG and stream it straight into `local_path`."""
+        os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+        tmp = local_path + ".part"
+        with open(tmp, "wb") as f:
+            self._capture(f, settle_s)
+        os.replace(tmp, local_path)
+        return local_path
+
+    def trigger(self, settle_s: float = 1.0) -> int:
+        """
+        Take a picture NOW but leave the JPEG on the Pi; returns an image id for fetch().
+        Only the exposure happens here, so lights/robot can move right after it returns.
+        """
+        with self._lock:
+            self.connect()
+            header = self._command(f"SNAP {settle_s:.3f}")
+        parts = header.split(maxsplit=1)
+        if parts[0] != b"ID":
+            raise RuntimeError(f"Capture failed: {header.decode(errors='ignore').strip()}")
+        return int(parts[1])
+
+    def fetch(self, image_id: int) -> bytes:
+        """Download (and free on the Pi) an image taken with trigger()."""
+        with self._lock:
+            if not self.connected:
+                raise ConnectionError("Camera session was lost; held image is gone")
+            header = self._command(f"FETCH {image_id}")
+            parts = header.split(maxsplit=1)
+            if parts[0] != b"OK":
+                raise RuntimeError(f"Fetch failed: {header.decode(errors='ignore').strip()}")
+            buf = io.BytesIO()
+            self._stream_to(int(parts[1]), buf)
+        return buf.getvalue()
+
+    def _capture(self, dest, settle_s: float) -> None:
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    self.connect()
+                    t0 = time.time()
+                    nbytes = self._request(settle_s)
+                    self._stream_to(nbytes, dest)
+                    logging.debug("Captured %d bytes in %.2fs", nbytes, time.time() - t0)
+                    return
+                except (ConnectionError, OSError, paramiko.SSHException):
+                    # broken session: reconnect once (fresh daemon) and retry
+                    self.close()
+                    if attempt == 1:
+                        raise
+                    dest.seek(0)
+                    dest.truncate()
+
+
+# -----------------------------------------------------------------------------
+# Background transfer / decode / write
+# -----------------------------------------------------------------------------
+class CapturePipeline:
+    """
+    Worker pool for the slow half of a capture: download from the Pi, decode
+    (sanity check + size), write to disk, then call `on_saved(path, info)`.
+
+        handle = cam.trigger()                       # synchronous exposure
+        fut = pipeline.submit(cam, handle, path, info, on_saved)
+        ...                                          # robot keeps moving
+        pipeline.wait()                              # before leaving the well
+    """
+
+    def __init__(self, max_workers: int = 2) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="capture")
+        self._pending: set[Future] = set()
+        self._failed: list[Future] = []  # finished with an error, not yet reported by wait()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        camera: PiCamera,
+        image_id: int,
+        local_path: str,
+        info: Optional[dict] = None,
+        on_saved: Optional[Callable[[str, dict], None]] = None,
+    ) -> Future:
+        fut = self._pool.submit(self._process, camera, image_id, local_path, dict(info or {}), on_saved)
+        with self._lock:
+            self._pending.add(fut)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _done(self, fut: Future) -> None:
+        failed = not fut.cancelled() and fut.exception() is not None
+        with self._lock:
+            self._pending.discard(fut)
+            if failed:
+                self._failed.append(fut)
+        if failed:
+            logging.error("Background capture failed: %s", fut.exception())
+
+    @staticmethod
+    def _process(camera: PiCamera, image_id: int, local_path: str, info: dict,
+                 on_saved: Optional[Callable[[str, dict], None]]) -> str:
+        t0 = time.time()
+        data = camera.fetch(image_id)
+        info["bytes"] = len(data)
+        try:
+            import cv2
+            import numpy as np
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if img is None:
+                raise RuntimeError(f"Corrupt JPEG for {local_path}")
+            info["size_px"] = [img.shape[1] * 8, img.shape[0] * 8]  # approx. from 1/8 decode
+        except ImportError:
+            pass
+        os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+        tmp = local_path + ".part"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, local_path)
+        info["transfer_s"] = round(time.time() - t0, 3)
+        if on_saved is not None:
+            on_saved(local_path, info)
+        return local_path
+
+    def wait(self, timeout: Optional[float] = None) -> list[str]:
+        """
+        Block until every submitted image landed (`timeout`: overall seconds);
+        re-raises the first failure since the last wait(), including captures
+        that failed before this call.
+        """
+        with self._lock:
+            pending = list(self._pending)
+        _, not_done = wait_futures(pending, timeout=timeout)
+        with self._lock:
+            # done callbacks may still be running: count failures from both places
+            failed = self._failed + [f for f in pending if f.done() and not f.cancelled()
+                                     and f.exception() is not None and f not in self._failed]
+            self._failed = []
+        if failed:
+            raise failed[0].exception()
+        if not_done:
+            raise TimeoutError(f"{len(not_done)} capture(s) still running after {timeout:.1f}s")
+        return [f.result() for f in pending if not f.cancelled()]
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+# -----------------------------------------------------------------------------
+# Shared session (one per host/user for the whole process)
+# -----------------------------------------------------------------------------
+_cameras: dict[tuple[str, str], PiCamera] = {}
+_cameras_lock = threading.Lock()
+
+
+def get_camera(hostname: str, username: str, password: Optional[str] = None, **kwargs) -> PiCamera:
+    """Return the process-wide PiCamera for (hostname, username), creating it on first use."""
+    key = (hostname, username)
+    with _cameras_lock:
+        cam = _cameras.get(key)
+        if cam is None:
+            cam = PiCamera(hostname, username, password, **kwargs)
+            _cameras[key] = cam
+    return cam
+
+
+_pipeline: Optional[CapturePipeline] = None
+
+
+def get_capture_pipeline() -> CapturePipeline:
+    """Return the process-wide background capture pipeline."""
+    global _pipeline
+    with _cameras_lock:
+        if _pipeline is None:
+            _pipeline = CapturePipeline()
+    return _pipeline
+
+
+def close_cameras() -> None:
+    """Finish pending background captures, then close every shared camera session (call at end of run)."""
+    global _pipeline
+    with _cameras_lock:
+        pipeline, _pipeline = _pipeline, None
+    if pipeline is not None:
+        try:
+            pipeline.wait()
+        finally:
+            pipeline.shutdown()
+    with _cameras_lock:
+        cams = list(_cameras.values())
+        _cameras.clear()
+    for cam in cams:
+        cam.close()
@@ -0,0 +1,159 @@
+# checkpoint.py
+# Persist run progress so a crash at well 9 costs one well, not the plate.
+#
+# The store is one JSON file (written atomically after every change) holding:
+#   - completed / failed steps ("A1:fill", "A1:deposit", ...)
+#   - the robot run ID (opentronsClient can re-attach to it)
+#   - tracked state such as the source-volume ledger (sources_by_plate) and
+#     the next pipette tip, read from live objects at every save
+#
+#   ckpt = CheckpointStore(os.path.join(strExperimentPath, "checkpoint.json"))
+#   ckpt.set_run(oc)
+#   ckpt.track("sources_by_plate", lambda: sources_by_plate)
+#   ckpt.track("intPipetteTipLoc", lambda: intPipetteTipLoc)
+#   for well in wells:
+#       ckpt.run_step(f"{well['well_name']}:fill", lambda: fill(well))
+#       ...
+#
+# After a crash:
+#   ckpt, oc = resume(path)                          # same run, same labware
+#   sources_by_plate = ckpt.get("sources_by_plate")
+#   intPipetteTipLoc = ckpt.get("intPipetteTipLoc")
+#   ... re-run the same loop: completed steps are skipped.
+
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Iterable, Optional
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class CheckpointStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._trackers: dict[str, Callable[[], Any]] = {}
+        self.data: dict = {"created": _now(), "run": {}, "steps": {}, "state": {}}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+            self.data.setdefault("run", {})
+            self.data.setdefault("steps", {})
+            self.data.setdefault("state", {})
+            logging.info("Loaded checkpoint %s (%d steps done)", path, len(self.completed()))
+
+    # Persistence
+    def save(self) -> None:
+        """Snapshot tracked state and write the file atomically."""
+        with self._lock:
+            for key, getter in self._trackers.items():
+                self.data["state"][key] = copy.deepcopy(getter())
+            self.data["updated"] = _now()
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp = self.path + ".part"
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)
+
+    # Run / state
+    def set_run(self, oc) -> None:
+        """Remember the robot and run ID of an opentronsClient."""
+        with self._lock:
+            self.data["run"] = {"robotIP": oc.robotIP, "runID": oc.runID, "robotType": oc.robotType}
+        self.save()
+
+    @property
+    def run_id(self) -> Optional[str]:
+        return self.data["run"].get("runID")
+
+    def track(self, key: str, getter: Callable[[], Any]) -> None:
+        """Save getter() under state[key] at every checkpoint (must be JSON serialisable)."""
+        self._trackers[key] = getter
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self.data["state"][key] = copy.deepcopy(value)
+        self.save()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return copy.deepcopy(self.data["state"].get(key, default))
+
+    # Steps
+    def is_done(self, step: str) -> bool:
+        return self.data["steps"].get(step, {}).get("status") == "done"
+
+    def completed(self) -> list[str]:
+        return [s for s, v in self.data["steps"].items() if v.get("status") == "done"]
+
+    def mark_done(self, step: str, **info) -> None:
+        with self._lock:
+            self.data["steps"][step] = {"status": "done", "time": _now(), **info}
+        self.save()
+
+    def mark_failed(self, step: str, error: str) -> None:
+        with self._lock:
+            self.data["steps"][step] = {"status": "failed", "time": _now(), "error": error}
+        self.save()
+
+    def first_incomplete(self, steps: Iterable[str]) -> Optional[str]:
+        for step in steps:
+            if not self.is_done(step):
+                return step
+        return None
+
+    def run_step(self, step: str, func: Callable[[], Any]) -> bool:
+        """
+        Run func() unless `step` is already done; checkpoint afterwards.
+        Returns True if it ran, False if skipped. Failures are recorded and re-raised.
+        """
+        if self.is_done(step):
+            logging.info("Checkpoint: skipping completed step %s", step)
+            return False
+        try:
+            func()
+        except Exception as e:
+            self.mark_failed(step, repr(e))
+            raise
+        self.mark_done(step)
+        return True
+
+
+def resume(path: str, strRobotIP: Optional[str] = None, **client_kwargs):
+    """
+    Load the checkpoint at `path` and re-attach an opentronsClient to its run.
+    If the run is gone (robot rebooted), a new run is created and recorded;
+    oc.labware is then empty and labware/pipettes must be loaded again.
+    Returns (store, oc).
+    """
+    from opentrons import opentronsClient
+
+    store = CheckpointStore(path)
+    run = store.data["run"]
+    ip = strRobotIP or run.get("robotIP")
+    if ip is None:
+        raise ValueError(f"No robot IP in {path}; pass strRobotIP")
+    if run.get("robotType"):
+        client_kwargs.setdefault("strRobot", run["robotType"])
+
+    oc = None
+    if run.get("runID"):
+        try:
+            oc = opentronsClient(strRobotIP=ip, strRunID=run["runID"], **client_kwargs)
+        except Exception as e:
+            logging.warning("Could not re-attach to run %s (%s); creating a new run.", run["runID"], e)
+    if oc is None:
+        oc = opentronsClient(strRobotIP=ip, **client_kwargs)
+        store.set_run(oc)
+
+    pending = [s for s, v in store.data["steps"].items() if v.get("status") != "done"]
+    logging.info("Resuming run %s: %d step(s) done%s", oc.runID, len(store.completed()),
+                 f", retrying {', '.join(pending)}" if pending else "")
+    return store, oc
@@ -0,0 +1,108 @@
+# command_codec.py
+# JSON encoding / decoding for the opentronsClient hot path.
+#
+# Every liquid-handling or movement command used to go through json.dumps of
+# the whole {"data": {"commandType", "params", "intent"}} envelope, then was
+# parsed again by the client to record it, and every response was fully
+# decoded (response.text + json.loads) only to read data.status. Here:
+#
+#   - dumps/loads use orjson when it is installed (compact stdlib json otherwise)
+#   - CommandTemplate pre-encodes the static envelope per command type and
+#     intent, so only the params are encoded per call
+#   - parse_command_response reads data.id / data.status from the raw bytes
+#     and falls back to a full parse when the command failed (error details
+#     are needed) or the fields cannot be found
+#   - LazyText defers response.text to the moment a DEBUG record is emitted
+#
+#   strCommand, dicCommand = COMMAND_TEMPLATES["aspirate"].render(dicParams, "setup")
+#   dicResponse = parse_command_response(response.content)
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    # numpy / pandas scalars (volumes read from the experiment CSV)
+    if hasattr(obj, "item"):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_ENCODE = json.JSONEncoder(separators=(",", ":"), check_circular=False, default=_default).encode
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON text."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default).decode()
+    return _ENCODE(obj)
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class CommandTemplate:
+    def __init__(self, strCommandType: str) -> None:
+        self.commandType = strCommandType
+        self._prefix = '{"data":{"commandType":' + _ENCODE(strCommandType) + ',"params":'
+        self._suffix: dict[str, str] = {}
+
+    def encode(self, dicParams: dict, strIntent: str = "setup") -> str:
+        suffix = self._suffix.get(strIntent)
+        if suffix is None:
+            suffix = self._suffix[strIntent] = ',"intent":' + _ENCODE(strIntent) + '}}'
+        return self._prefix + dumps(dicParams) + suffix
+
+    def render(self, dicParams: dict, strIntent: str = "setup") -> tuple[str, dict]:
+        """(request body, command dictionary) for one command."""
+        return (self.encode(dicParams, strIntent),
+                {"data": {"commandType": self.commandType, "params": dicParams, "intent": strIntent}})
+
+
+COMMAND_TEMPLATES = {t: CommandTemplate(t) for t in (
+    "pickUpTip", "aspirate", "aspirateInPlace", "dispense", "blowout", "moveToWell", "dropTip",
+    "dropTipInPlace", "moveToAddressableArea", "moveToAddressableAreaForDropTip", "liquidProbe",
+)}
+
+# data.id and data.status come before data.params in a command response
+_HEAD_END = re.compile(rb'"params"\s*:')
+_STATUS = re.compile(rb'"status"\s*:\s*"([A-Za-z]+)"')
+_ID = re.compile(rb'"id"\s*:\s*"([^"\\]+)"')
+
+
+def parse_command_response(content: Union[bytes, str]) -> dict:
+    """
+    {"data": {"id": ..., "status": ...}} from a command response without
+    decoding the rest of it; the full response if the command failed.
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    match = _HEAD_END.search(content)
+    head = content[:match.start()] if match else content
+    status, command_id = _STATUS.search(head), _ID.search(head)
+    if not head.lstrip().startswith(b'{"data"') or status is None or command_id is None \
+            or status.group(1) == b"failed":
+        return loads(content)
+    return {"data": {"id": command_id.group(1).decode(), "status": status.group(1).decode()}}
+
+
+class LazyText:
+    """response.text, evaluated only if the log record is actually emitted."""
+    __slots__ = ("response",)
+
+    def __init__(self, response) -> None:
+        self.response = response
+
+    def __str__(self) -> str:
+        return self.response.text
@@ -0,0 +1,280 @@
+# command_recorder.py
+# Record the commands an opentronsClient sends and replay them on the robot.
+#
+# Every command that the robot accepts (HTTP 201) and that did not fail is
+# appended to oc.recorder as {commandType, params, intent}; run-specific labware/pipette IDs are
+# rewritten to the client's own names (e.g. "nis_15_wellplate_3895ul_9",
+# "p1000_single_gen2"), so a recording does not depend on the run it came
+# from. Once a well recipe works from the notebook:
+#
+#   oc.recorder.mark("recipe")                      # start of the validated part
+#   fillWell(..., strWell2Test="B2", ...)
+#   oc.recorder.mark("recipe_end")
+#
+#   tpl = oc.recorder.export_template("recipe.template.json", start="recipe", end="recipe_end",
+#                                     parameters={"well": ("wellName", "B2", strID_NISreactor),
+#                                                 "volume": ("volume", 1000)})
+#   render_protocol(tpl, "plate.json", [{"well": w, "volume": v} for w, v in plan])
+#   protocolID = oc.uploadProtocol("plate.json")    # once
+#   strRunID, strStatus = oc.runProtocol(protocolID)  # runs on the robot, no per-step round trips
+#   # the protocol run replaces oc's run: use a new opentronsClient for further commands
+#
+# The exported file is an Opentrons JSON protocol (schema 8): load commands
+# for every labware/pipette the recipe touches, the custom labware
+# definitions, and the recipe body repeated once per parameter set.
+
+from __future__ import annotations
+
+import copy
+import json
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Iterable, Mapping, Optional, Union
+
+_LOAD_TYPES = ("loadLabware", "loadPipette", "loadModule")
+_PLACEHOLDER = "${%s}"
+
+ROBOTS = {
+    "ot2": {"model": "OT-2 Standard", "deckId": "ot2_standard"},
+    "flex": {"model": "OT-3 Standard", "deckId": "ot3_standard"},
+}
+
+
+def _replace_ids(obj: Any, mapping: Mapping[str, str]) -> Any:
+    if isinstance(obj, dict):
+        return {k: _replace_ids(v, mapping) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_replace_ids(v, mapping) for v in obj]
+    if isinstance(obj, str):
+        return mapping.get(obj, obj)
+    return obj
+
+
+def _fill(obj: Any, values: Mapping[str, Any]) -> Any:
+    """Replace "${name}" strings with values[name] (keeping the value's type)."""
+    if isinstance(obj, dict):
+        return {k: _fill(v, values) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_fill(v, values) for v in obj]
+    if isinstance(obj, str) and obj.startswith("${") and obj.endswith("}"):
+        name = obj[2:-1]
+        if name not in values:
+            raise KeyError(f"No value for template parameter '{name}'")
+        return values[name]
+    return obj
+
+
+def _same(recorded: Any, value: Any) -> bool:
+    # the client sends some numbers as strings ("volume": "1000")
+    if recorded == value:
+        return True
+    try:
+        return float(recorded) == float(value)
+    except (TypeError, ValueError):
+        return False
+
+
+class CommandRecorder:
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.commands: list[dict] = []
+        self.marks: dict[str, int] = {}
+        self.definitions: dict[str, dict] = {}  # URI -> custom labware definition
+        self._ids: dict[str, str] = {}         # run ID -> client name
+        self._queued: dict[str, dict] = {}     # command ID -> entry, batched commands not finished yet
+        self._lock = threading.Lock()
+
+    # Recording (called by opentronsClient)
+    def record(self, dicCommand: dict, dicResult: Optional[dict] = None,
+               strCommandID: Optional[str] = None) -> None:
+        """strCommandID: set for queued commands whose outcome is reported later (settle())."""
+        if not self.enabled:
+            return
+        data = dicCommand.get("data", dicCommand)
+        entry = {"commandType": data["commandType"], "params": copy.deepcopy(data.get("params", {})),
+                 "intent": data.get("intent", "protocol")}
+        with self._lock:
+            if dicResult:
+                entry["result"] = {k: v for k, v in dicResult.items() if k.endswith("Id")}
+            self.commands.append(entry)
+            if strCommandID is not None:
+                self._queued[strCommandID] = entry
+
+    def settle(self, lstCommandIDs: Iterable[str], failed: Iterable[str] = ()) -> None:
+        """Queued commands have finished; drop the ones that failed from the recording."""
+        failed = set(failed)
+        with self._lock:
+            for strID in lstCommandIDs:
+                entry = self._queued.pop(strID, None)
+                if entry is None or strID not in failed:
+                    continue
+                pos = next((i for i, c in enumerate(self.commands) if c is entry), None)
+                if pos is None:
+                    continue
+                del self.commands[pos]
+                for label, mark in self.marks.items():
+                    if mark > pos:
+                        self.marks[label] = mark - 1
+
+    def name_id(self, strID: str, strName: str) -> None:
+        """Map a run-specific labware/pipette ID to the client's name for it."""
+        with self._lock:
+            self._ids[strID] = strName
+
+    def add_definition(self, dicLabware: dict) -> None:
+        uri = f"{dicLabware['namespace']}/{dicLabware['parameters']['loadName']}/{dicLabware['version']}"
+        with self._lock:
+            self.definitions[uri] = dicLabware
+
+    def mark(self, label: str) -> int:
+        """Name the current position (the next recorded command)."""
+        with self._lock:
+            self.marks[label] = len(self.commands)
+            return self.marks[label]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.commands.clear()
+            self.marks.clear()
+            self._queued.clear()
+
+    # Export
+    def _index(self, pos: Union[str, int, None], default: int) -> int:
+        if pos is None:
+            return default
+        return self.marks[pos] if isinstance(pos, str) else pos
+
+    def commands_between(self, start: Union[str, int, None] = None,
+                         end: Union[str, int, None] = None) -> list[dict]:
+        """Recorded commands in [start, end) with client names instead of run IDs."""
+        with self._lock:
+            lo, hi = self._index(start, 0), self._index(end, len(self.commands))
+            return [_replace_ids({k: v for k, v in c.items() if k != "result"}, self._ids)
+                    for c in self.commands[lo:hi]]
+
+    def _loads_for(self, body: list[dict]) -> list[dict]:
+        """Load commands (from the whole recording) for everything `body` references, in load order."""
+        keys = {"loadLabware": "labwareId", "loadPipette": "pipetteId", "loadModule": "moduleId"}
+        loads: dict[str, dict] = {}
+        with self._lock:
+            recorded, ids = list(self.commands), dict(self._ids)
+        for c in recorded:
+            key = keys.get(c["commandType"])
+            name = ids.get(c.get("result", {}).get(key)) if key else None
+            if name is not None and name not in loads:
+                load = _replace_ids({k: v for k, v in c.items() if k != "result"}, ids)
+                load["params"][key] = name
+                loads[name] = load
+
+        def refs(obj, out):
+            if isinstance(obj, dict):
+                for k, v in obj.items():
+                    if k in ("labwareId", "pipetteId", "moduleId") and isinstance(v, str):
+                        out.add(v)
+                    refs(v, out)
+            elif isinstance(obj, list):
+                for v in obj:
+                    refs(v, out)
+            return out
+
+        needed, todo = set(), refs(body, set())
+        while todo:  # labware stacked on other labware / modules needs its parent too
+            name = todo.pop()
+            if name in needed:
+                continue
+            if name not in loads:
+                raise ValueError(f"No load command recorded for {name}")
+            needed.add(name)
+            todo |= refs(loads[name]["params"].get("location", {}), set())
+        return [load for name, load in loads.items() if name in needed]
+
+    def export_commands(self, start: Union[str, int, None] = None, end: Union[str, int, None] = None,
+                        include_loads: bool = True) -> list[dict]:
+        """Pre-built command list (loads first, then the recorded body)."""
+        body = [c for c in self.commands_between(start, end) if c["commandType"] not in _LOAD_TYPES]
+        return (self._loads_for(body) if include_loads else []) + body
+
+    def export_template(self, path: Optional[str], start: Union[str, int, None] = None,
+                        end: Union[str, int, None] = None,
+                        parameters: Optional[Mapping[str, tuple]] = None,
+                        robot: str = "ot2", name: str = "recorded protocol") -> dict:
+        """
+        Template for render_protocol(). parameters maps a name to
+        (params field, recorded value[, labware name]); every matching
+        occurrence in the body becomes "${name}", e.g.
+        {"well": ("wellName", "B2", strID_NISreactor), "volume": ("volume", 1000)}.
+        """
+        parameters = dict(parameters or {})
+        body = [c for c in self.commands_between(start, end) if c["commandType"] not in _LOAD_TYPES]
+        loads = self._loads_for(body)
+        for c in body:
+            for pname, spec in parameters.items():
+                field, value = spec[0], spec[1]
+                labware = spec[2] if len(spec) > 2 else None
+                if field in c["params"] and _same(c["params"][field], value) and (labware is None or c["params"].get("labwareId") == labware):
+                    c["params"][field] = _PLACEHOLDER % pname
+
+        uris = set()
+        for c in loads:
+            if c["commandType"] == "loadLabware":
+                p = c["params"]
+                uris.add(f"{p.get('namespace', 'opentrons')}/{p['loadName']}/{p.get('version', 1)}")
+        template = {
+            "name": name,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "robot": robot,
+            "parameters": {p: {"field": s[0], "default": s[1]} for p, s in parameters.items()},
+            "labwareDefinitions": {u: d for u, d in self.definitions.items() if u in uris},
+            "loads": loads,
+            "body": body,
+        }
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(template, f, ensure_ascii=False, indent=2)
+        return template
+
+
+def load_template(path: str) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def render_commands(template: Union[dict, str], runs: Iterable[Mapping[str, Any]] = ({},)) -> list[dict]:
+    """Concrete command list: loads once, then the body once per parameter set in `runs`."""
+    if isinstance(template, str):
+        template = load_template(template)
+    defaults = {p: spec["default"] for p, spec in template.get("parameters", {}).items()}
+    commands = copy.deepcopy(template["loads"])
+    for values in runs:
+        commands.extend(_fill(copy.deepcopy(template["body"]), {**defaults, **values}))
+    return commands
+
+
+def render_protocol(template: Union[dict, str], path: Optional[str] = None,
+                    runs: Iterable[Mapping[str, Any]] = ({},), metadata: Optional[dict] = None) -> dict:
+    """Self-contained Opentrons JSON protocol (schema 8) from a template; written to `path` if given."""
+    if isinstance(template, str):
+        template = load_template(template)
+    commands = [{"key": str(uuid.uuid4()), "commandType": c["commandType"], "params": c["params"]}
+                for c in render_commands(template, runs)]
+    protocol = {
+        "$otSharedSchema": "#/protocol/schemas/8",
+        "schemaVersion": 8,
+        "metadata": {"protocolName": template.get("name", "recorded protocol"),
+                     "created": int(datetime.now().timestamp() * 1000), **(metadata or {})},
+        "designerApplication": {"name": "command_recorder", "version": "1.0.0", "data": {}},
+        "robot": ROBOTS[template.get("robot", "ot2")],
+        "liquidSchemaId": "opentronsLiquidSchemaV1",
+        "liquids": {},
+        "labwareDefinitionSchemaId": "opentronsLabwareSchemaV2",
+        "labwareDefinitions": template.get("labwareDefinitions", {}),
+        "commandSchemaId": "opentronsCommandSchemaV8",
+        "commands": commands,
+        "commandAnnotationSchemaId": "opentronsCommandAnnotationSchemaV1",
+        "commandAnnotations": [],
+    }
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump(protocol, f, ensure_ascii=False)
+    return protocol
@@ -0,0 +1,221 @@
+# fleet_manager.py
+# Drive several OT-2 / Flex robots from one controller.
+#
+# Each robot gets one opentronsClient (with its own connection pool) and one
+# worker thread, so commands for a robot stay strictly in order while the
+# robots themselves run concurrently. Work is routed by capability:
+#
+#   fleet = FleetManager()
+#   fleet.add_robot("cell1", "169.254.179.32", strRobot="ot2")
+#   fleet.add_robot("cell2", "169.254.44.249", strRobot="ot2")
+#   fleet.add_robot("flex1", "169.254.99.10", strRobot="flex")
+#   fleet.run_on_all(lambda oc: oc.homeRobot())
+#   fleet.run_on_all(setup_deck)                          # setup_deck(oc) loads labware
+#
+#   futures = [fleet.submit(lambda oc, w=w: run_well(oc, w), requires_labware=["nis_15_wellplate_3895ul"],
+#                           est_s=600, name=w)
+#              for w in wells]
+#   fleet.wait()
+#   print(fleet.summary())
+#
+# A job goes to the capable robot with the least queued work (by est_s);
+# "capable" means the right robot type and every required labware load name
+# loaded on (or declared for) that robot; loaded labware counts once the job
+# that loaded it has finished.
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Optional
+
+
+class NoCapableRobotError(Exception):
+    """No robot in the fleet satisfies a job's requirements."""
+
+
+class _Robot:
+    def __init__(self, name: str, strRobotIP: str, strRobot: str, labware: Iterable[str],
+                 client_kwargs: dict) -> None:
+        self.name = name
+        self.ip = strRobotIP
+        self.robot_type = strRobot
+        self.declared_labware = set(labware)
+        self.client_kwargs = client_kwargs
+        self.oc = None
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"fleet-{name}")
+        self.queued_s = 0.0       # estimated seconds of work submitted and not finished
+        self.pending = 0
+        self.done = 0
+        self.failed = 0
+        self.busy_s = 0.0
+        self.connect_lock = threading.Lock()
+        # load names on the robot as of the last finished job; oc.labware itself
+        # is only read on the thread driving the client
+        self.loaded_labware: frozenset[str] = frozenset()
+
+    def note_labware(self) -> None:
+        """Snapshot the client's load names (call from the thread that drives oc)."""
+        if self.oc is not None:
+            self.loaded_labware = frozenset(d.get("loadName") for d in list(self.oc.labware.values())
+                                            if d.get("loadName"))
+
+    def labware(self) -> set[str]:
+        return self.declared_labware | self.loaded_labware
+
+
+class FleetManager:
+    def __init__(self, client_factory: Optional[Callable[..., Any]] = None) -> None:
+        """client_factory(strRobotIP=..., strRobot=..., **kw) defaults to opentronsClient."""
+        if client_factory is None:
+            from opentrons import opentronsClient
+            client_factory = opentronsClient
+        self._factory = client_factory
+        self._robots: dict[str, _Robot] = {}
+        self._lock = threading.Lock()
+        self._records: list[dict] = []
+        self._t0: Optional[float] = None
+
+    # Robots
+    def add_robot(self, name: str, strRobotIP: str, strRobot: str = "ot2",
+                  labware: Iterable[str] = (), connect: bool = True, **client_kwargs) -> None:
+        """Register a robot; `labware` declares load names that count as installed before setup."""
+        if name in self._robots:
+            raise ValueError(f"Robot '{name}' already in the fleet")
+        robot = _Robot(name, strRobotIP, strRobot, labware, client_kwargs)
+        self._robots[name] = robot
+        if connect:
+            self.client(name)
+
+    def client(self, name: str):
+        """The robot's opentronsClient (created on first use: one run per robot)."""
+        robot = self._robots[name]
+        with robot.connect_lock:
+            if robot.oc is None:
+                robot.oc = self._factory(strRobotIP=robot.ip, strRobot=robot.robot_type, **robot.client_kwargs)
+                logging.info("Fleet: %s (%s @ %s) connected, run %s", name, robot.robot_type, robot.ip,
+                             getattr(robot.oc, "runID", None))
+                robot.note_labware()  # labware of an attached run
+        return robot.oc
+
+    def robots(self) -> list[str]:
+        return list(self._robots)
+
+    def capable(self, robot_type: Optional[str] = None, requires_labware: Iterable[str] = ()) -> list[str]:
+        need = set(requires_labware)
+        return [name for name, r in self._robots.items()
+                if (robot_type is None or r.robot_type == robot_type) and need <= r.labware()]
+
+    # Jobs
+    def submit(self, func: Callable[[Any], Any], robot_type: Optional[str] = None,
+               requires_labware: Iterable[str] = (), robot: Optional[str] = None,
+               est_s: float = 60.0, name: Optional[str] = None) -> Future:
+        """
+        Queue func(oc) on one robot: `robot` if given, else the capable robot
+        with the least queued work. The returned Future has .robot set.
+        """
+        if robot is None:
+            names = self.capable(robot_type, requires_labware)
+            if not names:
+                raise NoCapableRobotError(
+                    f"No robot with type={robot_type or 'any'} and labware {sorted(requires_labware)}")
+            with self._lock:
+                robot = min(names, key=lambda n: (self._robots[n].queued_s, self._robots[n].pending))
+        r = self._robots[robot]
+        job_name = name or getattr(func, "__name__", "job")
+        with self._lock:
+            r.queued_s += est_s
+            r.pending += 1
+            if self._t0 is None:
+                self._t0 = time.monotonic()
+        future = r.worker.submit(self._run, r, func, job_name, est_s)
+        future.robot = robot
+        return future
+
+    def _run(self, r: _Robot, func: Callable[[Any], Any], job_name: str, est_s: float) -> Any:
+        start = time.monotonic()
+        error = None
+        try:
+            # connecting is part of the job: a robot that cannot be reached
+            # still has its queue accounting released below
+            oc = self.client(r.name)
+            return func(oc)
+        except BaseException as e:
+            error = traceback.format_exc()
+            logging.error("Fleet: %s on %s failed: %s", job_name, r.name, e)
+            raise
+        finally:
+            end = time.monotonic()
+            r.note_labware()  # still on the robot's worker: no job is changing oc.labware
+            with self._lock:
+                r.queued_s = max(0.0, r.queued_s - est_s)
+                r.pending -= 1
+                r.busy_s += end - start
+                if error is None:
+                    r.done += 1
+                else:
+                    r.failed += 1
+                self._records.append({"job": job_name, "robot": r.name, "start": start - self._t0,
+                                      "end": end - self._t0, "error": error})
+
+    def run_on_all(self, func: Callable[[Any], Any], robots: Optional[Iterable[str]] = None,
+                   timeout: Optional[float] = None) -> dict[str, Any]:
+        """Run func(oc) on every robot concurrently (e.g. homing, deck setup); returns {robot: result}."""
+        futures = {name: self.submit(func, robot=name, name=getattr(func, "__name__", "all"))
+                   for name in (robots or self._robots)}
+        return {name: f.result(timeout) for name, f in futures.items()}
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued job has finished; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if all(r.pending == 0 for r in self._robots.values()):
+                    return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+
+    def shutdown(self, wait: bool = True) -> None:
+        for r in self._robots.values():
+            r.worker.shutdown(wait=wait)
+
+    # Metrics
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            elapsed = 0.0 if self._t0 is None else now - self._t0
+            per_robot = {}
+            for name, r in self._robots.items():
+                per_robot[name] = {
+                    "type": r.robot_type,
+                    "done": r.done,
+                    "failed": r.failed,
+                    "pending": r.pending,
+                    "busy_s": round(r.busy_s, 3),
+                    "utilization": round(r.busy_s / elapsed, 3) if elapsed > 0 else 0.0,
+                }
+            done = sum(r.done for r in self._robots.values())
+            return {
+                "elapsed_s": round(elapsed, 3),
+                "jobs_done": done,
+                "jobs_failed": sum(r.failed for r in self._robots.values()),
+                "throughput_per_h": round(done / elapsed * 3600, 2) if elapsed > 0 else 0.0,
+                "robots": per_robot,
+            }
+
+    def records(self) -> list[dict]:
+        with self._lock:
+            return list(self._records)
+
+    def summary(self) -> str:
+        s = self.stats()
+        lines = [f"Fleet: {s['jobs_done']} job(s) done, {s['jobs_failed']} failed in {s['elapsed_s']:.1f} s "
+                 f"({s['throughput_per_h']:.1f} jobs/h)"]
+        for name, r in s["robots"].items():
+            lines.append(f"  {name:<12} {r['type']:<5} done {r['done']:>3}  failed {r['failed']:>2}  "
+                         f"pending {r['pending']:>2}  busy {r['busy_s']:8.1f} s  util {r['utilization']:.0%}")
+        return "\n".join(lines)
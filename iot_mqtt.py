@@ -11,6 +11,7 @@
 from __future__ import annotations
 
 import atexit
+import json
 import os
 import shutil
 import signal
@@ -20,7 +21,7 @@ import threading
 import time
 import random
 from datetime import datetime
-from typing import Callable, Final, Iterable, Optional
+from typing import Callable, Final, Iterable, Optional, Sequence, Union
 
 from paho.mqtt import client as mqtt
 
@@ -316,15 +317,23 @@ def start_broker_if_needed(
     mosq_exe: str = r"C:\Program Files\mosquitto\mosquitto.exe",
     mosq_conf: str = r"C:\Program Files\mosquitto\mosquitto.conf",
     port: int = 1883,
-) -> Optional[subprocess.Popen]:
+    embedded: bool = False,
+):
     """
     Start Mosquitto broker if not already running, and log with timestamps.
     Returns a subprocess handle or None if already listening.
+
+    embedded=True starts the pure-Python mqtt_sim.LocalBroker in-process instead
+    (no mosquitto install needed; for tests/benchmarks) and returns it.
     """
     if _is_port_open("127.0.0.1", port):
         print(f"[broker] Already listening on port {port}")
         return None
 
+    if embedded:
+        from mqtt_sim import LocalBroker
+        return LocalBroker(port=port).start()
+
     if not (os.path.exists(mosq_exe) or shutil.which(mosq_exe)):
         raise FileNotFoundError(f"mosquitto.exe not found: {mosq_exe}")
 
@@ -373,8 +382,11 @@ def start_broker_if_needed(
     return proc
 
 
-def stop_broker(proc: Optional[subprocess.Popen]) -> None:
-    """Gracefully stop Mosquitto broker if we started it."""
+def stop_broker(proc) -> None:
+    """Gracefully stop Mosquitto broker (or embedded LocalBroker) if we started it."""
+    if proc is not None and not isinstance(proc, subprocess.Popen):
+        proc.stop()
+        return
     if proc and proc.poll() is None:
         print("[broker] Stopping Mosquitto...")
         proc.terminate()
@@ -403,6 +415,104 @@ def stop_broker(proc: Optional[subprocess.Popen]) -> None:
             pass
 
 
+# -----------------------------------------------------------------------------
+# Safety shutdown (parallel OFF + retained state confirmation)
+# -----------------------------------------------------------------------------
+def safe_shutdown(
+    *devices: Optional["_BaseDevice"],
+    timeout_s: float = 3.0,
+    qos: int = 1,
+) -> list[str]:
+    """
+    Turn every output OFF on all given devices at once and verify it.
+
+    Every device subscribes to its retained state topics first, then all OFF
+    commands are published back-to-back with QoS 1 (no per-channel sleeps).
+    We then wait, with ONE overall deadline, until each state topic reports
+    the expected safe value (case-insensitive, e.g. "OFF" / "Closed").
+    Topics a device lists in _shutdown_fresh only confirm with a message
+    published after the commands (the retained value delivered on subscribe
+    is the state from before), and the deadline is extended to the longest
+    _shutdown_wait_s of the devices (pulsed actuators report when done).
+
+    Devices whose loop is not running still get their OFF commands, but their
+    outputs are reported as unconfirmed.
+
+    Returns:
+        List of full state topics that did not confirm before the deadline
+        (empty list == everything verified OFF).
+    """
+    active = [d for d in devices if d is not None]
+    lock = threading.Lock()
+    done = threading.Event()
+    pending: dict[str, Optional[set[str]]] = {}
+    registered: list[tuple[mqtt.Client, str]] = []
+
+    def _make_cb(topic: str, fresh_only: bool) -> Callable[..., None]:
+        def _cb(_c, _u, msg: mqtt.MQTTMessage) -> None:
+            if fresh_only and msg.retain:
+                return
+            val = msg.payload.decode("utf-8", errors="ignore").strip().lower()
+            with lock:
+                if topic not in pending:
+                    return
+                accepted = pending[topic]
+                if accepted is None or val in accepted:
+                    del pending[topic]
+                    if not pending:
+                        done.set()
+        return _cb
+
+    # 1) subscribe to every expected state topic BEFORE sending anything
+    plans: list[tuple["_BaseDevice", list[tuple[str, str]]]] = []
+    for dev in active:
+        commands, expected = dev._shutdown_plan()
+        plans.append((dev, commands))
+        for suffix, accepted in expected.items():
+            topic = f"{dev.base}/{suffix}".replace("//", "/")
+            with lock:
+                pending[topic] = None if accepted is None else {a.lower() for a in accepted}
+            c = dev._client
+            if c is None or not getattr(dev, "_loop_running", False):
+                continue
+            c.message_callback_add(topic, _make_cb(topic, suffix in dev._shutdown_fresh))
+            c.subscribe(topic, qos=qos)
+            registered.append((c, topic))
+
+    # 2) fire every OFF command without waiting in between
+    for dev, commands in plans:
+        for suffix, payload in commands:
+            try:
+                dev._publish(suffix, payload, qos=qos, retain=False)
+            except Exception as e:
+                print(f"[shutdown] {dev.base}/{suffix} '{payload}' failed: {e}")
+
+    # 3) one overall deadline for all confirmations
+    timeout_s = max([timeout_s] + [dev._shutdown_wait_s for dev in active])
+    try:
+        with lock:
+            if not pending:
+                done.set()
+        done.wait(timeout_s)
+    finally:
+        for c, topic in registered:
+            try:
+                c.message_callback_remove(topic)
+                c.unsubscribe(topic)
+            except Exception:
+                pass
+
+    with lock:
+        unconfirmed = sorted(pending)
+    if unconfirmed:
+        print(f"[shutdown] {len(unconfirmed)} output(s) NOT confirmed within {timeout_s:.1f}s:")
+        for t in unconfirmed:
+            print(f"[shutdown]   {t}")
+    else:
+        print("[shutdown] All outputs confirmed OFF.")
+    return unconfirmed
+
+
 def _best_effort_all_off(
     pumps: Optional["PumpMQTT"] = None,
     ultra: Optional["UltraMQTT"] = None,
@@ -410,60 +520,21 @@ def _best_effort_all_off(
     ph:    Optional["PhMQTT"]    = None,
     bio:   Optional["BioMQTT"]   = None,
     reactor: Optional["ReactorMQTT"] = None,
-) -> None:
+    timeout_s: float = 3.0,
+) -> list[str]:
     """
     Try to turn every output OFF on clean shutdown (best-effort).
     For pH: tell it STOP (no polling) so probe can idle/sleep.
     For pumps/ultra/heaters: turn off relays / set PWM 0.
+
+    Thin wrapper around safe_shutdown() that never raises; returns the list of
+    state topics that did not confirm (or [] if the shutdown itself failed).
     """
     try:
-        if pumps:
-            for ch in range(1, PUMP_COUNT + 1):
-                try:
-                    pumps.off(ch)
-                    time.sleep(0.02)
-                except Exception:
-                    pass
-        if ultra:
-            for ch in range(1, ULTRA_COUNT + 1):
-                try:
-                    ultra.off(ch)
-                    time.sleep(0.02)
-                except Exception:
-                    pass
-        if heat:
-            for ch in range(1, HEAT_COUNT + 1):
-                try:
-                    heat.set_pwm(ch, 0)
-                    time.sleep(0.02)
-                except Exception:
-                    pass
-                try:
-                    heat.off(ch)
-                    time.sleep(0.02)
-                except Exception:
-                    pass
-        if ph:
-            try:
-                ph.stop_poll()  # ask ESP32 to stop periodic "R"
-                time.sleep(0.05)
-            except Exception:
-                pass
-        if bio:
-            for ch in range(1, BIO_COUNT + 1):  
-                try:
-                    bio.off(ch)
-                    time.sleep(0.02)
-                except Exception:
-                    pass
-        if reactor:
-            try:
-                reactor.reset()  # reset to safe state (Reactor OPEN, Furnace CLOSED)
-                time.sleep(0.05)
-            except Exception:
-                pass
-    except Exception:
-        pass
+        return safe_shutdown(pumps, ultra, heat, ph, bio, reactor, timeout_s=timeout_s)
+    except Exception as e:
+        print(f"[shutdown] Best-effort shutdown failed: {e}")
+        return []
 
 
 # -----------------------------------------------------------------------------
@@ -480,6 +551,11 @@ class _BaseDevice:
       - Temporary subscription for reading retained states
     """
 
+    # safe_shutdown(): state topics that only confirm with a fresh (non-retained)
+    # message, and the shortest time to wait for them
+    _shutdown_fresh: tuple[str, ...] = ()
+    _shutdown_wait_s: float = 0.0
+
     def __init__(
         self,
         *,
@@ -598,13 +674,92 @@ class _BaseDevice:
             raise RuntimeError("Not connected. Call start() first.")
         return self._client
 
-    def _publish(self, topic_suffix: str, payload: str, *, qos: int = 0, retain: bool = False) -> None:
+    def _publish(self, topic_suffix: str, payload: str, *, qos: int = 0, retain: bool = False) -> mqtt.MQTTMessageInfo:
         """Send a payload to a topic under the device's base topic."""
         c = self._require()
         full = f"{self.base}/{topic_suffix}".replace("//", "/")
-        c.publish(full, payload, qos=qos, retain=retain)
+        info = c.publish(full, payload, qos=qos, retain=retain)
         if self.print_publish:
             print(f"[{self.client_id}] Published '{payload}' to {full}")
+        return info
+
+    def _shutdown_plan(self) -> tuple[list[tuple[str, str]], dict[str, Optional[Iterable[str]]]]:
+        """
+        Describe how to make this node safe, for safe_shutdown().
+
+        Returns (commands, expected):
+          - commands: [(topic_suffix, payload), ...] published in order
+          - expected: {state_topic_suffix: accepted payloads (None == any)}
+
+        Suffixes in _shutdown_fresh ignore the retained value delivered on
+        subscribe, so they only confirm once the node reports after the commands.
+        """
+        return [], {}
+
+    # Condition waits
+    def wait_for(
+        self,
+        topic_suffix: str,
+        predicate: Callable[[str], bool],
+        timeout_s: float,
+        *,
+        fresh_only: bool = False,
+        trigger: Optional[Callable[[], None]] = None,
+    ) -> str:
+        """
+        Block until a message on base/<topic_suffix> satisfies `predicate`.
+
+        - Subscribes BEFORE calling `trigger` (e.g. a publish), so fast replies are not missed.
+        - fresh_only=True ignores retained messages delivered on subscribe, so only
+          state changes that happen after the call count.
+        - Returns the matching payload (stripped); raises TimeoutError otherwise.
+        """
+        c = self._require()
+        if not getattr(self, "_loop_running", False):
+            raise RuntimeError("wait_for() requires the background loop. Call start() first.")
+
+        topic = f"{self.base}/{topic_suffix}".replace("//", "/")
+        hit = threading.Event()
+        result: dict[str, Optional[str]] = {"val": None, "last": None}
+
+        def _cb(_c, _u, msg: mqtt.MQTTMessage) -> None:
+            if fresh_only and msg.retain:
+                return
+            val = msg.payload.decode("utf-8", errors="ignore").strip()
+            result["last"] = val
+            try:
+                ok = predicate(val)
+            except Exception:
+                ok = False
+            if ok and not hit.is_set():
+                result["val"] = val
+                hit.set()
+
+        c.message_callback_add(topic, _cb)
+        try:
+            c.subscribe(topic, qos=1)
+            if trigger is not None:
+                trigger()
+            hit.wait(timeout_s)
+        finally:
+            c.message_callback_remove(topic)
+            c.unsubscribe(topic)
+
+        if result["val"] is None:
+            raise TimeoutError(
+                f"Condition not met on {topic} within {timeout_s:.1f}s (last value: {result['last']!r})"
+            )
+        return result["val"]
+
+    def _pulse(self, channel: int, duration_ms: int, margin_s: float = 2.0) -> None:
+        """Send ON:<ms> to cmd/<n> and block until the node reports state/<n> OFF again."""
+        self.wait_for(
+            f"state/{channel}",
+            lambda v: v.upper() == "OFF",
+            timeout_s=duration_ms / 1000.0 + margin_s,
+            fresh_only=True,
+            trigger=lambda: self._publish(f"cmd/{channel}", f"ON:{duration_ms}", qos=1, retain=False),
+        )
 
     # Monitoring utilities
     def status(self, topics: Optional[Iterable[str]] = None, seconds: float = 3.0) -> None:
@@ -690,7 +845,140 @@ def _check_range(value: int, low: int, high: int, label: str = "channel") -> Non
         raise ValueError(f"{label.capitalize()} must be {low}-{high}")
 
 
-class PumpMQTT(_BaseDevice):
+ScheduleStep = Union[tuple[int, str, int], tuple[str, int]]
+
+
+def _encode_schedule(steps: Sequence[ScheduleStep], max_channel: int) -> tuple[list[dict], int]:
+    """
+    Convert schedule steps into the JSON step list understood by relay nodes.
+
+    Accepted step forms:
+      (ch, "on", ms)  run channel `ch` for `ms` (the node moves on when it turns OFF)
+      (ch, "off")     turn channel `ch` OFF immediately
+      ("wait", ms)    idle for `ms`
+
+    Returns (steps_json, duration_ms of one pass).
+    """
+    out: list[dict] = []
+    total_ms = 0
+    for step in steps:
+        if len(step) == 2 and step[0] == "wait":
+            ms = int(step[1])
+            if ms < 0:
+                raise ValueError("wait duration must be >= 0")
+            out.append({"wait_ms": ms})
+            total_ms += ms
+        elif len(step) == 3 and str(step[1]).lower() == "on":
+            ch, ms = int(step[0]), int(step[2])
+            _check_range(ch, 1, max_channel, "channel")
+            if ms <= 0:
+                raise ValueError("on duration must be > 0")
+            out.append({"ch": ch, "on_ms": ms})
+            total_ms += ms
+        elif len(step) == 2 and str(step[1]).lower() == "off":
+            ch = int(step[0])
+            _check_range(ch, 1, max_channel, "channel")
+            out.append({"ch": ch, "off": True})
+        else:
+            raise ValueError(f"Invalid schedule step: {step!r}")
+    if not out:
+        raise ValueError("Schedule must contain at least one step")
+    return out, total_ms
+
+
+class _ScheduleMixin:
+    """
+    Device-side timed sequences for relay nodes (pumps / ultrasound).
+
+    We publish (QoS 1, not retained):
+      <base>/schedule       {"id": "...", "repeat": n, "steps": [...]}
+    Node publishes when the whole sequence has finished (or was aborted):
+      <base>/schedule/done  {"id": "...", "status": "DONE" | "ABORTED"}
+    """
+
+    _sched_lock: threading.Lock
+    _sched_waiters: dict[str, tuple[threading.Event, dict]]
+
+    def _ensure_schedule_listener(self) -> mqtt.Client:
+        c = self._require()  # type: ignore[attr-defined]
+        if not getattr(self, "_loop_running", False):
+            raise RuntimeError("schedule() requires the background loop. Call start() first.")
+        if getattr(self, "_sched_waiters", None) is None:
+            self._sched_lock = threading.Lock()
+            self._sched_waiters = {}
+        # (re)register after every reconnect, since disconnect() drops the client
+        if getattr(self, "_sched_client", None) is not c:
+            self._sched_client = c
+            topic = f"{self.base}/schedule/done"  # type: ignore[attr-defined]
+
+            def _cb(_c, _u, msg: mqtt.MQTTMessage) -> None:
+                try:
+                    info = json.loads(msg.payload.decode("utf-8", errors="ignore"))
+                except ValueError:
+                    return
+                with self._sched_lock:
+                    waiter = self._sched_waiters.get(str(info.get("id")))
+                if waiter is not None:
+                    waiter[1].update(info)
+                    waiter[0].set()
+
+            c.message_callback_add(topic, _cb)
+            c.subscribe(topic, qos=1)
+        return c
+
+    def _schedule(
+        self,
+        steps: Sequence[ScheduleStep],
+        repeat: int,
+        max_channel: int,
+        wait: bool,
+        timeout_s: Optional[float],
+    ) -> str:
+        steps_json, pass_ms = _encode_schedule(steps, max_channel)
+        if repeat < 1:
+            raise ValueError("repeat must be >= 1")
+        self._ensure_schedule_listener()
+
+        sched_id = f"{random.randint(0, 0xFFFFFFFF):08x}"
+        with self._sched_lock:
+            self._sched_waiters[sched_id] = (threading.Event(), {"expected_ms": pass_ms * repeat})
+        payload = json.dumps({"id": sched_id, "repeat": int(repeat), "steps": steps_json}, separators=(",", ":"))
+        self._publish("schedule", payload, qos=1, retain=False)  # type: ignore[attr-defined]
+        if wait:
+            self.wait_schedule(sched_id, timeout_s)
+        return sched_id
+
+    def wait_schedule(self, sched_id: str, timeout_s: Optional[float] = None) -> dict:
+        """
+        Block until the node reports schedule `sched_id` finished.
+        Default timeout is the schedule's nominal duration + 5 s.
+        Raises TimeoutError, or RuntimeError if the node aborted the sequence.
+        """
+        with self._sched_lock:
+            waiter = self._sched_waiters.get(sched_id)
+        if waiter is None:
+            raise KeyError(f"Unknown schedule id: {sched_id}")
+        event, info = waiter
+        if timeout_s is None:
+            timeout_s = info["expected_ms"] / 1000.0 + 5.0
+        try:
+            if not event.wait(timeout_s):
+                raise TimeoutError(f"Schedule {sched_id} on {self.base} not done within {timeout_s:.1f}s")  # type: ignore[attr-defined]
+        finally:
+            with self._sched_lock:
+                self._sched_waiters.pop(sched_id, None)
+        if str(info.get("status", "DONE")).upper() != "DONE":
+            raise RuntimeError(f"Schedule {sched_id} on {self.base} ended with status {info.get('status')}")  # type: ignore[attr-defined]
+        return info
+
+    def schedule_done(self, sched_id: str) -> bool:
+        """Non-blocking check whether the completion event for `sched_id` has arrived."""
+        with self._sched_lock:
+            waiter = self._sched_waiters.get(sched_id)
+        return waiter is not None and waiter[0].is_set()
+
+
+class PumpMQTT(_ScheduleMixin, _BaseDevice):
     """Controls pump relays via MQTT topics under base/cmd/<n>."""
     # Keep validation consistent with module-level constant:
     PUMP_COUNT: Final[int] = PUMP_COUNT  # type: ignore[name-defined]
@@ -706,6 +994,31 @@ class PumpMQTT(_BaseDevice):
         _check_range(channel, 1, self.PUMP_COUNT, "channel")
         self._publish(f"cmd/{channel}", "OFF", retain=False)
 
+    def pulse(self, channel: int, duration_ms: int, margin_s: float = 2.0) -> None:
+        """Run a pump for duration_ms and return as soon as the node acknowledges OFF."""
+        _check_range(channel, 1, self.PUMP_COUNT, "channel")
+        self._pulse(channel, duration_ms, margin_s)
+
+    def schedule(
+        self,
+        steps: Sequence[ScheduleStep],
+        repeat: int = 1,
+        *,
+        wait: bool = True,
+        timeout_s: Optional[float] = None,
+    ) -> str:
+        """
+        Upload a whole timed pump sequence in one publish and let the node run it, e.g.
+            pumps.schedule([(2, "on", 2000), ("wait", 1000), (3, "on", 10000)], repeat=4)
+        wait=False returns the schedule id immediately; use wait_schedule(id) later.
+        """
+        return self._schedule(steps, repeat, self.PUMP_COUNT, wait, timeout_s)
+
+    def wait_off(self, channel: int, timeout_s: float = 15.0) -> None:
+        """Wait until the (retained) state of a pump reads OFF."""
+        _check_range(channel, 1, self.PUMP_COUNT, "channel")
+        self.wait_for(f"state/{channel}", lambda v: v.upper() == "OFF", timeout_s)
+
     def toggle(self, channel: int, timeout_s: float = 1.0) -> None:
         """Toggle pump by reading retained state and flipping it (requires background loop)."""
         _check_range(channel, 1, self.PUMP_COUNT, "channel")
@@ -732,6 +1045,10 @@ class PumpMQTT(_BaseDevice):
         new_val = "OFF" if (got["val"] == "ON") else "ON"
         self._publish(f"cmd/{channel}", new_val)
 
+    def _shutdown_plan(self):
+        chans = range(1, self.PUMP_COUNT + 1)
+        return [(f"cmd/{i}", "OFF") for i in chans], {f"state/{i}": ("OFF",) for i in chans}
+
     def status(self, seconds: float = 3.0) -> None:
         """Subscribe temporarily to status/heartbeat or custom topics and print messages."""
         topics = [f"{self.base}/status", f"{self.base}/heartbeat"] + [
@@ -740,7 +1057,7 @@ class PumpMQTT(_BaseDevice):
         super().status(topics, seconds)
 
 
-class UltraMQTT(_BaseDevice):
+class UltraMQTT(_ScheduleMixin, _BaseDevice):
     """Controls 2 ultrasonic channels via relay driver."""
     ULTRA_COUNT: Final[int] = ULTRA_COUNT  # type: ignore[name-defined]
 
@@ -754,6 +1071,26 @@ class UltraMQTT(_BaseDevice):
         _check_range(channel, 1, self.ULTRA_COUNT, "channel")
         self._publish(f"cmd/{channel}", "OFF", retain=False)
 
+    def pulse(self, channel: int, duration_ms: int, margin_s: float = 2.0) -> None:
+        """Run an ultrasonic channel for duration_ms and return once the node acknowledges OFF."""
+        _check_range(channel, 1, self.ULTRA_COUNT, "channel")
+        self._pulse(channel, duration_ms, margin_s)
+
+    def schedule(
+        self,
+        steps: Sequence[ScheduleStep],
+        repeat: int = 1,
+        *,
+        wait: bool = True,
+        timeout_s: Optional[float] = None,
+    ) -> str:
+        """Upload a timed ultrasonic sequence (see PumpMQTT.schedule)."""
+        return self._schedule(steps, repeat, self.ULTRA_COUNT, wait, timeout_s)
+
+    def _shutdown_plan(self):
+        chans = range(1, self.ULTRA_COUNT + 1)
+        return [(f"cmd/{i}", "OFF") for i in chans], {f"state/{i}": ("OFF",) for i in chans}
+
     def status(self, seconds: float = 3.0) -> None:
         """Subscribe temporarily to status/heartbeat or custom topics and print messages."""
         topics = [f"{self.base}/status", f"{self.base}/heartbeat"] + [
@@ -867,6 +1204,63 @@ class HeatMQTT(_BaseDevice):
             raise TimeoutError(f"No temp published on {topic} within {timeout_s:.1f}s")
         return float(result["val"])
 
+    def _shutdown_plan(self):
+        # PWM 0 first, then OFF (same topic, so the broker keeps the order)
+        chans = range(1, self.HEAT_COUNT + 1)
+        commands = [(f"cmd/{i}", p) for i in chans for p in ("PWM:0", "OFF")]
+        return commands, {f"state/{i}": ("OFF",) for i in chans}
+
+    def wait_settled(
+        self,
+        channel: int,
+        target_c: float,
+        tol_c: float = 0.5,
+        hold_s: float = 30.0,
+        timeout_s: float = 900.0,
+        poll_s: float = 2.0,
+    ) -> float:
+        """
+        Block until temp/<n> stays within target_c ± tol_c for hold_s seconds.
+        Sends "GET" every poll_s so it also works when the node is not streaming.
+        Returns the last temperature; raises TimeoutError.
+        """
+        _check_range(channel, 1, self.HEAT_COUNT, "heater number")
+        t_deadline = time.time() + timeout_s
+        state: dict[str, Optional[float]] = {"since": None, "last": None, "next_get": 0.0}
+
+        def _settled(val: str) -> bool:
+            now = time.time()
+            try:
+                temp = float(val)
+            except ValueError:
+                return False
+            state["last"] = temp
+            if abs(temp - target_c) > tol_c:
+                state["since"] = None
+                return False
+            if state["since"] is None:
+                state["since"] = now
+            return now - state["since"] >= hold_s
+
+        # wait in poll_s slices, requesting a reading each time
+        while True:
+            remaining = t_deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError(
+                    f"Heater {channel} did not settle at {target_c:.1f}±{tol_c:.1f} °C "
+                    f"for {hold_s:.0f}s within {timeout_s:.0f}s (last: {state['last']})"
+                )
+            try:
+                self.wait_for(
+                    f"temp/{channel}",
+                    _settled,
+                    timeout_s=min(poll_s, remaining),
+                    trigger=lambda: self._publish(f"cmd/{channel}", "GET"),
+                )
+                return float(state["last"])  # type: ignore[arg-type]
+            except TimeoutError:
+                continue
+
     def status(self, seconds: float = 3.0) -> None:
         """Subscribe temporarily to status/heartbeat or custom topics and print messages."""
         topics = [f"{self.base}/status", f"{self.base}/heartbeat"] \
@@ -950,6 +1344,10 @@ class PhMQTT(_BaseDevice):
             print_live=True,
         )
 
+    def _shutdown_plan(self):
+        # STOP polling; the node has no retained state topic to confirm against
+        return [("cmd", "STOP")], {}
+
     # --- status snapshot ---
     def status(self, seconds: float = 3.0) -> None:
         """Subscribe temporarily to status/heartbeat or custom topics and print messages."""
@@ -1045,6 +1443,10 @@ class BioMQTT(_BaseDevice):
         _check_range(channel, 1, self.BIO_COUNT, "biologic number")
         self._publish(f"cmd/{channel}", "OFF")
 
+    def _shutdown_plan(self):
+        chans = range(1, self.BIO_COUNT + 1)
+        return [(f"cmd/{i}", "OFF") for i in chans], {f"state/{i}": ("OFF",) for i in chans}
+
     def status(self, seconds: float = 3.0) -> None:
         """Subscribe temporarily to status/heartbeat or custom topics and print messages."""
         topics = [f"{self.base}/status", f"{self.base}/heartbeat"] + [
@@ -1055,6 +1457,14 @@ class BioMQTT(_BaseDevice):
 
 class ReactorMQTT(_BaseDevice):
     """Controls reactor and furnace via SparkFun Qwiic Quad Relay."""
+
+    # states accepted after RESET; the furnace must end up closed, the reactor
+    # valve may be left either way
+    RESET_STATES = {"Reactor": ("Open", "Closed"), "Furnace": ("Closed",)}
+    # the valves are pulsed actuators: state/<which> is only republished when
+    # the pulse ends (~10 s), and the retained value is the state from before
+    _shutdown_fresh = ("state/Reactor", "state/Furnace")
+    _shutdown_wait_s = 12.0
     
     def reactor_open(self) -> None:
         """Open the reactor valve."""
@@ -1120,6 +1530,35 @@ class ReactorMQTT(_BaseDevice):
             raise TimeoutError(f"No state reading on {topic} within {timeout_s:.1f}s")
         return result["val"]
     
+    def _shutdown_plan(self):
+        # RESET drives the node to its safe state
+        return [("cmd", "RESET")], {f"state/{which}": states for which, states in self.RESET_STATES.items()}
+
+    def wait_state(
+        self,
+        which: str,
+        expected: str,
+        timeout_s: float = 15.0,
+        *,
+        fresh_only: bool = True,
+        trigger: Optional[Callable[[], None]] = None,
+    ) -> str:
+        """
+        Block until state/<which> reads `expected` (case-insensitive, e.g. "Open"/"Closed").
+        Returns as soon as the node reports it instead of sleeping for a fixed pulse time.
+
+        - trigger: command to send once subscribed, e.g. reactor.reactor_open, so
+          the report that ends its pulse cannot be missed.
+        - fresh_only=True (default) ignores the retained state: it may already
+          equal `expected` from an earlier cycle while the pulse is still
+          running. Pass False only to read back a state nothing is changing.
+        """
+        if which not in ("Reactor", "Furnace"):
+            raise ValueError("which must be 'Reactor' or 'Furnace'")
+        want = expected.strip().lower()
+        return self.wait_for(f"state/{which}", lambda v: v.lower() == want, timeout_s,
+                             fresh_only=fresh_only, trigger=trigger)
+
     def status(self, seconds: float = 3.0) -> None:
         """Subscribe temporarily to status/heartbeat or custom topics and print messages."""
         topics = [
@@ -1249,17 +1688,14 @@ if __name__ == "__main__":
         bio.off(1)
 
         # --------- Reactor demo ---------
-        # Open reactor
-        reactor.reactor_open()
-        time.sleep(11)  # Wait for pulse to complete
+        # Open reactor (sends OPEN, returns once the node reports Open)
+        reactor.wait_state("Reactor", "Open", timeout_s=15, trigger=reactor.reactor_open)
         
         # Open furnace
-        reactor.furnace_open()
-        time.sleep(7)  # Wait for pulse to complete
+        reactor.wait_state("Furnace", "Open", timeout_s=10, trigger=reactor.furnace_open)
         
-        # Reset to safe state (Reactor OPEN, Furnace CLOSED)
-        reactor.reset()
-        time.sleep(11)
+        # Reset to safe state (Furnace CLOSED)
+        reactor.wait_state("Furnace", "Closed", timeout_s=15, trigger=reactor.reset)
 
     finally:
         # Best-effort tidy OFF on graceful exit
@@ -0,0 +1,282 @@
+# labware_registry.py
+# Parse, validate and cache the custom labware definitions in labware/ once,
+# and load a whole deck layout in one call.
+#
+#   reg = LabwareRegistry()                       # scans labware/, validates every file
+#   ids = load_deck(oc, {
+#       1: 'opentrons_96_tiprack_1000ul',         # not in labware/ -> standard labware
+#       3: 'nis_2_sonicator_bath',
+#       4: 'nis_8_reservoir_25000ul',
+#       7: 'nis_8_reservoir_25000ul',             # same definition: uploaded once
+#       9: 'nis_15_wellplate_3895ul',
+#   }, registry=reg)
+#   strID_NISreactor = ids[9]
+#
+# Definitions are validated against labware/schemas/labware_schema.json
+# (with jsonschema if it is installed, otherwise a built-in checker for the
+# keywords that schema uses) and cached by content hash, so an unchanged file
+# is never parsed or validated twice. A file resolves by its stem, and by its
+# loadName unless the definition is in the "opentrons" namespace (those names
+# keep loading the built-in labware) or the loadName is declared by more than
+# one file. labware/flex_labware is only scanned for strRobot="flex".
+# opentronsClient uploads each distinct definition only once per run;
+# load_deck() uploads the distinct ones in parallel before issuing the
+# loadLabware commands in slot order.
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Mapping, Optional, Union
+
+try:
+    import jsonschema
+except ImportError:  # optional
+    jsonschema = None
+
+LABWARE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "labware")
+SCHEMA_PATH = os.path.join(LABWARE_DIR, "schemas", "labware_schema.json")
+# subdirectory of labware_dir only scanned for strRobot="flex"
+FLEX_LABWARE_DIR = "flex_labware"
+
+
+class LabwareValidationError(Exception):
+    """A labware definition does not match the schema."""
+
+
+class LabwareNameError(Exception):
+    """A load name or definition URI is claimed by more than one different labware definition."""
+
+
+def definition_hash(dicLabware: dict) -> str:
+    """Content hash of a definition (key order independent)."""
+    return hashlib.sha1(json.dumps(dicLabware, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def definition_uri(dicLabware: dict) -> str:
+    """namespace/loadName/version: the key the robot looks labware geometry up by."""
+    return f"{dicLabware['namespace']}/{dicLabware['parameters']['loadName']}/{dicLabware['version']}"
+
+
+def check_unique_uris(definitions: Iterable[dict], what: str = "definitions") -> None:
+    """Raise LabwareNameError if two different definitions share a URI."""
+    seen: dict[str, str] = {}
+    for dicLabware in definitions:
+        uri, h = definition_uri(dicLabware), definition_hash(dicLabware)
+        if seen.setdefault(uri, h) != h:
+            raise LabwareNameError(f"Two different labware definitions for {uri} in the {what}; "
+                                   f"the robot would load one with the other's geometry")
+
+
+_JSON_TYPES = {
+    "object": dict, "array": list, "string": str, "boolean": bool,
+    "number": (int, float), "integer": int, "null": type(None),
+}
+
+
+def _check(instance, schema: dict, path: str, errors: list[str]) -> None:
+    # minimal draft-07 subset: type, required, properties, additionalProperties, items
+    typ = schema.get("type")
+    if typ is not None:
+        types = typ if isinstance(typ, list) else [typ]
+        ok = any(isinstance(instance, _JSON_TYPES[t]) and not (t in ("number", "integer") and isinstance(instance, bool))
+                 for t in types)
+        if not ok:
+            errors.append(f"{path or '/'}: expected {typ}, got {type(instance).__name__}")
+            return
+    if isinstance(instance, dict):
+        for key in schema.get("required", []):
+            if key not in instance:
+                errors.append(f"{path or '/'}: missing '{key}'")
+        props = schema.get("properties", {})
+        extra = schema.get("additionalProperties")
+        for key, value in instance.items():
+            if key in props:
+                _check(value, props[key], f"{path}/{key}", errors)
+            elif isinstance(extra, dict):
+                _check(value, extra, f"{path}/{key}", errors)
+            elif extra is False:
+                errors.append(f"{path or '/'}: unexpected '{key}'")
+    if isinstance(instance, list) and isinstance(schema.get("items"), dict):
+        for i, value in enumerate(instance):
+            _check(value, schema["items"], f"{path}/{i}", errors)
+
+
+class LabwareRegistry:
+    def __init__(self, labware_dir: str = LABWARE_DIR, schema_path: Optional[str] = SCHEMA_PATH,
+                 scan: bool = True, strRobot: str = "ot2") -> None:
+        """
+        Files resolve by file stem, and by their loadName unless the definition
+        is in the "opentrons" namespace (those names stay standard labware) or
+        several files declare the same loadName. labware_dir/flex_labware is
+        only scanned for strRobot="flex".
+        """
+        self.labware_dir = labware_dir
+        self.robot = strRobot
+        self.schema = None
+        if schema_path and os.path.exists(schema_path):
+            with open(schema_path, 'r') as f:
+                self.schema = json.load(f)
+        self._lock = threading.Lock()
+        self._by_hash: dict[str, dict] = {}                       # hash -> validated definition
+        self._files: dict[str, tuple[float, int, str]] = {}       # path -> (mtime, size, hash)
+        self._names: dict[str, str] = {}                          # loadName / file stem -> path
+        self._ambiguous: dict[str, list[str]] = {}                # loadName -> files declaring it
+        if scan:
+            self.scan()
+
+    # Validation
+    def validate(self, dicLabware: dict, source: str = "<definition>") -> None:
+        if self.schema is None:
+            return
+        if jsonschema is not None:
+            validator = jsonschema.Draft7Validator(self.schema)
+            errors = [f"/{'/'.join(map(str, e.path))}: {e.message}" for e in validator.iter_errors(dicLabware)]
+        else:
+            errors = []
+            _check(dicLabware, self.schema, "", errors)
+        if errors:
+            raise LabwareValidationError(f"{source} is not a valid labware definition:\n  " + "\n  ".join(errors[:20]))
+
+    def add(self, dicLabware: dict, source: str = "<definition>") -> str:
+        """Validate (once per content) and cache a definition; returns its hash."""
+        h = self._add(dicLabware, source)
+        if dicLabware.get("namespace") != "opentrons":
+            with self._lock:
+                self._names.setdefault(dicLabware["parameters"]["loadName"], source)
+        return h
+
+    def _add(self, dicLabware: dict, source: str) -> str:
+        h = definition_hash(dicLabware)
+        with self._lock:
+            if h in self._by_hash:
+                return h
+        self.validate(dicLabware, source)
+        with self._lock:
+            self._by_hash[h] = dicLabware
+        return h
+
+    # Files
+    def scan(self) -> list[str]:
+        """
+        Parse and validate every *.json under labware_dir (schemas, and
+        flex_labware unless strRobot is "flex", excluded); returns problems.
+        Raises LabwareNameError if two files hold different definitions under
+        one URI (namespace/loadName/version): the robot could not tell them apart.
+        """
+        problems = []
+        excluded = {"schemas"} if self.robot == "flex" else {"schemas", FLEX_LABWARE_DIR}
+        stems: dict[str, str] = {}
+        declared: dict[str, list[str]] = {}  # loadName -> paths
+        uris: dict[str, dict[str, list[str]]] = {}  # URI -> hash -> paths
+        for root, dirs, files in os.walk(self.labware_dir):
+            dirs[:] = sorted(d for d in dirs if d not in excluded)
+            for fn in sorted(files):
+                if not fn.endswith(".json"):
+                    continue
+                path = os.path.join(root, fn)
+                try:
+                    dicLabware = self.load_file(path)
+                except (LabwareValidationError, ValueError, KeyError) as e:
+                    problems.append(str(e))
+                    logging.warning("Labware %s skipped: %s", path, e)
+                    continue
+                stems[os.path.splitext(fn)[0]] = path
+                uris.setdefault(definition_uri(dicLabware), {}).setdefault(
+                    self._files[path][2], []).append(path)
+                if dicLabware.get("namespace") != "opentrons":
+                    declared.setdefault(dicLabware["parameters"]["loadName"], []).append(path)
+
+        conflicts = [f"{uri}: " + " vs ".join(", ".join(paths) for paths in by_hash.values())
+                     for uri, by_hash in uris.items() if len(by_hash) > 1]
+        if conflicts:
+            raise LabwareNameError("Different labware definitions share a URI (give each its own "
+                                   "loadName):\n  " + "\n  ".join(conflicts))
+
+        # a file stem always names its own file; a loadName only if the files
+        # declaring it hold a single definition
+        names, ambiguous = dict(stems), {}
+        for loadName, paths in declared.items():
+            distinct = {self._files[p][2] for p in paths}
+            if len(paths) > 1:
+                logging.warning("Labware loadName '%s' is declared by %d files (%d distinct definitions): %s",
+                                loadName, len(paths), len(distinct), ", ".join(paths))
+            if loadName in names:
+                continue
+            if len(distinct) > 1:
+                ambiguous[loadName] = paths
+            else:
+                names[loadName] = paths[0]
+        with self._lock:
+            # keep names of definitions added as dicts, replace the file ones
+            inline = {k: v for k, v in self._names.items() if v not in self._files}
+            self._names = {**inline, **names}
+            self._ambiguous = ambiguous
+        logging.info("Labware registry: %d definitions (%d invalid)", len(self._by_hash), len(problems))
+        return problems
+
+    def load_file(self, path: str) -> dict:
+        st = os.stat(path)
+        cached = self._files.get(path)
+        if cached and cached[:2] == (st.st_mtime, st.st_size):
+            return self._by_hash[cached[2]]
+        with open(path, 'r') as f:
+            dicLabware = json.load(f)
+        h = self._add(dicLabware, source=path)
+        self._files[path] = (st.st_mtime, st.st_size, h)
+        return self._by_hash[h]
+
+    def get(self, name: str) -> Optional[dict]:
+        """Definition for a load name, file stem or path; None if it is not custom labware."""
+        if os.path.exists(name):
+            return self.load_file(name)
+        path = self._names.get(name)
+        if path is None:
+            if name in self._ambiguous:
+                raise LabwareNameError(f"Labware '{name}' is declared by several files "
+                                       f"({', '.join(self._ambiguous[name])}); load it by file name")
+            return None
+        if path in self._files:
+            return self.load_file(path)  # re-validates only if the file changed
+        return next((d for d in self._by_hash.values() if d["parameters"]["loadName"] == name), None)
+
+    def names(self) -> list[str]:
+        return sorted(self._names)
+
+
+def load_deck(oc, layout: Mapping[int, Union[str, dict]], registry: Optional[LabwareRegistry] = None,
+              max_workers: int = 4) -> dict[int, str]:
+    """
+    Load a whole deck: layout maps slot -> load name / definition path / definition dict.
+    Names found in the registry are custom labware (uploaded once per distinct
+    definition, in parallel); anything else is loaded as standard Opentrons labware.
+    Raises LabwareNameError if two slots use different definitions with one URI.
+    Returns {slot: labware identifier} in the same form as oc.loadLabware.
+    """
+    registry = registry or LabwareRegistry()
+    resolved: dict[int, Optional[dict]] = {}
+    for slot, item in layout.items():
+        if isinstance(item, dict):
+            registry.add(item)
+            resolved[slot] = item
+        else:
+            resolved[slot] = registry.get(item)
+
+    check_unique_uris((d for d in resolved.values() if d is not None), what="deck layout")
+    unique = {definition_hash(d): d for d in resolved.values() if d is not None}
+    if unique:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as pool:
+            list(pool.map(oc.uploadLabwareDefinition, unique.values()))
+
+    identifiers = {}
+    for slot in sorted(layout, key=lambda s: int(s) if str(s).isdigit() else str(s)):
+        d = resolved[slot]
+        if d is None:
+            identifiers[slot] = oc.loadLabware(intSlot=slot, strLabwareName=layout[slot])
+        else:
+            identifiers[slot] = oc.loadCustomLabware(dicLabware=d, intSlot=slot)
+    return identifiers
@@ -0,0 +1,190 @@
+# liquid_classes.py
+# Pipetting settings per solution instead of one set of defaults for everything.
+#
+# A liquid class holds the aspirate/dispense/blowout flow rates, whether to
+# blow out, the air gap, how deep to submerge below the tracked liquid
+# surface and the gantry speed while carrying the liquid. Solutions from the
+# experiment CSV map to a class by explicit assignment, then by keyword
+# ("KOH", "H2O", "HCl", "NiSO4" -> aqueous; whole words of the name only),
+# then the "default" class, which keeps the client's old settings
+# (274.7 uL/s, blowout, 100 mm/s). A name whose words point at different
+# classes ("Nafion in IPA") also gets "default" until it is assign()ed.
+#
+# The air gap shares the 1000 uL tip with the liquid, so a class with an air
+# gap needs an extra tip trip for every full 1000 uL (2000 uL: 3 instead of
+# 2); only "volatile" has one by default.
+#
+#   lc = get_liquid_classes()
+#   lc.assign("PEG400", "viscous")
+#   lc.load("liquid_classes.json")     # {"classes": {...}, "solutions": {"KOH": "aqueous"}}
+#   lc.for_solution("KOH").aspirate_flow_rate
+#   lc.unmatched(wells)                # CSV solutions that fall back to "default"
+#
+# fillWell/fillWell_autoSource/distribute/consolidate/mix pick the class from
+# the solution name (or the source well's ledger contents) automatically.
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+from typing import Iterable, Optional
+
+_FIELDS = ("aspirate_flow_rate", "dispense_flow_rate", "blowout_flow_rate", "blowout",
+           "air_gap_uL", "submerge_mm", "move_speed")
+
+
+class LiquidClass:
+    def __init__(self, name: str,
+                 aspirate_flow_rate: float = 274.7,   # uL/s
+                 dispense_flow_rate: float = 274.7,   # uL/s
+                 blowout_flow_rate: float = 274.7,    # uL/s
+                 blowout: bool = True,
+                 air_gap_uL: float = 0.0,
+                 submerge_mm: float = 3.0,            # below the liquid surface
+                 move_speed: int = 100) -> None:      # mm/s while carrying liquid
+        self.name = name
+        self.aspirate_flow_rate = float(aspirate_flow_rate)
+        self.dispense_flow_rate = float(dispense_flow_rate)
+        self.blowout_flow_rate = float(blowout_flow_rate)
+        self.blowout = bool(blowout)
+        self.air_gap_uL = float(air_gap_uL)
+        self.submerge_mm = float(submerge_mm)
+        self.move_speed = int(move_speed)
+
+    def to_dict(self) -> dict:
+        return {f: getattr(self, f) for f in _FIELDS}
+
+    def __repr__(self) -> str:
+        return f"LiquidClass({self.name!r}, " + ", ".join(f"{f}={getattr(self, f)}" for f in _FIELDS) + ")"
+
+
+DEFAULT_CLASSES = {
+    # the client's historical settings, for solutions nobody has characterised
+    "default": LiquidClass("default"),
+    # thin water-like solutions: fast plunger and gantry (no air gap: full 1000 uL tip loads)
+    "aqueous": LiquidClass("aqueous", aspirate_flow_rate=400, dispense_flow_rate=500, blowout_flow_rate=500,
+                           air_gap_uL=0, submerge_mm=2, move_speed=300),
+    # low surface tension / high vapour pressure: air gap so it does not creep out of the tip
+    "volatile": LiquidClass("volatile", aspirate_flow_rate=200, dispense_flow_rate=400, blowout_flow_rate=400,
+                            air_gap_uL=30, submerge_mm=2, move_speed=200),
+    # viscous: slow plunger for full draw-up, slow blowout, gentle moves
+    "viscous": LiquidClass("viscous", aspirate_flow_rate=50, dispense_flow_rate=50, blowout_flow_rate=100,
+                           air_gap_uL=0, submerge_mm=4, move_speed=80),
+}
+
+# keyword -> class, matched case-insensitively against the words of the solution name
+DEFAULT_KEYWORDS = {
+    "water": "aqueous", "h2o": "aqueous", "di": "aqueous", "koh": "aqueous", "naoh": "aqueous",
+    "hcl": "aqueous", "h2so4": "aqueous", "hno3": "aqueous", "buffer": "aqueous", "sulfate": "aqueous",
+    "chloride": "aqueous", "nitrate": "aqueous", "so4": "aqueous", "no3": "aqueous",
+    "ethanol": "volatile", "etoh": "volatile", "methanol": "volatile", "ipa": "volatile",
+    "isopropanol": "volatile", "acetone": "volatile",
+    "glycerol": "viscous", "peg": "viscous", "ionic": "viscous", "nafion": "viscous",
+}
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+# salt formulas keep the anion in the same word ("NiSO4", "Co(NO3)2" -> "co", "no3", "2")
+_ANION_SUFFIXES = ("so4", "no3")
+
+
+class LiquidClassRegistry:
+    def __init__(self) -> None:
+        self._classes: dict[str, LiquidClass] = dict(DEFAULT_CLASSES)
+        self._solutions: dict[str, str] = {}
+        self._keywords: dict[str, str] = dict(DEFAULT_KEYWORDS)
+        self._cache: dict[str, LiquidClass] = {}
+        self._lock = threading.Lock()
+
+    # Definition
+    def register(self, liquid_class: LiquidClass) -> None:
+        with self._lock:
+            self._classes[liquid_class.name] = liquid_class
+            self._cache.clear()
+
+    def define(self, name: str, base: str = "default", **settings) -> LiquidClass:
+        """New class from `base` with some settings changed, e.g. define("KOH_5M", "aqueous", move_speed=200)."""
+        unknown = set(settings) - set(_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown liquid class setting(s): {', '.join(sorted(unknown))}")
+        liquid_class = LiquidClass(name, **{**self._classes[base].to_dict(), **settings})
+        self.register(liquid_class)
+        return liquid_class
+
+    def assign(self, solution_name: str, class_name: str) -> None:
+        if class_name not in self._classes:
+            raise KeyError(f"Unknown liquid class '{class_name}'")
+        with self._lock:
+            self._solutions[solution_name.strip().lower()] = class_name
+            self._cache.clear()
+
+    def add_keyword(self, keyword: str, class_name: str) -> None:
+        with self._lock:
+            self._keywords[keyword.lower()] = class_name
+            self._cache.clear()
+
+    def load(self, path: str) -> None:
+        """Read {"classes": {name: {"base": ..., setting: value}}, "solutions": {solution: class}}."""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        for name, settings in data.get("classes", {}).items():
+            settings = dict(settings)
+            self.define(name, settings.pop("base", "default"), **settings)
+        for solution, class_name in data.get("solutions", {}).items():
+            self.assign(solution, class_name)
+        logging.info("Liquid classes loaded from %s", os.path.basename(path))
+
+    def save(self, path: str) -> None:
+        data = {"classes": {n: c.to_dict() for n, c in self._classes.items()}, "solutions": dict(self._solutions)}
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    # Lookup
+    def get(self, class_name: str) -> LiquidClass:
+        return self._classes[class_name]
+
+    def classes(self) -> list[str]:
+        return list(self._classes)
+
+    def _match(self, key: str) -> Optional[str]:
+        if key in self._solutions:
+            return self._solutions[key]
+        # whole words only ("cationic" is not "ionic"), and no guessing between classes
+        words = _WORD.findall(key)
+        words += [a for w in words for a in _ANION_SUFFIXES if w.endswith(a) and w != a]
+        matches = {self._keywords[w] for w in words if w in self._keywords}
+        if len(matches) > 1:
+            logging.warning("Solution '%s' matches liquid classes %s; assign() one explicitly",
+                            key, ", ".join(sorted(matches)))
+            return None
+        return matches.pop() if matches else None
+
+    def for_solution(self, solution_name: Optional[str]) -> LiquidClass:
+        """Liquid class for a solution name; "default" if it is unknown or None."""
+        if not solution_name:
+            return self._classes["default"]
+        key = solution_name.strip().lower()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                cached = self._cache[key] = self._classes[self._match(key) or "default"]
+        return cached
+
+    def unmatched(self, wells: Iterable[dict]) -> list[str]:
+        """Solution names in load_experiment_csv() wells that only get the "default" class (unknown or ambiguous)."""
+        names = {s["name"] for w in wells for s in w.get("solutions", [])}
+        return sorted(n for n in names if self._match(n.strip().lower()) is None)
+
+
+_REGISTRY: Optional[LiquidClassRegistry] = None
+
+
+def get_liquid_classes() -> LiquidClassRegistry:
+    """Process-wide registry used by the workflow helpers."""
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = LiquidClassRegistry()
+    return _REGISTRY
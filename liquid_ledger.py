@@ -0,0 +1,201 @@
+# liquid_ledger.py
+# Volume bookkeeping for every (labware, well) the OT-2 touches.
+#
+# opentronsClient owns one LiquidLedger (oc.ledger). Loading labware registers
+# the well geometry from its definition (depth, shape, totalLiquidVolume);
+# every aspirate/dispense sent through the client is checked against it
+# before the request and booked after it succeeds. Wells whose volume has
+# never been set are "untracked": they are not checked (the robot does not
+# know what is in a vial until you tell it), but dispenses into them start
+# counting from 0 uL.
+#
+#   oc.ledger.set_volume(strID_vialRack_4, "B1", 15000, contents="KOH")
+#   oc.ledger.volume(strID_NISreactor, "A1")           # uL, O(1)
+#   oc.ledger.liquid_height(strID_NISreactor, "A1")    # mm above well bottom
+#   oc.ledger.submerged_z(strID_NISreactor, "A1", origin="top", submerge_mm=3)
+
+from __future__ import annotations
+
+import logging
+import math
+from typing import Optional
+
+
+class LiquidVolumeError(Exception):
+    """Aspirating more than a well holds, or dispensing past its capacity."""
+
+
+class _Well:
+    __slots__ = ("volume", "capacity", "depth", "area", "contents")
+
+    def __init__(self, capacity: Optional[float], depth: Optional[float], area: Optional[float]) -> None:
+        self.volume: Optional[float] = None
+        self.capacity = capacity
+        self.depth = depth
+        self.area = area
+        self.contents: Optional[str] = None
+
+
+def _well_area(dicWell: dict) -> Optional[float]:
+    if dicWell.get("shape") == "circular" and dicWell.get("diameter"):
+        return math.pi * (dicWell["diameter"] / 2) ** 2
+    if dicWell.get("shape") == "rectangular" and dicWell.get("xDimension") and dicWell.get("yDimension"):
+        return dicWell["xDimension"] * dicWell["yDimension"]
+    return None
+
+
+class LiquidLedger:
+    def __init__(self, strict: bool = True) -> None:
+        """strict=False only logs would-be over/underflows instead of raising."""
+        self.strict = strict
+        self._wells: dict[tuple[str, str], _Well] = {}
+        self._tip_contents: dict[str, Optional[str]] = {}  # pipette -> what it last aspirated
+
+    # Geometry
+    def register_labware(self, strLabwareName: str, dicDefinition: dict) -> None:
+        """Register every well of a labware definition (keeps volumes already set)."""
+        for strWell, dicWell in dicDefinition.get("wells", {}).items():
+            key = (strLabwareName, strWell)
+            geom = _Well(dicWell.get("totalLiquidVolume"), dicWell.get("depth"), _well_area(dicWell))
+            old = self._wells.get(key)
+            if old is not None:
+                geom.volume, geom.contents = old.volume, old.contents
+            self._wells[key] = geom
+
+    def _get(self, strLabwareName: str, strWellName: str) -> _Well:
+        key = (strLabwareName, strWellName)
+        well = self._wells.get(key)
+        if well is None:
+            well = self._wells[key] = _Well(None, None, None)
+        return well
+
+    # State
+    def set_volume(self, strLabwareName: str, strWellName: str, fltVolume: float,
+                   contents: Optional[str] = None) -> None:
+        well = self._get(strLabwareName, strWellName)
+        if well.capacity is not None and fltVolume > well.capacity:
+            self._fail(f"{strLabwareName}/{strWellName}: {fltVolume} uL exceeds capacity {well.capacity} uL")
+        well.volume = float(fltVolume)
+        if contents is not None:
+            well.contents = contents
+
+    def set_from_sources(self, sources_by_plate: dict) -> None:
+        """Seed source volumes from the notebook's sources_by_plate dict."""
+        for strPlate, dicWells in sources_by_plate.items():
+            for strWell, info in dicWells.items():
+                self.set_volume(strPlate, strWell, info.get("remaining_uL", 0), contents=info.get("solution"))
+
+    def volume(self, strLabwareName: str, strWellName: str) -> Optional[float]:
+        well = self._wells.get((strLabwareName, strWellName))
+        return None if well is None else well.volume
+
+    def capacity(self, strLabwareName: str, strWellName: str) -> Optional[float]:
+        well = self._wells.get((strLabwareName, strWellName))
+        return None if well is None else well.capacity
+
+    def headroom(self, strLabwareName: str, strWellName: str) -> Optional[float]:
+        well = self._wells.get((strLabwareName, strWellName))
+        if well is None or well.capacity is None:
+            return None
+        return well.capacity - (well.volume or 0.0)
+
+    def contents(self, strLabwareName: str, strWellName: str) -> Optional[str]:
+        well = self._wells.get((strLabwareName, strWellName))
+        return None if well is None else well.contents
+
+    # Checks / booking (called by opentronsClient.aspirate / dispense)
+    def _fail(self, msg: str) -> None:
+        if self.strict:
+            raise LiquidVolumeError(msg)
+        logging.warning("Liquid ledger: %s", msg)
+
+    def check_aspirate(self, strLabwareName: str, strWellName: str, fltVolume: float) -> None:
+        well = self._wells.get((strLabwareName, strWellName))
+        if well is not None and well.volume is not None and fltVolume > well.volume + 1e-6:
+            self._fail(f"Aspirating {fltVolume} uL from {strLabwareName}/{strWellName} "
+                       f"which holds {well.volume:.0f} uL")
+
+    def check_dispense(self, strLabwareName: str, strWellName: str, fltVolume: float) -> None:
+        well = self._wells.get((strLabwareName, strWellName))
+        if well is not None and well.capacity is not None and \
+                (well.volume or 0.0) + fltVolume > well.capacity + 1e-6:
+            self._fail(f"Dispensing {fltVolume} uL into {strLabwareName}/{strWellName} "
+                       f"({well.volume or 0:.0f}/{well.capacity} uL) would overflow")
+
+    def aspirated(self, strLabwareName: str, strWellName: str, fltVolume: float,
+                  strPipetteName: Optional[str] = None) -> None:
+        well = self._get(strLabwareName, strWellName)
+        if well.volume is not None:
+            well.volume = max(0.0, well.volume - fltVolume)
+        if strPipetteName is not None:
+            self._tip_contents[strPipetteName] = well.contents
+
+    def dispensed(self, strLabwareName: str, strWellName: str, fltVolume: float,
+                  contents: Optional[str] = None, strPipetteName: Optional[str] = None) -> None:
+        well = self._get(strLabwareName, strWellName)
+        well.volume = (well.volume or 0.0) + fltVolume
+        if contents is None and strPipetteName is not None:
+            contents = self._tip_contents.get(strPipetteName)
+        if contents is not None:
+            well.contents = contents if well.contents in (None, contents) else "mixture"
+
+    # Geometry queries
+    def liquid_height(self, strLabwareName: str, strWellName: str,
+                      removed_uL: float = 0.0) -> Optional[float]:
+        """
+        Liquid height above the well bottom (mm), or None if unknown; with
+        removed_uL, the height left after aspirating that much.
+        Uses the lower of the cylinder estimate (volume / cross-section) and the
+        linear one (depth * volume / totalLiquidVolume), so a submerged tip errs
+        on the deep side for wells with inserts or tapered bottoms.
+        """
+        well = self._wells.get((strLabwareName, strWellName))
+        if well is None or well.volume is None or well.depth is None:
+            return None
+        volume = max(0.0, well.volume - removed_uL)
+        estimates = []
+        if well.area:
+            estimates.append(volume / well.area)  # uL == mm^3
+        if well.capacity:
+            estimates.append(well.depth * volume / well.capacity)
+        if not estimates:
+            return None
+        return min(min(estimates), well.depth)
+
+    def submerged_z(self, strLabwareName: str, strWellName: str, origin: str = "bottom",
+                    submerge_mm: float = 3.0, min_from_bottom_mm: float = 1.0,
+                    removed_uL: float = 0.0) -> Optional[float]:
+        """
+        Z offset (relative to `origin`: 'bottom', 'center' or 'top') that puts the
+        tip `submerge_mm` below the liquid surface, never closer than
+        `min_from_bottom_mm` to the bottom. None if the level is unknown.
+        removed_uL: aspirate volume; the tip stays submerged at the level left
+        after it (the surface drops while the tip holds its position).
+        """
+        h = self.liquid_height(strLabwareName, strWellName, removed_uL=removed_uL)
+        if h is None:
+            return None
+        depth = self._wells[(strLabwareName, strWellName)].depth
+        z = max(min_from_bottom_mm, h - submerge_mm)
+        if origin == "bottom":
+            return z
+        if origin == "center":
+            return z - depth / 2
+        if origin == "top":
+            return z - depth
+        raise ValueError(f"Unknown origin '{origin}'")
+
+    # Persistence (e.g. CheckpointStore.track("ledger", oc.ledger.to_dict))
+    def to_dict(self) -> dict:
+        out: dict[str, dict] = {}
+        for (lw, w), well in self._wells.items():
+            if well.volume is not None:
+                out.setdefault(lw, {})[w] = {"volume_uL": well.volume, "contents": well.contents}
+        return out
+
+    def load_dict(self, data: dict) -> None:
+        for lw, wells in data.items():
+            for w, info in wells.items():
+                well = self._get(lw, w)
+                well.volume = info.get("volume_uL")
+                well.contents = info.get("contents")
@@ -0,0 +1,797 @@
+# mqtt_sim.py
+# Pure-Python stand-ins for the lab MQTT setup, for tests and benchmarks:
+# - LocalBroker: minimal in-process MQTT broker (v3.1.1 + v5, QoS 0/1, retain, LWT)
+# - Simulated ESP32 nodes speaking the same topic contracts as the firmware
+#   used by iot_mqtt.py (pumps, ultrasound, heaters, pH, Biologic relays, reactor)
+#
+# No network or external broker needed: everything binds to 127.0.0.1.
+
+from __future__ import annotations
+
+import json
+import random
+import socket
+import struct
+import threading
+import time
+from typing import Callable, Optional
+
+# -----------------------------------------------------------------------------
+# MQTT wire helpers
+# -----------------------------------------------------------------------------
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def _encode_varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        if n:
+            byte |= 0x80
+        out.append(byte)
+        if not n:
+            return bytes(out)
+
+
+def _decode_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    mult, value = 1, 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value += (byte & 0x7F) * mult
+        if not byte & 0x80:
+            return value, pos
+        mult *= 128
+
+
+def _read_str(buf: bytes, pos: int) -> tuple[bytes, int]:
+    (n,) = struct.unpack_from("!H", buf, pos)
+    pos += 2
+    return buf[pos:pos + n], pos + n
+
+
+def _encode_str(data: bytes) -> bytes:
+    return struct.pack("!H", len(data)) + data
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT topic filter matching with '+' and '#' wildcards."""
+    f_parts = topic_filter.split("/")
+    t_parts = topic.split("/")
+    if topic.startswith("$") and f_parts[0] in ("+", "#"):
+        return False
+    for i, f in enumerate(f_parts):
+        if f == "#":
+            return True
+        if i >= len(t_parts):
+            return False
+        if f != "+" and f != t_parts[i]:
+            return False
+    return len(f_parts) == len(t_parts)
+
+
+# -----------------------------------------------------------------------------
+# Broker
+# -----------------------------------------------------------------------------
+class _Session:
+    """One TCP client connection."""
+
+    def __init__(self, broker: "LocalBroker", sock: socket.socket) -> None:
+        self.broker = broker
+        self.sock = sock
+        self.client_id = ""
+        self.v5 = False
+        self.subs: dict[str, int] = {}  # filter -> granted qos
+        self.will: Optional[tuple[str, bytes, int, bool]] = None
+        self._wlock = threading.Lock()
+        self._next_pid = 0
+        self.closed = False
+
+    # -- output ---------------------------------------------------------------
+    def send(self, ptype: int, flags: int, body: bytes) -> None:
+        pkt = bytes([(ptype << 4) | flags]) + _encode_varint(len(body)) + body
+        with self._wlock:
+            if self.closed:
+                return
+            try:
+                self.sock.sendall(pkt)
+            except OSError:
+                self.closed = True
+
+    def deliver(self, topic: str, payload: bytes, qos: int, retain: bool) -> None:
+        body = _encode_str(topic.encode())
+        if qos > 0:
+            with self._wlock:
+                self._next_pid = self._next_pid % 0xFFFF + 1
+                pid = self._next_pid
+            body += struct.pack("!H", pid)
+        if self.v5:
+            body += b"\x00"  # no properties
+        body += payload
+        self.send(PUBLISH, (qos << 1) | (1 if retain else 0), body)
+
+    # -- input ----------------------------------------------------------------
+    def _recv_exact(self, n: int) -> Optional[bytes]:
+        buf = b""
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                return None
+            buf += chunk
+        return buf
+
+    def _recv_packet(self) -> Optional[tuple[int, int, bytes]]:
+        head = self._recv_exact(1)
+        if head is None:
+            return None
+        mult, length = 1, 0
+        while True:
+            b = self._recv_exact(1)
+            if b is None:
+                return None
+            length += (b[0] & 0x7F) * mult
+            if not b[0] & 0x80:
+                break
+            mult *= 128
+        body = self._recv_exact(length) if length else b""
+        if body is None:
+            return None
+        return head[0] >> 4, head[0] & 0x0F, body
+
+    def _skip_props(self, buf: bytes, pos: int) -> int:
+        if not self.v5:
+            return pos
+        n, pos = _decode_varint(buf, pos)
+        return pos + n
+
+    def run(self) -> None:
+        clean = False
+        try:
+            while not self.broker._stop.is_set():
+                pkt = self._recv_packet()
+                if pkt is None:
+                    break
+                ptype, flags, body = pkt
+                if ptype == CONNECT:
+                    self._on_connect(body)
+                elif ptype == PUBLISH:
+                    self._on_publish(flags, body)
+                elif ptype == SUBSCRIBE:
+                    self._on_subscribe(body)
+                elif ptype == UNSUBSCRIBE:
+                    self._on_unsubscribe(body)
+                elif ptype == PINGREQ:
+                    self.send(PINGRESP, 0, b"")
+                elif ptype == DISCONNECT:
+                    clean = True
+                    break
+                # PUBACK from clients needs no action (we do not retransmit)
+        except (OSError, IndexError, struct.error):
+            pass
+        finally:
+            self.closed = True
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.broker._drop_session(self, send_will=not clean)
+
+    def _on_connect(self, body: bytes) -> None:
+        _name, pos = _read_str(body, 0)
+        level = body[pos]
+        cflags = body[pos + 1]
+        pos += 4  # level, flags, keepalive
+        self.v5 = level == 5
+        pos = self._skip_props(body, pos)
+        cid, pos = _read_str(body, pos)
+        self.client_id = cid.decode(errors="ignore") or f"anon-{id(self):x}"
+        if cflags & 0x04:
+            pos = self._skip_props(body, pos)
+            w_topic, pos = _read_str(body, pos)
+            w_payload, pos = _read_str(body, pos)
+            self.will = (w_topic.decode(), w_payload, (cflags >> 3) & 0x03, bool(cflags & 0x20))
+        self.broker._register_session(self)
+        self.send(CONNACK, 0, b"\x00\x00\x00" if self.v5 else b"\x00\x00")
+
+    def _on_publish(self, flags: int, body: bytes) -> None:
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        topic, pos = _read_str(body, 0)
+        pid = None
+        if qos > 0:
+            (pid,) = struct.unpack_from("!H", body, pos)
+            pos += 2
+        pos = self._skip_props(body, pos)
+        self.broker.publish(topic.decode(errors="ignore"), body[pos:], qos=qos, retain=retain)
+        if pid is not None:
+            self.send(PUBACK, 0, struct.pack("!H", pid))
+
+    def _on_subscribe(self, body: bytes) -> None:
+        (pid,) = struct.unpack_from("!H", body, 0)
+        pos = self._skip_props(body, 2)
+        granted = []
+        new_filters = []
+        while pos < len(body):
+            f, pos = _read_str(body, pos)
+            opts = body[pos]
+            pos += 1
+            qos = min(opts & 0x03, 1)
+            self.subs[f.decode()] = qos
+            granted.append(qos)
+            new_filters.append((f.decode(), qos))
+        ack = struct.pack("!H", pid) + (b"\x00" if self.v5 else b"") + bytes(granted)
+        self.send(SUBACK, 0, ack)
+        for f, qos in new_filters:
+            for topic, (payload, rqos) in self.broker._retained_matching(f):
+                self.deliver(topic, payload, min(qos, rqos), retain=True)
+
+    def _on_unsubscribe(self, body: bytes) -> None:
+        (pid,) = struct.unpack_from("!H", body, 0)
+        pos = self._skip_props(body, 2)
+        n = 0
+        while pos < len(body):
+            f, pos = _read_str(body, pos)
+            self.subs.pop(f.decode(), None)
+            n += 1
+        ack = struct.pack("!H", pid)
+        if self.v5:
+            ack += b"\x00" + bytes(n)
+        self.send(UNSUBACK, 0, ack)
+
+
+class LocalBroker:
+    """
+    Minimal in-process MQTT broker for tests and benchmarks.
+
+    Supports MQTT 3.1.1 and 5.0 clients (paho), QoS 0/1 (QoS 2 is downgraded),
+    retained messages, wildcards, and LWT. No auth, no persistence.
+
+    In-process code (simulated nodes) can use publish()/subscribe() directly
+    without a socket.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self._server: Optional[socket.socket] = None
+        self._accept_thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.RLock()
+        self._sessions: dict[str, _Session] = {}
+        self._retained: dict[str, tuple[bytes, int]] = {}
+        self._internal: list[tuple[str, Callable[[str, bytes], None]]] = []
+        self.messages_routed = 0
+
+    # -- lifecycle ------------------------------------------------------------
+    def start(self) -> "LocalBroker":
+        if self._server is not None:
+            return self
+        self._stop.clear()
+        srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        srv.bind((self.host, self.port))
+        srv.listen(64)
+        srv.settimeout(0.2)
+        self.port = srv.getsockname()[1]
+        self._server = srv
+        self._accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._accept_thread.start()
+        print(f"[broker] Local broker listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self) -> None:
+        if self._server is None:
+            return
+        self._stop.set()
+        if self._accept_thread is not None:
+            self._accept_thread.join(timeout=2.0)
+        try:
+            self._server.close()
+        except OSError:
+            pass
+        self._server = None
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for sess in sessions:
+            sess.closed = True
+            try:
+                sess.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        print("[broker] Local broker stopped.")
+
+    def __enter__(self) -> "LocalBroker":
+        return self.start()
+
+    def __exit__(self, *_exc) -> None:
+        self.stop()
+
+    def _accept_loop(self) -> None:
+        assert self._server is not None
+        while not self._stop.is_set():
+            try:
+                sock, _addr = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sess = _Session(self, sock)
+            threading.Thread(target=sess.run, daemon=True).start()
+
+    # -- sessions -------------------------------------------------------------
+    def _register_session(self, sess: _Session) -> None:
+        with self._lock:
+            old = self._sessions.get(sess.client_id)
+            self._sessions[sess.client_id] = sess
+        if old is not None and old is not sess:
+            # session takeover: drop the old connection without its will
+            old.will = None
+            old.closed = True
+            try:
+                old.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _drop_session(self, sess: _Session, send_will: bool) -> None:
+        with self._lock:
+            if self._sessions.get(sess.client_id) is sess:
+                del self._sessions[sess.client_id]
+        if send_will and sess.will is not None and not self._stop.is_set():
+            topic, payload, qos, retain = sess.will
+            self.publish(topic, payload, qos=qos, retain=retain)
+
+    def _retained_matching(self, topic_filter: str) -> list[tuple[str, tuple[bytes, int]]]:
+        with self._lock:
+            return [(t, v) for t, v in self._retained.items() if topic_matches(topic_filter, t)]
+
+    # -- routing --------------------------------------------------------------
+    def publish(self, topic: str, payload: bytes | str, qos: int = 0, retain: bool = False) -> None:
+        """Route a message to every matching subscriber (socket or in-process)."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        qos = min(qos, 1)
+        with self._lock:
+            if retain:
+                if payload:
+                    self._retained[topic] = (payload, qos)
+                else:
+                    self._retained.pop(topic, None)
+            targets = []
+            for sess in self._sessions.values():
+                best = -1
+                for f, sq in sess.subs.items():
+                    if sq > best and topic_matches(f, topic):
+                        best = sq
+                if best >= 0:
+                    targets.append((sess, min(best, qos)))
+            internal = [cb for f, cb in self._internal if topic_matches(f, topic)]
+            self.messages_routed += 1
+        for sess, q in targets:
+            sess.deliver(topic, payload, q, retain=False)
+        for cb in internal:
+            try:
+                cb(topic, payload)
+            except Exception as e:
+                print(f"[broker] In-process subscriber failed on {topic}: {e}")
+
+    def subscribe(self, topic_filter: str, callback: Callable[[str, bytes], None]) -> None:
+        """In-process subscription; retained matches are delivered immediately."""
+        with self._lock:
+            self._internal.append((topic_filter, callback))
+        for topic, (payload, _q) in self._retained_matching(topic_filter):
+            callback(topic, payload)
+
+    def unsubscribe(self, callback: Callable[[str, bytes], None]) -> None:
+        with self._lock:
+            self._internal = [(f, cb) for f, cb in self._internal if cb is not callback]
+
+    def retained(self, topic: str) -> Optional[str]:
+        """Current retained payload of a topic (decoded), or None."""
+        with self._lock:
+            item = self._retained.get(topic)
+        return None if item is None else item[0].decode(errors="ignore")
+
+
+# -----------------------------------------------------------------------------
+# Simulated ESP32 nodes
+# -----------------------------------------------------------------------------
+class _SimNode:
+    """
+    Base for simulated nodes. Publishes retained ONLINE/OFFLINE on <base>/status,
+    "1" on <base>/heartbeat, and runs tick() in a background thread.
+
+    time_scale multiplies every device-side duration (0.01 -> 100x faster).
+    """
+
+    tick_s: float = 0.02
+
+    def __init__(
+        self,
+        broker: LocalBroker,
+        base: str,
+        *,
+        time_scale: float = 1.0,
+        heartbeat_s: Optional[float] = 5.0,
+    ) -> None:
+        self.broker = broker
+        self.base = base.rstrip("/")
+        self.time_scale = time_scale
+        self.heartbeat_s = heartbeat_s
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.RLock()
+        self.commands: list[tuple[float, str, str]] = []  # (time, topic suffix, payload)
+
+    def _pub(self, suffix: str, payload: str, retain: bool = False) -> None:
+        self.broker.publish(f"{self.base}/{suffix}", payload, qos=1, retain=retain)
+
+    def _scaled(self, ms: float) -> float:
+        return ms / 1000.0 * self.time_scale
+
+    def start(self) -> "_SimNode":
+        self._stop.clear()
+        self._publish_initial()
+        self._pub("status", "ONLINE", retain=True)
+        self.broker.subscribe(f"{self.base}/#", self._on_raw)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.broker.unsubscribe(self._on_raw)
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self._pub("status", "OFFLINE", retain=True)
+
+    def _on_raw(self, topic: str, payload: bytes) -> None:
+        suffix = topic[len(self.base) + 1:]
+        if not (suffix == "cmd" or suffix.startswith("cmd/") or suffix == "schedule"):
+            return
+        text = payload.decode("utf-8", errors="ignore").strip()
+        with self._lock:
+            self.commands.append((time.time(), suffix, text))
+            self.on_command(suffix, text)
+
+    def _run(self) -> None:
+        next_hb = time.time()
+        while not self._stop.is_set():
+            now = time.time()
+            if self.heartbeat_s and now >= next_hb:
+                self._pub("heartbeat", "1")
+                next_hb = now + self.heartbeat_s
+            with self._lock:
+                self.tick(now)
+            self._stop.wait(self.tick_s)
+
+    # hooks
+    def _publish_initial(self) -> None:
+        pass
+
+    def on_command(self, suffix: str, text: str) -> None:
+        pass
+
+    def tick(self, now: float) -> None:
+        pass
+
+
+class SimRelayNode(_SimNode):
+    """
+    Relay board (pumps / ultrasound / Biologic ports).
+
+      cmd/<n>   "ON" | "ON:<ms>" | "OFF"
+      state/<n> retained "ON"/"OFF" (published on every command / auto-off)
+      schedule  {"id", "repeat", "steps": [{"ch","on_ms"} | {"wait_ms"} | {"ch","off"}]}
+      schedule/done {"id", "status": "DONE"|"ABORTED"}
+    """
+
+    def __init__(self, broker: LocalBroker, base: str, count: int, **kw) -> None:
+        super().__init__(broker, base, **kw)
+        self.count = count
+        self.state = {i: False for i in range(1, count + 1)}
+        self._auto_off: dict[int, float] = {}
+        self._sched_threads: list[threading.Thread] = []
+
+    def _set(self, ch: int, on: bool) -> None:
+        self.state[ch] = on
+        if not on:
+            self._auto_off.pop(ch, None)
+        self._pub(f"state/{ch}", "ON" if on else "OFF", retain=True)
+
+    def _publish_initial(self) -> None:
+        for ch in self.state:
+            self._pub(f"state/{ch}", "OFF", retain=True)
+
+    def on_command(self, suffix: str, text: str) -> None:
+        if suffix == "schedule":
+            self._start_schedule(text)
+            return
+        try:
+            ch = int(suffix.split("/", 1)[1])
+        except (IndexError, ValueError):
+            return
+        if ch not in self.state:
+            return
+        cmd = text.upper()
+        if cmd == "ON":
+            self._set(ch, True)
+        elif cmd.startswith("ON:"):
+            try:
+                ms = int(cmd[3:])
+            except ValueError:
+                return
+            self._set(ch, True)
+            self._auto_off[ch] = time.time() + self._scaled(ms)
+        elif cmd == "OFF":
+            self._set(ch, False)
+
+    def tick(self, now: float) -> None:
+        for ch, t_off in list(self._auto_off.items()):
+            if now >= t_off:
+                self._set(ch, False)
+
+    def _start_schedule(self, text: str) -> None:
+        try:
+            sched = json.loads(text)
+        except ValueError:
+            return
+        t = threading.Thread(target=self._run_schedule, args=(sched,), daemon=True)
+        self._sched_threads.append(t)
+        t.start()
+
+    def _run_schedule(self, sched: dict) -> None:
+        status = "DONE"
+        for _ in range(int(sched.get("repeat", 1))):
+            for step in sched.get("steps", []):
+                if self._stop.is_set():
+                    status = "ABORTED"
+                    break
+                if "wait_ms" in step:
+                    self._stop.wait(self._scaled(step["wait_ms"]))
+                elif "on_ms" in step:
+                    with self._lock:
+                        self._set(int(step["ch"]), True)
+                    self._stop.wait(self._scaled(step["on_ms"]))
+                    with self._lock:
+                        self._set(int(step["ch"]), False)
+                elif step.get("off"):
+                    with self._lock:
+                        self._set(int(step["ch"]), False)
+            if status != "DONE":
+                break
+        self._pub("schedule/done", json.dumps({"id": sched.get("id"), "status": status}))
+
+
+class SimHeatNode(_SimNode):
+    """
+    Dual SSR heater with thermistors and a first-order thermal model.
+
+      cmd/<n>  ON | OFF | PWM:<0-100> | SET:<C> | PID:ON | PID:OFF | GET
+      state/<n> retained ON/OFF, set/<n> retained setpoint, pwm/<n> retained duty
+      temp/<n>  temperature, on GET and every temp_period_s
+    """
+
+    def __init__(
+        self,
+        broker: LocalBroker,
+        base: str,
+        count: int,
+        *,
+        ambient_c: float = 22.0,
+        max_rise_c: float = 80.0,
+        tau_s: float = 60.0,
+        temp_period_s: float = 1.0,
+        **kw,
+    ) -> None:
+        super().__init__(broker, base, **kw)
+        self.count = count
+        self.ambient_c = ambient_c
+        self.max_rise_c = max_rise_c
+        self.tau_s = tau_s
+        self.temp_period_s = temp_period_s
+        chans = range(1, count + 1)
+        self.temp = {i: ambient_c for i in chans}
+        self.on = {i: False for i in chans}
+        self.pwm = {i: 0.0 for i in chans}
+        self.setpoint = {i: ambient_c for i in chans}
+        self.pid = {i: False for i in chans}
+        self._last_tick = time.time()
+        self._next_temp = 0.0
+
+    def _publish_initial(self) -> None:
+        for ch in self.temp:
+            self._pub(f"state/{ch}", "OFF", retain=True)
+            self._pub(f"pwm/{ch}", "0", retain=True)
+
+    def _duty(self, ch: int) -> float:
+        if self.pid[ch]:
+            # ideal controller: duty that holds the setpoint, saturated
+            need = (self.setpoint[ch] - self.ambient_c) / self.max_rise_c * 100.0
+            err = self.setpoint[ch] - self.temp[ch]
+            return max(0.0, min(100.0, need + 20.0 * err))
+        return self.pwm[ch] if self.on[ch] or self.pwm[ch] > 0 else 0.0
+
+    def on_command(self, suffix: str, text: str) -> None:
+        try:
+            ch = int(suffix.split("/", 1)[1])
+        except (IndexError, ValueError):
+            return
+        if ch not in self.temp:
+            return
+        cmd = text.upper()
+        if cmd == "ON":
+            self.on[ch] = True
+            self.pwm[ch] = 100.0
+            self._pub(f"state/{ch}", "ON", retain=True)
+        elif cmd == "OFF":
+            self.on[ch] = False
+            self.pid[ch] = False
+            self.pwm[ch] = 0.0
+            self._pub(f"state/{ch}", "OFF", retain=True)
+        elif cmd.startswith("PWM:"):
+            try:
+                self.pwm[ch] = max(0.0, min(100.0, float(cmd[4:])))
+            except ValueError:
+                return
+            self._pub(f"pwm/{ch}", f"{self.pwm[ch]:.0f}", retain=True)
+        elif cmd.startswith("SET:"):
+            try:
+                self.setpoint[ch] = float(cmd[4:])
+            except ValueError:
+                return
+            self._pub(f"set/{ch}", f"{self.setpoint[ch]:.1f}", retain=True)
+        elif cmd == "PID:ON":
+            self.pid[ch] = True
+            self.on[ch] = True
+            self._pub(f"state/{ch}", "ON", retain=True)
+        elif cmd == "PID:OFF":
+            self.pid[ch] = False
+        elif cmd == "GET":
+            self._pub(f"temp/{ch}", f"{self.temp[ch]:.2f}")
+
+    def tick(self, now: float) -> None:
+        dt = now - self._last_tick
+        self._last_tick = now
+        tau = max(1e-6, self.tau_s * self.time_scale)
+        for ch in self.temp:
+            target = self.ambient_c + self._duty(ch) / 100.0 * self.max_rise_c
+            self.temp[ch] += (target - self.temp[ch]) * min(1.0, dt / tau)
+        if self.temp_period_s and now >= self._next_temp:
+            self._next_temp = now + self.temp_period_s * self.time_scale
+            for ch in self.temp:
+                self._pub(f"temp/{ch}", f"{self.temp[ch]:.2f}")
+
+
+class SimPhNode(_SimNode):
+    """
+    pH probe node.
+
+      cmd  START:<ms> | STOP | ONESHOT | <raw passthrough>
+      ph   reading, e.g. "7.03"
+      reply passthrough replies ("*OK" style)
+    """
+
+    def __init__(self, broker: LocalBroker, base: str, *, ph_value: float = 7.0, **kw) -> None:
+        super().__init__(broker, base, **kw)
+        self.ph_value = ph_value
+        self._poll_s: Optional[float] = None
+        self._next_poll = 0.0
+
+    def _reading(self) -> None:
+        self._pub("ph", f"{self.ph_value + random.uniform(-0.02, 0.02):.2f}")
+
+    def on_command(self, suffix: str, text: str) -> None:
+        if suffix != "cmd":
+            return
+        cmd = text.strip()
+        if cmd.upper().startswith("START:"):
+            try:
+                self._poll_s = self._scaled(int(cmd[6:]))
+            except ValueError:
+                return
+            self._next_poll = 0.0
+        elif cmd.upper() == "STOP":
+            self._poll_s = None
+        elif cmd.upper() == "ONESHOT":
+            self._reading()
+        else:
+            self._pub("reply", f"*OK {cmd}")
+
+    def tick(self, now: float) -> None:
+        if self._poll_s is not None and now >= self._next_poll:
+            self._next_poll = now + self._poll_s
+            self._reading()
+
+
+class SimReactorNode(_SimNode):
+    """
+    Reactor + furnace valves on a quad relay.
+
+      cmd/Reactor, cmd/Furnace  OPEN | CLOSE  (pulsed actuator)
+      cmd                       RESET -> both Closed
+      state/Reactor, state/Furnace retained "Open"/"Closed", published when the pulse ends
+    """
+
+    def __init__(self, broker: LocalBroker, base: str, *, reactor_pulse_ms: int = 10000,
+                 furnace_pulse_ms: int = 6000, **kw) -> None:
+        super().__init__(broker, base, **kw)
+        self.pulse_ms = {"Reactor": reactor_pulse_ms, "Furnace": furnace_pulse_ms}
+        self.state = {"Reactor": "Closed", "Furnace": "Closed"}
+        self._pending: dict[str, tuple[float, str]] = {}
+
+    def _publish_initial(self) -> None:
+        for which, val in self.state.items():
+            self._pub(f"state/{which}", val, retain=True)
+
+    def _actuate(self, which: str, target: str) -> None:
+        self._pending[which] = (time.time() + self._scaled(self.pulse_ms[which]), target)
+
+    def on_command(self, suffix: str, text: str) -> None:
+        cmd = text.upper()
+        if suffix == "cmd" and cmd == "RESET":
+            for which in self.state:
+                self._actuate(which, "Closed")
+        elif suffix in ("cmd/Reactor", "cmd/Furnace"):
+            which = suffix.split("/", 1)[1]
+            if cmd == "OPEN":
+                self._actuate(which, "Open")
+            elif cmd == "CLOSE":
+                self._actuate(which, "Closed")
+
+    def tick(self, now: float) -> None:
+        for which, (t_done, target) in list(self._pending.items()):
+            if now >= t_done:
+                del self._pending[which]
+                self.state[which] = target
+                self._pub(f"state/{which}", target, retain=True)
+
+
+# -----------------------------------------------------------------------------
+# Whole lab in one call
+# -----------------------------------------------------------------------------
+class SimLab:
+    """
+    LocalBroker plus one simulated node per device, on the same base topics as
+    the iot_mqtt.py example (pumps/01, ultra/01, heat/01, ph/01, bio/01, react/01).
+
+        with SimLab(time_scale=0.01) as lab:
+            pumps = PumpMQTT(broker="127.0.0.1", port=lab.port, base_topic="pumps/01")
+    """
+
+    def __init__(self, *, port: int = 0, time_scale: float = 1.0, heartbeat_s: Optional[float] = 5.0) -> None:
+        from iot_mqtt import BIO_COUNT, HEAT_COUNT, PUMP_COUNT, ULTRA_COUNT
+
+        self.broker = LocalBroker(port=port)
+        kw = dict(time_scale=time_scale, heartbeat_s=heartbeat_s)
+        self.pumps = SimRelayNode(self.broker, "pumps/01", PUMP_COUNT, **kw)
+        self.ultra = SimRelayNode(self.broker, "ultra/01", ULTRA_COUNT, **kw)
+        self.heat = SimHeatNode(self.broker, "heat/01", HEAT_COUNT, **kw)
+        self.ph = SimPhNode(self.broker, "ph/01", **kw)
+        self.bio = SimRelayNode(self.broker, "bio/01", BIO_COUNT, **kw)
+        self.reactor = SimReactorNode(self.broker, "react/01", **kw)
+        self.nodes: list[_SimNode] = [self.pumps, self.ultra, self.heat, self.ph, self.bio, self.reactor]
+
+    @property
+    def port(self) -> int:
+        return self.broker.port
+
+    def start(self) -> "SimLab":
+        self.broker.start()
+        for node in self.nodes:
+            node.start()
+        return self
+
+    def stop(self) -> None:
+        for node in self.nodes:
+            node.stop()
+        self.broker.stop()
+
+    def __enter__(self) -> "SimLab":
+        return self.start()
+
+    def __exit__(self, *_exc) -> None:
+        self.stop()
@@ -1,12 +1,28 @@
 import requests
-import json
+import contextlib
 import logging
+import threading
+import time
 from typing import Literal, Union
 
+from liquid_ledger import LiquidLedger
+from tip_inventory import TipInventory
+from labware_registry import LabwareNameError, LabwareRegistry, definition_hash, definition_uri, load_deck
+from command_recorder import CommandRecorder
+from travel_planner import TravelPlanner
+from command_codec import COMMAND_TEMPLATES, LazyText, dumps, loads, parse_command_response
+
 # from prefect import task
 
 LOGGER = logging.getLogger(__name__)
 
+# commands that commandBatch() queues without waiting for each one
+BATCHABLE_COMMANDS = ("pickUpTip", "aspirate", "aspirateInPlace", "dispense", "blowout", "moveToWell", "dropTip",
+                      "dropTipInPlace", "moveToAddressableArea", "moveToAddressableAreaForDropTip")
+
+# shared by loadDeck() so labware/ is parsed and validated once per process and robot type
+_REGISTRIES = {}  # robot type -> LabwareRegistry
+
 class opentronsClient:
     '''
     each object will represent a single experiment
@@ -15,7 +31,11 @@ class opentronsClient:
     def __init__(self,
                  strRobotIP: str,
                  dicHeaders: dict = {"opentrons-version": "*"},
-                 strRobot: Literal["flex","ot2"] = "ot2"):
+                 strRobot: Literal["flex","ot2"] = "ot2",
+                 strRunID: str = None,
+                 boolStrictVolumes: bool = False,
+                 intPoolSize: int = 4,
+                 boolPlanTravel: bool = False):
         '''
         initializes the object with the robot IP and headers
 
@@ -27,6 +47,23 @@ class opentronsClient:
         dicHeaders: dict
             the headers to be used in the requests
 
+        strRunID: str
+            ID of an existing run to re-attach to (e.g. after a notebook crash);
+            labware and pipettes already loaded in that run are restored
+            default: None (create a new run)
+
+        boolStrictVolumes: bool
+            raise LiquidVolumeError on tracked over/underflow instead of logging a warning
+            default: False
+
+        intPoolSize: int
+            keep-alive connections kept open to this robot (one requests.Session per client)
+            default: 4
+
+        boolPlanTravel: bool
+            let moveToWell travel between labware at the lowest collision-free height (travel_planner.py)
+            default: False
+
         returns
         ----------
         None
@@ -37,11 +74,37 @@ class opentronsClient:
         self.runID = None
         self.commandURL = None
 
+        # one connection pool per robot; requests reuse keep-alive connections
+        self.session = requests.Session()
+        objAdapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=intPoolSize)
+        self.session.mount("http://", objAdapter)
+
         # *** NEED TO ADD FIXED TRASH TO LABWARE BY DEFAULT ***
         self.labware = {}#{"fixed-trash": {'id': 'fixed-trash', 'slot': 12}}
 
         self.pipettes = {}
-        self.__initalizeRun()
+
+        # volume per (labware, well), updated by aspirate / dispense
+        self.ledger = LiquidLedger(strict=boolStrictVolumes)
+        # tips left per tip rack, advanced by pickUpTip / dropTip
+        self.tips = TipInventory()
+        # custom labware definitions uploaded to this run: URI -> content hash
+        self.labwareDefinitions = {}
+        self.__definitionLock = threading.Lock()
+        # every accepted command, for export as a protocol (command_recorder.py)
+        self.recorder = CommandRecorder()
+        # deck map for travel heights, and the last (labware ID, well, x, y) per pipette ID
+        self.travel = TravelPlanner(strRobot, enabled=boolPlanTravel)
+        self.__dicPipetteLocation = {}
+        # air gap volume currently held per pipette (airGap), not booked as liquid
+        self.__dicAirGap = {}
+        # command IDs queued inside commandBatch(), None outside a batch
+        self.__lstBatch = None
+
+        if strRunID is None:
+            self.__initalizeRun()
+        else:
+            self.__attachRun(strRunID)
 
     # @task
     def __initalizeRun(self):
@@ -59,25 +122,252 @@ class opentronsClient:
 
         strRunURL = f"http://{self.robotIP}:31950/runs"
         # create a new run
-        response = requests.post(url=strRunURL,
+        response = self.session.post(url=strRunURL,
                                  headers=self.headers, 
                                  timeout=30
                                  )
 
         if response.status_code == 201:
-            dicResponse = json.loads(response.text)
+            dicResponse = loads(response.content)
             # get the run ID
             self.runID = dicResponse['data']['id']
             # setup command endpoints
             self.commandURL = strRunURL + f"/{self.runID}/commands"
 
             # LOG - info
-            LOGGER.info(f"New run created with ID: {self.runID}")
-            LOGGER.info(f"Command URL: {self.commandURL}")
+            LOGGER.info("New run created with ID: %s", self.runID)
+            LOGGER.info("Command URL: %s", self.commandURL)
 
         else:
             raise Exception(f"Failed to create a new run.\nError code: {response.status_code}\n Error message: {response.text}")
         
+    def __attachRun(self, strRunID: str):
+        '''
+        re-attaches to an existing run and rebuilds the labware/pipette tables and the travel deck map from it
+
+        arguments
+        ----------
+        strRunID: str
+            the ID of the run
+
+        returns
+        ----------
+        None
+        '''
+
+        strRunURL = f"http://{self.robotIP}:31950/runs"
+        response = self.session.get(url=f"{strRunURL}/{strRunID}",
+                                headers=self.headers,
+                                timeout=30
+                                )
+
+        if response.status_code != 200:
+            raise Exception(f"Failed to attach to run {strRunID}.\nError code: {response.status_code}\n Error message: {response.text}")
+
+        dicRun = loads(response.content)['data']
+        if dicRun.get('status') in ("stopped", "failed", "succeeded"):
+            raise Exception(f"Run {strRunID} is {dicRun['status']} and can not accept commands.")
+
+        self.runID = strRunID
+        self.commandURL = strRunURL + f"/{self.runID}/commands"
+
+        # geometry of everything already loaded, keyed by URI, for the travel planner
+        dicDefinitions = self.__getLoadedDefinitions()
+
+        # same identifiers as loadLabware / loadPipette
+        for dicLabware in dicRun.get('labware', []):
+            strSlot = dicLabware.get('location', {}).get('slotName')
+            if strSlot is None:
+                # on a module or another labware: height unknown, travel falls back to the robot's arc
+                self.travel.add_labware(dicLabware['id'], dicLabware['loadName'], None, None)
+                continue
+            intSlot = int(strSlot) if strSlot.isdigit() else strSlot
+            self.labware[dicLabware['loadName'] + "_" + str(strSlot)] = {"id": dicLabware['id'],
+                                                                        "slot": intSlot,
+                                                                        "loadName": dicLabware['loadName'],
+                                                                        "definitionUri": dicLabware.get('definitionUri')}
+            self.travel.add_labware(dicLabware['id'], dicLabware['loadName'] + "_" + str(strSlot), intSlot,
+                                    dicDefinitions.get(dicLabware.get('definitionUri')))
+        for dicPipette in dicRun.get('pipettes', []):
+            self.pipettes[dicPipette['pipetteName']] = {"id": dicPipette['id'], "mount": dicPipette['mount']}
+        for strName, dicItem in list(self.labware.items()) + list(self.pipettes.items()):
+            self.recorder.name_id(dicItem['id'], strName)
+
+        # LOG - info
+        LOGGER.info("Attached to run %s (%s labware, %s pipettes)", self.runID, len(self.labware), len(self.pipettes))
+
+    def __getLoadedDefinitions(self):
+        '''
+        gets the definitions of the labware loaded in the run; custom ones are
+        remembered as uploaded so uploadLabwareDefinition does not post them again
+
+        arguments
+        ----------
+        None
+
+        returns
+        ----------
+        dicDefinitions: dict
+            URI -> labware definition (empty if the robot does not report them)
+        '''
+
+        response = self.session.get(url=f"http://{self.robotIP}:31950/runs/{self.runID}/loaded_labware_definitions",
+                                headers=self.headers,
+                                timeout=30
+                                )
+
+        if response.status_code != 200:
+            # LOG - warning
+            LOGGER.warning("No labware definitions for run %s (error code %s); travel planning falls back to the robot's arc",
+                           self.runID, response.status_code)
+            return {}
+
+        dicDefinitions = {}
+        for dicDefinition in loads(response.content)['data']:
+            strLabwareURI = definition_uri(dicDefinition)
+            dicDefinitions[strLabwareURI] = dicDefinition
+            if dicDefinition.get('namespace') != "opentrons":
+                self.labwareDefinitions[strLabwareURI] = definition_hash(dicDefinition)
+        return dicDefinitions
+
+    def __postCommand(self, dicCommand: dict = None, **kwargs):
+        '''
+        posts a command to the run and records it in self.recorder if the robot accepted it
+
+        arguments
+        ----------
+        dicCommand: dict
+            the command dictionary the request body was encoded from
+            default: None (decoded from data)
+
+        **kwargs
+            passed to requests.post (url, headers, params, data, timeout)
+
+        returns
+        ----------
+        response: requests.Response
+        '''
+        if dicCommand is None:
+            dicCommand = loads(kwargs["data"])
+        strCommandType = dicCommand["data"]["commandType"]
+        boolBatched = self.__lstBatch is not None and strCommandType in BATCHABLE_COMMANDS
+        if boolBatched:
+            # queue only; commandBatch() waits once for the whole batch
+            kwargs["params"] = {k: v for k, v in kwargs.get("params", {}).items() if k != "waitUntilComplete"}
+
+        response = self.session.post(**kwargs)
+
+        if response.status_code == 201:
+            dicParams = dicCommand["data"].get("params", {})
+            if "pipetteId" in dicParams:
+                if "labwareId" in dicParams and "wellName" in dicParams:
+                    dicOffset = dicParams.get("wellLocation", {}).get("offset", {})
+                    self.__dicPipetteLocation[dicParams["pipetteId"]] = (dicParams["labwareId"], dicParams["wellName"],
+                                                                        float(dicOffset.get("x", 0)), float(dicOffset.get("y", 0)))
+                else:
+                    self.__dicPipetteLocation.pop(dicParams["pipetteId"], None)
+            dicHead = parse_command_response(response.content) if (boolBatched or self.recorder.enabled) else None
+            if boolBatched:
+                self.__lstBatch.append(dicHead['data']['id'])
+            # failed commands must not end up in an exported protocol
+            if self.recorder.enabled and dicHead['data'].get('status') != "failed":
+                dicResult = None
+                if strCommandType in ("loadLabware", "loadPipette", "loadModule"):
+                    dicResult = loads(response.content)['data'].get('result')
+                # a queued command's outcome is known once the batch is waited for
+                self.recorder.record(dicCommand, dicResult, strCommandID = dicHead['data']['id'] if boolBatched else None)
+        return response
+
+    @contextlib.contextmanager
+    def commandBatch(self,
+                     fltTimeout: float = 600):
+        '''
+        queues liquid-handling / movement commands issued inside the block without waiting
+        for each one, then waits once for all of them (use with "with oc.commandBatch(): ...")
+        nested batches join the outer one
+
+        arguments
+        ----------
+        fltTimeout: float
+            seconds to wait for the queued commands to finish
+            default: 600
+
+        returns
+        ----------
+        None
+        '''
+        if self.__lstBatch is not None:
+            yield
+            return
+
+        self.__lstBatch = []
+        try:
+            yield
+        finally:
+            lstBatch, self.__lstBatch = self.__lstBatch, None
+            if lstBatch:
+                self.waitForCommands(lstBatch, fltTimeout)
+
+    def waitForCommands(self,
+                        lstCommandIDs: list,
+                        fltTimeout: float = 600):
+        '''
+        waits until the queued commands have finished and raises if any of them failed
+
+        arguments
+        ----------
+        lstCommandIDs: list
+            IDs of queued commands, in the order they were queued
+
+        fltTimeout: float
+            seconds to wait
+            default: 600
+
+        returns
+        ----------
+        None
+        '''
+        strCommandsURL = f"http://{self.robotIP}:31950/runs/{self.runID}/commands"
+        fltDeadline = time.monotonic() + fltTimeout
+
+        # commands run in order: once the last one is done, the batch is done
+        strStatus = None
+        while strStatus not in ("succeeded", "failed"):
+            intWait_ms = int(max(1.0, min(30.0, fltDeadline - time.monotonic())) * 1000)
+            response = self.session.get(url = f"{strCommandsURL}/{lstCommandIDs[-1]}",
+                                        headers = self.headers,
+                                        params = {"waitUntilComplete": True, "timeout": intWait_ms},
+                                        timeout = intWait_ms / 1000 + 30)
+            if response.status_code != 200:
+                raise Exception(f"Failed to get command status.\nError code: {response.status_code}\n Error message: {response.text}")
+            strStatus = parse_command_response(response.content)['data']['status']
+            if strStatus not in ("succeeded", "failed") and time.monotonic() > fltDeadline:
+                raise Exception(f"Timed out waiting for {len(lstCommandIDs)} queued command(s).")
+
+        # one request for the statuses of the whole batch
+        response = self.session.get(url = strCommandsURL,
+                                    headers = self.headers,
+                                    params = {"pageLength": len(lstCommandIDs) + 10},
+                                    timeout = 30)
+        setBatch = set(lstCommandIDs)
+        lstFailed = []
+        if response.status_code == 200:
+            lstFailed = [dicCommand for dicCommand in loads(response.content)['data']
+                         if dicCommand['id'] in setBatch and dicCommand['status'] == "failed"]
+        elif strStatus == "failed":
+            lstFailed = [{"id": lstCommandIDs[-1], "commandType": "?", "error": {}}]
+
+        self.recorder.settle(lstCommandIDs, [dicCommand['id'] for dicCommand in lstFailed])
+
+        if lstFailed:
+            dicFailed = lstFailed[0]
+            # LOG - error
+            LOGGER.error("%s command(s) of the batch failed, first: %s", len(lstFailed), dicFailed)
+            raise Exception(f"Command batch failed.\nCommand: {dicFailed.get('commandType')} ({dicFailed['id']})\n Error: {dicFailed.get('error')}")
+
+        # LOG - debug
+        LOGGER.debug("Command batch of %s command(s) completed.", len(lstCommandIDs))
+
     def getRunInfo(self):
         '''
         gets the information for the current run
@@ -93,20 +383,20 @@ class opentronsClient:
         '''
 
         # LOG - info
-        LOGGER.info(f"Getting information for run: {self.runID}")
+        LOGGER.info("Getting information for run: %s", self.runID)
 
-        response = requests.get(
+        response = self.session.get(
             url = f"http://{self.robotIP}:31950/runs/{self.runID}",
             headers = self.headers
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 200:
-            jsonRunInfo = json.loads(response.text)
+            jsonRunInfo = loads(response.content)
             # LOG - info
-            LOGGER.info(f"Run information retrieved.")
+            LOGGER.info("Run information retrieved.")
 
         else:
             raise Exception(f"Failed to get run information.\nError code: {response.status_code}\n Error message: {response.text}")
@@ -163,72 +453,97 @@ class opentronsClient:
             }
         }
 
-        strCommand = json.dumps(dicCommand)
+        strCommand = dumps(dicCommand)
 
         # LOG - info
-        LOGGER.info(f"Loading labware: {strLabwareName} in slot: {intSlot}")
+        LOGGER.info("Loading labware: %s in slot: %s", strLabwareName, intSlot)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
-            data = strCommand, 
+            data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
-            dicResponse = json.loads(response.text)
+            dicResponse = loads(response.content)
             strLabwareID = dicResponse['data']['result']['labwareId']
             #strLabwareURi = dicResponse['data']['result']['labwareUri']
             strLabwareIdentifier_temp = strLabwareName + "_" + str(intSlot)
-            self.labware[strLabwareIdentifier_temp] = {"id": strLabwareID, "slot": intSlot}
+            dicDefinition = dicResponse['data']['result'].get('definition')
+            if dicDefinition:
+                strDefinitionUri = f"{dicDefinition['namespace']}/{dicDefinition['parameters']['loadName']}/{dicDefinition['version']}"
+            else:
+                strDefinitionUri = f"{strNamespace}/{strLabwareName}/{intVersion}"
+            self.recorder.name_id(strLabwareID, strLabwareIdentifier_temp)
+            self.travel.add_labware(strLabwareID, strLabwareIdentifier_temp, intSlot, dicDefinition)
+            # local index used by addLabwareOffsets (no run download needed)
+            self.labware[strLabwareIdentifier_temp] = {"id": strLabwareID,
+                                                       "slot": intSlot,
+                                                       "loadName": strLabwareName,
+                                                       "definitionUri": strDefinitionUri}
+            if dicDefinition:
+                self.ledger.register_labware(strLabwareIdentifier_temp, dicDefinition)
+                self.tips.register_rack(strLabwareIdentifier_temp, dicDefinition)
             # LOG - info
-            LOGGER.info(f"Labware loaded with name: {strLabwareName} and ID: {strLabwareID}")
+            LOGGER.info("Labware loaded with name: %s and ID: %s", strLabwareName, strLabwareID)
         else:
             raise Exception(f"Failed to load labware.\nError code: {response.status_code}\n Error message: {response.text}")
         
         return strLabwareIdentifier_temp
         
         
-    def loadCustomLabware(self,
-                          dicLabware: dict,
-                          intSlot: int,
-                          ):
+    def uploadLabwareDefinition(self,
+                                dicLabware: dict):
         '''
-        loads custom labware onto the robot
+        uploads a custom labware definition to the current run, once per run
+        (a definition with the same namespace/loadName/version and content is not re-posted;
+        a different definition under a URI already used in this run raises LabwareNameError)
 
         arguments
         ----------
         dicLabware: dict
-            the JSON object of the custom labware to be loaded (directly from opentrons labware definitions)
-
-        intSlot: int
-            the slot number where the labware is to be loaded
-
-        strLabwareID: str
-            the ID of the labware to be loaded - to be used for loading the same labware multiple times
-            default: None
+            the JSON object of the custom labware (directly from opentrons labware definitions)
 
         returns
         ----------
-        None
+        strLabwareURI: str
+            the definition URI (namespace/loadName/version)
         '''
 
+        strLabwareURI = definition_uri(dicLabware)
+        strHash = definition_hash(dicLabware)
+
+        with self.__definitionLock:
+            strUploaded = self.labwareDefinitions.get(strLabwareURI)
+            if strUploaded == strHash:
+                # LOG - debug
+                LOGGER.debug("Labware definition %s already uploaded to run %s", strLabwareURI, self.runID)
+                return strLabwareURI
+            if strUploaded is not None:
+                # the robot looks geometry up by URI: one of the two labware would get the other's
+                raise LabwareNameError(f"Run {self.runID} already has a different definition for {strLabwareURI}")
+            # claim the URI before posting, so a parallel upload of another definition fails
+            self.labwareDefinitions[strLabwareURI] = strHash
+        self.recorder.add_definition(dicLabware)
+
         dicCommand = {'data' : dicLabware}
 
-        strCommand = json.dumps(dicCommand)
+        strCommand = dumps(dicCommand)
 
         # LOG - info
-        LOGGER.info(f"Loading custom labware: {dicLabware['parameters']['loadName']} in slot: {intSlot}")
+        LOGGER.info("Uploading labware definition: %s", strLabwareURI)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
-        response = requests.post(
+        response = self.session.post(
             url = f"http://{self.robotIP}:31950/runs/{self.runID}/labware_definitions",
             headers = self.headers,
             data = strCommand, 
@@ -236,22 +551,89 @@ class opentronsClient:
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
-            # LOG - info
-            LOGGER.info(f"Custome labware {dicLabware['parameters']['loadName']} loaded in slot: {intSlot} successfully.")
-            # load the labware
-            strLabwareIdentifier_temp = self.loadLabware(intSlot = intSlot,
-                                                         strLabwareName = dicLabware['parameters']['loadName'],
-                                                         strNamespace = dicLabware['namespace'],
-                                                         intVersion = dicLabware['version'],
-                                                         strIntent = "setup"
-                                                         )
-            return strLabwareIdentifier_temp
+            return strLabwareURI
         else:
+            with self.__definitionLock:
+                self.labwareDefinitions.pop(strLabwareURI, None)
             raise Exception(f"Failed to load custom labware.\nError code: {response.status_code}\n Error message: {response.text}")
 
+    def loadCustomLabware(self,
+                          dicLabware: dict,
+                          intSlot: int,
+                          ):
+        '''
+        loads custom labware onto the robot
+
+        arguments
+        ----------
+        dicLabware: dict
+            the JSON object of the custom labware to be loaded (directly from opentrons labware definitions)
+
+        intSlot: int
+            the slot number where the labware is to be loaded
+
+        returns
+        ----------
+        strLabwareIdentifier_temp: str
+            the identifier of the labware that was loaded
+        '''
+
+        # LOG - info
+        LOGGER.info("Loading custom labware: %s in slot: %s", dicLabware['parameters']['loadName'], intSlot)
+
+        self.uploadLabwareDefinition(dicLabware)
+
+        # load the labware
+        strLabwareIdentifier_temp = self.loadLabware(intSlot = intSlot,
+                                                     strLabwareName = dicLabware['parameters']['loadName'],
+                                                     strNamespace = dicLabware['namespace'],
+                                                     intVersion = dicLabware['version'],
+                                                     strIntent = "setup"
+                                                     )
+        self.ledger.register_labware(strLabwareIdentifier_temp, dicLabware)
+        self.travel.add_labware(self.labware[strLabwareIdentifier_temp]["id"], strLabwareIdentifier_temp, intSlot, dicLabware)
+        if strLabwareIdentifier_temp not in self.tips.racks():
+            self.tips.register_rack(strLabwareIdentifier_temp, dicLabware)
+        # LOG - info
+        LOGGER.info("Custom labware %s loaded in slot: %s successfully.", dicLabware['parameters']['loadName'], intSlot)
+        return strLabwareIdentifier_temp
+
+    def loadDeck(self,
+                 dicLayout: dict,
+                 objRegistry: LabwareRegistry = None,
+                 intMaxWorkers: int = 4):
+        '''
+        loads a whole deck layout in one call; custom definitions are validated
+        once (LabwareRegistry) and the distinct ones uploaded in parallel
+
+        arguments
+        ----------
+        dicLayout: dict
+            slot -> labware load name, definition file path or definition dict;
+            names not found in labware/ are loaded as standard opentrons labware
+
+        objRegistry: LabwareRegistry
+            registry to resolve names with (reuse one across runs to skip re-validation)
+            default: None (module-wide registry for this robot type)
+
+        intMaxWorkers: int
+            parallel definition uploads
+            default: 4
+
+        returns
+        ----------
+        dicIdentifiers: dict
+            slot -> labware identifier (as returned by loadLabware)
+        '''
+        if objRegistry is None:
+            objRegistry = _REGISTRIES.get(self.robotType)
+            if objRegistry is None:
+                objRegistry = _REGISTRIES[self.robotType] = LabwareRegistry(strRobot = self.robotType)
+        return load_deck(self, dicLayout, registry=objRegistry, max_workers=intMaxWorkers)
+
     def loadPipette(self,
                     strPipetteName: str,
                     strMount: str):
@@ -282,38 +664,40 @@ class opentronsClient:
             }
         }
 
-        strCommand = json.dumps(dicCommand)
+        strCommand = dumps(dicCommand)
 
         # LOG - info
-        LOGGER.info(f"Loading pipette: {strPipetteName} on mount: {strMount}")
+        LOGGER.info("Loading pipette: %s on mount: %s", strPipetteName, strMount)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # convert response to dictionary
-            dicResponse = json.loads(response.text)
+            dicResponse = loads(response.content)
             # if the response failed
             if dicResponse['data']['status'] == "failed":
                 # log the error
-                LOGGER.error(f"Failed to load pipette.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                LOGGER.error("Failed to load pipette.\nResponse error code: %s\n Error type: %s\n Error message: %s", dicResponse['data']['error']['errorCode'], dicResponse['data']['error']['errorType'], dicResponse['data']['error']['detail'])
                 # raise exception
-                raise Exception(f"Failed to load pipette.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                raise Exception(f"Failed to load pipette.\nResponse error code: {dicResponse['data']['error']['errorCode']}\n Error type: {dicResponse['data']['error']['errorType']}\n Error message: {dicResponse['data']['error']['detail']}")
             else:
                 strPipetteID = dicResponse['data']['result']['pipetteId']
                 self.pipettes[strPipetteName] = {"id": strPipetteID, "mount": strMount}
+                self.recorder.name_id(strPipetteID, strPipetteName)
                 # LOG - info
-                LOGGER.info(f"Pipette loaded with name: {strPipetteName} and ID: {strPipetteID}")
+                LOGGER.info("Pipette loaded with name: %s and ID: %s", strPipetteName, strPipetteID)
         else:
             raise Exception(
                 f"Failed to load pipette.\nError code: {response.status_code}\n Error message: {response.text}"
@@ -332,14 +716,14 @@ class opentronsClient:
         None
         '''
 
-        strCommand = json.dumps({"target": "robot"})
+        strCommand = dumps({"target": "robot"})
 
         # LOG - info
-        LOGGER.info(f"Homing the robot")
+        LOGGER.info("Homing the robot")
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
-        response = requests.post(
+        response = self.session.post(
             url = f"http://{self.robotIP}:31950/robot/home",
             headers = self.headers,
             data = strCommand,
@@ -347,10 +731,11 @@ class opentronsClient:
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
         if response.status_code == 200:
             # LOG - info
-            LOGGER.info(f"Robot homed successfully.")
+            LOGGER.info("Robot homed successfully.")
+            self.__dicPipetteLocation.clear()
         else:
             raise Exception(
                 f"Failed to home the robot.\nError code: {response.status_code}\n Error message: {response.text}"
@@ -364,7 +749,8 @@ class opentronsClient:
                   fltOffsetY: float = 0,
                   fltOffsetZ: float = 0,
                   strWellName: str = "A1",
-                  strIntent: str = "setup"
+                  strIntent: str = "setup",
+                  strTag: str = None
                   ):
         '''
         picks up a tip from a labware
@@ -401,6 +787,10 @@ class opentronsClient:
             the intent of the command
             default: "setup"
 
+        strTag: str
+            what the tip will be used for (e.g. solution name), for per_solution tip reuse
+            default: None
+
         returns
         ----------
         None
@@ -427,38 +817,79 @@ class opentronsClient:
             }
         }
 
-        jsonCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        jsonCommand = COMMAND_TEMPLATES["pickUpTip"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Picking up tip from labware: {strLabwareName}")
+        LOGGER.info("Picking up tip from labware: %s", strLabwareName)
         # LOG - debug
-        LOGGER.debug(f"Command: {jsonCommand}")
+        LOGGER.debug("Command: %s", jsonCommand)
 
-        jsonResponse = requests.post(
+        jsonResponse = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = jsonCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {jsonResponse.text}")
+        LOGGER.debug("Response: %s", LazyText(jsonResponse))
 
         if jsonResponse.status_code == 201:
             # convert response to dictionary
-            dicResponse = json.loads(jsonResponse.text)
+            dicResponse = parse_command_response(jsonResponse.content)
             if dicResponse['data']['status'] == "failed":
                 # log the error
-                LOGGER.error(f"Failed to pick up tip.\nResponse error code: {dicResponse['data']['error']['errorCode']}\n Error type: {dicResponse['data']['error']['errorType']}\n Error message: {dicResponse['data']['error']['detail']}")
+                LOGGER.error("Failed to pick up tip.\nResponse error code: %s\n Error type: %s\n Error message: %s", dicResponse['data']['error']['errorCode'], dicResponse['data']['error']['errorType'], dicResponse['data']['error']['detail'])
                 # raise exception
                 raise Exception(f"Failed to pick up tip.\nResponse error code: {dicResponse['data']['error']['errorCode']}\n Error type: {dicResponse['data']['error']['errorType']}\n Error message: {dicResponse['data']['error']['detail']}")
             else:
                 # LOG - info
-                LOGGER.info(f"Tip picked up from labware: {strLabwareName}, well: {strWellName}")
+                LOGGER.info("Tip picked up from labware: %s, well: %s", strLabwareName, strWellName)
+                self.tips.picked_up(strPipetteName, strLabwareName, strWellName, strTag)
         else:
             raise Exception(f"Failed to pick up tip.\nError code: {jsonResponse.status_code}\n Error message: {jsonResponse.text}")
-        
+
+    def pickUpNextTip(self,
+                      strPipetteName: str,
+                      strLabwareName: str = None,
+                      strTag: str = None,
+                      **kwargs):
+        '''
+        picks up the next available tip according to the tip inventory
+
+        arguments
+        ----------
+        strPipetteName: str
+            the name of the pipette to pick up the tip with
+
+        strLabwareName: str
+            tip rack to take from
+            default: None (first registered rack with tips left)
+
+        strTag: str
+            what the tip will be used for (e.g. solution name), for per_solution tip reuse
+            default: None
+
+        kwargs:
+            passed to pickUpTip (offsets, strIntent)
+
+        returns
+        ----------
+        (strLabwareName, strWellName): tuple
+            where the tip was picked up from
+        '''
+
+        strRack, strWell = self.tips.next_tip(strLabwareName, strTag)
+        self.pickUpTip(strLabwareName=strRack,
+                       strPipetteName=strPipetteName,
+                       strWellName=strWell,
+                       strTag=strTag,
+                       **kwargs)
+        return strRack, strWell
+
     def liquidProbe(self,
             strLabwareName: str,
             strPipetteName: str,
@@ -492,35 +923,37 @@ class opentronsClient:
             }
         }
 
-        jsonCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        jsonCommand = COMMAND_TEMPLATES["liquidProbe"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Picking up tip from labware: {strLabwareName}")
+        LOGGER.info("Picking up tip from labware: %s", strLabwareName)
         # LOG - debug
-        LOGGER.debug(f"Command: {jsonCommand}")
+        LOGGER.debug("Command: %s", jsonCommand)
 
-        jsonResponse = requests.post(
+        jsonResponse = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = jsonCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {jsonResponse.text}")
+        LOGGER.debug("Response: %s", LazyText(jsonResponse))
 
         if jsonResponse.status_code == 201:
             # convert response to dictionary
-            dicResponse = json.loads(jsonResponse.text)
+            dicResponse = parse_command_response(jsonResponse.content)
             if dicResponse['data']['status'] == "failed":
                 # log the error
-                LOGGER.error(f"Failed to pick up tip.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                LOGGER.error("Failed to pick up tip.\nResponse error code: %s\n Error type: %s\n Error message: %s", dicResponse['data']['error']['errorCode'], dicResponse['data']['error']['errorType'], dicResponse['data']['error']['detail'])
                 # raise exception
-                raise Exception(f"Failed to pick up tip.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                raise Exception(f"Failed to pick up tip.\nResponse error code: {dicResponse['data']['error']['errorCode']}\n Error type: {dicResponse['data']['error']['errorType']}\n Error message: {dicResponse['data']['error']['detail']}")
             else:
                 # LOG - info
-                LOGGER.info(f"Tip picked up from labware: {strLabwareName}, well: {strWellName}")
+                LOGGER.info("Tip picked up from labware: %s, well: %s", strLabwareName, strWellName)
         else:
             raise Exception(f"Failed to pick up tip.\nError code: {jsonResponse.status_code}\n Error message: {jsonResponse.text}")
 
@@ -545,29 +978,30 @@ class opentronsClient:
             }
         }
 
-        # dump to string
-        strCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        strCommand = COMMAND_TEMPLATES["moveToAddressableAreaForDropTip"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Disposing of held tip: {strPipetteName}")
+        LOGGER.info("Disposing of held tip: %s", strPipetteName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # LOG - info
-            LOGGER.info(f"Tip dropped into disposal: {strPipetteName}")
+            LOGGER.info("Tip dropped into disposal: %s", strPipetteName)
         else:
             raise Exception(f"Failed to drop tip.\nError code: {response.status_code}\n Error message: {response.text}")
 
@@ -597,29 +1031,30 @@ class opentronsClient:
             }
         }
 
-        # dump to string
-        strCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        strCommand = COMMAND_TEMPLATES["moveToAddressableArea"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Disposing of held tip: {strPipetteName}")
+        LOGGER.info("Disposing of held tip: %s", strPipetteName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # LOG - info
-            LOGGER.info(f"Tip dropped into disposal: {strPipetteName}")
+            LOGGER.info("Tip dropped into disposal: %s", strPipetteName)
         else:
             raise Exception(f"Failed to drop tip.\nError code: {response.status_code}\n Error message: {response.text}")
 
@@ -640,29 +1075,30 @@ class opentronsClient:
             }
         }
 
-        # dump to string
-        strCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        strCommand = COMMAND_TEMPLATES["dropTipInPlace"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Dropping tip in place: {strPipetteName}")
+        LOGGER.info("Dropping tip in place: %s", strPipetteName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # LOG - info
-            LOGGER.info(f"Tip dropped at current location")
+            LOGGER.info("Tip dropped at current location")
         else:
             raise Exception(f"Failed to drop tip in place.\nError code: {response.status_code}\n Error message: {response.text}")
 
@@ -736,6 +1172,7 @@ class opentronsClient:
         if boolDropInDisposal:
             self.__moveTipToDisposal(strPipetteName=strPipetteName, intSpeed=intSpeed, strIntent=strIntent)
             self.__dropTipInPlace(strPipetteName=strPipetteName, strIntent=strIntent, boolHomeAfter=boolHomeAfter)
+            self.tips.dropped(strPipetteName)
             return
 
         # Drop the tip in a labware well
@@ -760,37 +1197,39 @@ class opentronsClient:
             }
         }
 
-        # dump to string
-        strCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        strCommand = COMMAND_TEMPLATES["dropTip"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Dropping tip into labware: {strLabwareName}")
+        LOGGER.info("Dropping tip into labware: %s", strLabwareName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # convert response to dictionary
-            dicResponse = json.loads(response.text)
+            dicResponse = parse_command_response(response.content)
             if dicResponse['data']['status'] == "failed":
                 # log the error
-                LOGGER.error(f"Failed to drop tip.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                LOGGER.error("Failed to drop tip.\nResponse error code: %s\n Error type: %s\n Error message: %s", dicResponse['data']['error']['errorCode'], dicResponse['data']['error']['errorType'], dicResponse['data']['error']['detail'])
                 # raise exception
-                raise Exception(f"Failed to drop tip.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                raise Exception(f"Failed to drop tip.\nResponse error code: {dicResponse['data']['error']['errorCode']}\n Error type: {dicResponse['data']['error']['errorType']}\n Error message: {dicResponse['data']['error']['detail']}")
             else:
                 # LOG - info
-                LOGGER.info(f"Tip dropped into labware: {strLabwareName}, well: {strWellName}")
+                LOGGER.info("Tip dropped into labware: %s, well: %s", strLabwareName, strWellName)
+                self.tips.dropped(strPipetteName, strLabwareName, strWellName)
         else:
             raise Exception(f"Failed to drop tip.\nError code: {response.status_code}\n Error message: {response.text}")
 
@@ -854,6 +1293,9 @@ class opentronsClient:
         None
         '''
 
+        # refuse to aspirate more than the well holds (if its volume is tracked)
+        self.ledger.check_aspirate(strLabwareName, strWellName, intVolume)
+
         # make command dictionary
         dicCommand = {
             "data": {
@@ -867,45 +1309,47 @@ class opentronsClient:
                                    "y": fltOffsetY,
                                    "z": fltOffsetZ}
                     },
-                    "flowRate": str(fltFlowRate),
-                    "volume": str(intVolume),
+                    "flowRate": fltFlowRate,
+                    "volume": intVolume,
                     "pipetteId": self.pipettes[strPipetteName]["id"]
                 },
                 "intent": strIntent
             }
         }
 
-        # dump to string
-        strCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        strCommand = COMMAND_TEMPLATES["aspirate"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Aspirating from labware: {strLabwareName}, well: {strWellName}")
+        LOGGER.info("Aspirating from labware: %s, well: %s", strLabwareName, strWellName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # convert response to dictionary
-            dicResponse = json.loads(response.text)
+            dicResponse = parse_command_response(response.content)
             if dicResponse['data']['status'] == "failed":
                 # log the error
-                LOGGER.error(f"Failed to aspirate.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                LOGGER.error("Failed to aspirate.\nResponse error code: %s\n Error type: %s\n Error message: %s", dicResponse['data']['error']['errorCode'], dicResponse['data']['error']['errorType'], dicResponse['data']['error']['detail'])
                 # raise exception
-                raise Exception(f"Failed to aspirate.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                raise Exception(f"Failed to aspirate.\nResponse error code: {dicResponse['data']['error']['errorCode']}\n Error type: {dicResponse['data']['error']['errorType']}\n Error message: {dicResponse['data']['error']['detail']}")
             else:
                 # LOG - info
-                LOGGER.info(f"Aspiration successful.")
+                LOGGER.info("Aspiration successful.")
+                self.ledger.aspirated(strLabwareName, strWellName, intVolume, strPipetteName)
         else:
             raise Exception(
                 f"Failed to aspirate.\nError code: {response.status_code}\n Error message: {response.text}"
@@ -971,6 +1415,12 @@ class opentronsClient:
         None
         '''
 
+        # an air gap in the tip leaves first and is not liquid
+        fltLiquidVolume = max(0, intVolume - self.__dicAirGap.get(strPipetteName, 0))
+
+        # refuse to overflow the well (capacity from the labware definition)
+        self.ledger.check_dispense(strLabwareName, strWellName, fltLiquidVolume)
+
         # make command dictionary
         dicCommand = {
             "data": {
@@ -992,40 +1442,109 @@ class opentronsClient:
             }
         }
 
-        # dump to string
-        strCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        strCommand = COMMAND_TEMPLATES["dispense"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Dispensing into labware: {strLabwareName}, well: {strWellName}")
+        LOGGER.info("Dispensing into labware: %s, well: %s", strLabwareName, strWellName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # convert response to dictionary
-            dicResponse = json.loads(response.text)
+            dicResponse = parse_command_response(response.content)
             if dicResponse['data']['status'] == "failed":
                 # log the error
-                LOGGER.error(f"Failed to dispense.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                LOGGER.error("Failed to dispense.\nResponse error code: %s\n Error type: %s\n Error message: %s", dicResponse['data']['error']['errorCode'], dicResponse['data']['error']['errorType'], dicResponse['data']['error']['detail'])
                 # raise exception
-                raise Exception(f"Failed to dispense.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                raise Exception(f"Failed to dispense.\nResponse error code: {dicResponse['data']['error']['errorCode']}\n Error type: {dicResponse['data']['error']['errorType']}\n Error message: {dicResponse['data']['error']['detail']}")
             else:
                 # LOG - info
                 LOGGER.info("Dispense successful.")
+                self.__dicAirGap.pop(strPipetteName, None)
+                self.ledger.dispensed(strLabwareName, strWellName, fltLiquidVolume, strPipetteName=strPipetteName)
         else:
             raise Exception(f"Failed to dispense.\nError code: {response.status_code}\n Error message: {response.text}")
         
+    def airGap(self,
+               strPipetteName: str,
+               intVolume: int,                        # uL
+               fltFlowRate: float = 274.7,            # uL/s
+               strIntent: str = "setup"
+               ) -> None:
+        '''
+        aspirates air at the current position (move the tip above the liquid first, e.g. moveToWell(..., "top"));
+        the next dispense pushes the air out first and only the remainder is booked as liquid
+
+        arguments
+        ----------
+        strPipetteName: str
+            the name of the pipette
+
+        intVolume: int
+            the volume of air
+            units: uL
+
+        fltFlowRate: float
+            the flow rate of the plunger
+            units: uL/s
+            default: 274.7
+
+        returns
+        ----------
+        None
+        '''
+
+        dicCommand = {
+            "data": {
+                "commandType": "aspirateInPlace",
+                "params": {
+                    "flowRate": fltFlowRate,
+                    "volume": intVolume,
+                    "pipetteId": self.pipettes[strPipetteName]["id"]
+                },
+                "intent": strIntent
+            }
+        }
+
+        # encode with the pre-built template for this command type
+        strCommand = COMMAND_TEMPLATES["aspirateInPlace"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
+
+        # LOG - info
+        LOGGER.info("Air gap of %s uL on %s", intVolume, strPipetteName)
+        # LOG - debug
+        LOGGER.debug("Command: %s", strCommand)
+
+        response = self.__postCommand(
+            url = self.commandURL,
+            headers = self.headers,
+            params = {"waitUntilComplete": True},
+            data = strCommand,
+            dicCommand = dicCommand,
+            timeout=30
+        )
+
+        # LOG - debug
+        LOGGER.debug("Response: %s", LazyText(response))
+
+        if response.status_code == 201 and parse_command_response(response.content)['data'].get('status') != "failed":
+            self.__dicAirGap[strPipetteName] = self.__dicAirGap.get(strPipetteName, 0) + intVolume
+        else:
+            raise Exception(f"Failed to aspirate an air gap.\nError code: {response.status_code}\n Error message: {response.text}")
+
     def blowout(self,
                 strLabwareName: str,
                 strWellName: str,
@@ -1096,38 +1615,40 @@ class opentronsClient:
             }
         }
 
-        # dump to string
-        strCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        strCommand = COMMAND_TEMPLATES["blowout"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Blowing out from labware: {strLabwareName}, well: {strWellName}")
+        LOGGER.info("Blowing out from labware: %s, well: %s", strLabwareName, strWellName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # convert response to dictionary
-            dicResponse = json.loads(response.text)
+            dicResponse = parse_command_response(response.content)
             # if the response failed
             if dicResponse['data']['status'] == "failed":
                 # log the error
-                LOGGER.error(f"Failed to blowout.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                LOGGER.error("Failed to blowout.\nResponse error code: %s\n Error type: %s\n Error message: %s", dicResponse['data']['error']['errorCode'], dicResponse['data']['error']['errorType'], dicResponse['data']['error']['detail'])
                 # raise exception
-                raise Exception(f"Failed to blowout.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                raise Exception(f"Failed to blowout.\nResponse error code: {dicResponse['data']['error']['errorCode']}\n Error type: {dicResponse['data']['error']['errorType']}\n Error message: {dicResponse['data']['error']['detail']}")
             else:
                 # LOG - info
                 LOGGER.info("Blowout successful.")
+                self.__dicAirGap.pop(strPipetteName, None)
         else:
             raise Exception(f"Failed to blowout.\nError code: {response.status_code}\n Error message: {response.text}")
 
@@ -1140,7 +1661,9 @@ class opentronsClient:
                    fltOffsetY: float = 0,
                    fltOffsetZ: float = 0,
                    strIntent: str = "setup",
-                   intSpeed: int = 400   # mm/s
+                   intSpeed: int = 400,   # mm/s
+                   fltMinimumZHeight: float = None,
+                   boolForceDirect: bool = False
                    ):
         '''
         moves the pipette to a well
@@ -1176,60 +1699,98 @@ class opentronsClient:
             the intent of the command
             default: setup  
 
+        fltMinimumZHeight: float
+            lowest travel arc height (deck coordinates, mm)
+            default: None (planned by self.travel when enabled, else the robot's arc)
+
+        boolForceDirect: bool
+            move in a straight line without arcing
+            default: False
+
         returns
         ----------
         None
         '''
 
+        strPipetteID = self.pipettes[strPipetteName]["id"]
+        if fltMinimumZHeight is None and not boolForceDirect and self.travel.enabled:
+            objPlan = self.travel.plan(self.__dicPipetteLocation.get(strPipetteID),
+                                       self.labware[strLabwareName]["id"], strWellName, fltOffsetX, fltOffsetY)
+            if objPlan is not None and objPlan.direct:
+                tupFrom = self.__dicPipetteLocation[strPipetteID]
+                # LOG - debug
+                LOGGER.debug("Planned travel: %s", objPlan)
+                # straight up out of the source, across at the planned height, straight down
+                with self.commandBatch():
+                    self.moveToWell(objPlan.from_name, objPlan.from_well, strPipetteName, "top",
+                                    tupFrom[2], tupFrom[3], objPlan.z - objPlan.from_top,
+                                    strIntent, intSpeed, boolForceDirect=True)
+                    self.moveToWell(strLabwareName, strWellName, strPipetteName, "top",
+                                    fltOffsetX, fltOffsetY, objPlan.z - objPlan.to_top,
+                                    strIntent, intSpeed, boolForceDirect=True)
+                    self.moveToWell(strLabwareName, strWellName, strPipetteName, strOffsetStart,
+                                    fltOffsetX, fltOffsetY, fltOffsetZ,
+                                    strIntent, intSpeed, boolForceDirect=True)
+                return
+            if objPlan is not None:
+                fltMinimumZHeight = objPlan.minimum_z
+
+        dicParams = {
+            "speed": intSpeed,
+            "labwareId": self.labware[strLabwareName]["id"],
+            "wellName": strWellName,
+            "wellLocation": {
+                "origin": strOffsetStart,
+                "offset": {"x": fltOffsetX,
+                           "y": fltOffsetY,
+                           "z": fltOffsetZ},
+            },
+            "pipetteId": strPipetteID,
+        }
+        if fltMinimumZHeight is not None:
+            dicParams["minimumZHeight"] = fltMinimumZHeight
+        if boolForceDirect:
+            dicParams["forceDirect"] = True
+
         # make command dictionary
         dicCommand = {
             "data": {
                 "commandType": "moveToWell",
-                "params": {
-                    "speed": intSpeed,
-                    "labwareId": self.labware[strLabwareName]["id"],
-                    "wellName": strWellName,
-                    "wellLocation": {
-                        "origin": strOffsetStart,
-                        "offset": {"x": fltOffsetX,
-                                   "y": fltOffsetY,
-                                   "z": fltOffsetZ},
-                    },
-                    "pipetteId": self.pipettes[strPipetteName]["id"],
-                },
+                "params": dicParams,
                 "intent": strIntent,
             }
         }
 
-        # dump to string
-        strCommand = json.dumps(dicCommand)
+        # encode with the pre-built template for this command type
+        strCommand = COMMAND_TEMPLATES["moveToWell"].encode(dicCommand["data"]["params"], dicCommand["data"]["intent"])
 
         # LOG - info
-        LOGGER.info(f"Moving pipette to labware: {strLabwareName}, well: {strWellName}")
+        LOGGER.info("Moving pipette to labware: %s, well: %s", strLabwareName, strWellName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # convert response to dictionary
-            dicResponse = json.loads(response.text)
+            dicResponse = parse_command_response(response.content)
             # if the response failed
             if dicResponse['data']['status'] == "failed":
                 # log the error
-                LOGGER.error(f"Failed to move pipette.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                LOGGER.error("Failed to move pipette.\nResponse error code: %s\n Error type: %s\n Error message: %s", dicResponse['data']['error']['errorCode'], dicResponse['data']['error']['errorType'], dicResponse['data']['error']['detail'])
                 # raise exception
-                raise Exception(f"Failed to move pipette.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                raise Exception(f"Failed to move pipette.\nResponse error code: {dicResponse['data']['error']['errorCode']}\n Error type: {dicResponse['data']['error']['errorType']}\n Error message: {dicResponse['data']['error']['detail']}")
             else:
                 # LOG - info
                 LOGGER.info("Move successful.")
@@ -1261,7 +1822,7 @@ class opentronsClient:
         }
 
         # dump to string
-        strCommand = json.dumps(dicCommand)
+        strCommand = dumps(dicCommand)
 
         # LOG - info
         #! LOGGER.info(f"Openning the gripper")
@@ -1269,20 +1830,24 @@ class opentronsClient:
         #! LOGGER.debug(f"Command: {strCommand}")
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
+            # keep the local index current (offsets are applied per slot)
+            self.labware[strMovingLabware]["slot"] = self.labware[strDestinationLabware]["slot"]
+            self.travel.stack_labware(self.labware[strMovingLabware]["id"], self.labware[strDestinationLabware]["id"])
             # LOG - info
-            LOGGER.info(f"Moved labware successfully.")
+            LOGGER.info("Moved labware successfully.")
         else:
             raise Exception(
                 f"Failed to mve labware.\nError code: {response.status_code}\n Error message: {response.text}"
@@ -1301,32 +1866,33 @@ class opentronsClient:
         }
 
         # dump to string
-        strCommand = json.dumps(dicCommand)
+        strCommand = dumps(dicCommand)
 
         # LOG - info
-        LOGGER.info(f"Checking for tip on pipette {strPipetteName}")
+        LOGGER.info("Checking for tip on pipette %s", strPipetteName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # Check if request succeeded
-            if (data:=json.loads(response.text)['data'])["status"] == "succeeded":
-                LOGGER.info(f"No tip is present on {strPipetteName}.")
+            if (data:=parse_command_response(response.content)['data'])["status"] == "succeeded":
+                LOGGER.info("No tip is present on %s.", strPipetteName)
                 return False
             elif data['error']['errorType'] == 'TipAttachedError':
-                LOGGER.info(f"A tip is present on {strPipetteName}.")
+                LOGGER.info("A tip is present on %s.", strPipetteName)
                 return True
         else:
             raise Exception(
@@ -1351,14 +1917,14 @@ class opentronsClient:
             dicCommand['data']['params'].update({'force':fltGripForce})
 
         # dump to string
-        strCommand = json.dumps(dicCommand)
+        strCommand = dumps(dicCommand)
 
         # LOG - info
         # LOGGER.info(f"Closing the gripper{f" with {fltGripForce}N of force" if fltGripForce else ""}")
-        LOGGER.info(f"Closing the gripper{(' with ' + str(fltGripForce) + 'N of force') if fltGripForce else ''}")
+        LOGGER.info("Closing the gripper%s", (' with ' + str(fltGripForce) + 'N of force') if fltGripForce else '')
 
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # # make request
         # payload = {
@@ -1378,20 +1944,21 @@ class opentronsClient:
         
         # response = requests.post(url, headers=HEADERS, data=json.dumps(payload))
 
-        response = requests.post(
+        response = self.__postCommand(
             url = self.commandURL,#self.commandURL,
             headers = self.headers,
             params = {"waitUntilComplete": True},
             data = strCommand,
+            dicCommand = dicCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # LOG - info
-            LOGGER.info(f"Closed grip successfully.")
+            LOGGER.info("Closed grip successfully.")
         else:
             raise Exception(
                 f"Failed to close gripper.\nError code: {response.status_code}\n Error message: {response.text}"
@@ -1425,29 +1992,19 @@ class opentronsClient:
         None
         '''
 
-        # from the self.labware dictionary, get the labware ID
-        strLabwareID = self.labware[strLabwareName]["id"]
-
-        print(strLabwareID)
-
-        dicRunInfo = self.getRunInfo()
-        print(dicRunInfo)
-
-        # find the list of labware from the run info
-        lstLabware = dicRunInfo['data']['labware']
+        # definitionUri and slot come from the local labware index (filled by loadLabware)
+        dicLabware = self.labware[strLabwareName]
+        strDefinitionUri = dicLabware.get("definitionUri")
+        strSlot = str(dicLabware["slot"])
 
-        strDefinitionUri = None
-
-        # for every dictionary in the list of labware
-        for dicLabware_temp in lstLabware:
-            # if the labware ID matches the labware ID of the labware we are looking for
-            if dicLabware_temp['id'] == strLabwareID:
-                # get the definitionUri
-                strDefinitionUri = dicLabware_temp['definitionUri']
-                # get the slot
-                strSlot = dicLabware_temp['location']['slotName']
-    
-        print(strDefinitionUri)
+        # labware indexed without a URI: fall back to the run information
+        if strDefinitionUri is None:
+            dicRunInfo = self.getRunInfo()
+            for dicLabware_temp in dicRunInfo['data']['labware']:
+                if dicLabware_temp['id'] == dicLabware["id"]:
+                    strDefinitionUri = dicLabware_temp['definitionUri']
+                    strSlot = dicLabware_temp['location']['slotName']
+                    dicLabware["definitionUri"] = strDefinitionUri
 
         # if the definitionUri is not found
         if strDefinitionUri == None:
@@ -1464,15 +2021,15 @@ class opentronsClient:
             }
         }
 
-        strCommand = json.dumps(dicCommand)
+        strCommand = dumps(dicCommand)
 
         # LOG - info
-        LOGGER.info(f"Adding offsets to labware: {strLabwareName}")
+        LOGGER.info("Adding offsets to labware: %s", strLabwareName)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.session.post(
             url = f"http://{self.robotIP}:31950/runs/{self.runID}/labware_offsets",
             headers = self.headers,
             data = strCommand,
@@ -1480,23 +2037,51 @@ class opentronsClient:
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # convert response to dictionary
-            dicResponse = json.loads(response.text)
+            dicResponse = loads(response.content)
             # if the response failed
-            if dicResponse['data']['status'] == "failed":
+            if dicResponse['data'].get('status') == "failed":
+                dicError = dicResponse['data'].get('error', {})
                 # log the error
-                LOGGER.error(f"Failed to add offsets to labware.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                LOGGER.error("Failed to add offsets to labware.\nResponse error code: %s\n Error type: %s\n Error message: %s", dicError.get('errorCode'), dicError.get('errorType'), dicError.get('detail'))
                 # raise exception
-                raise Exception(f"Failed to add offsets to labware.\nResponse error code: {dicResponse.error.errorCode}\n Error type: {dicResponse.error.errorType}\n Error message: {dicResponse.error.detail}")
+                raise Exception(f"Failed to add offsets to labware.\nResponse error code: {dicError.get('errorCode')}\n Error type: {dicError.get('errorType')}\n Error message: {dicError.get('detail')}")
             else:
                 # LOG - info
-                LOGGER.info(f"Offsets added to labware: {strLabwareName}")
+                LOGGER.info("Offsets added to labware: %s", strLabwareName)
         else:
             raise Exception(f"Failed to add offsets to labware.\nError code: {response.status_code}\n Error message: {response.text}")
 
+    def addLabwareOffsetsBulk(self,
+                              dicOffsets: dict
+                              ):
+        '''
+        adds offsets to several labware, one request each, straight from the local labware index
+
+        arguments
+        ----------
+        dicOffsets: dict
+            labware name -> (x, y, z) or {"x": .., "y": .., "z": ..}
+            e.g. {strID_NISreactor: (0.1, -0.4, 0.0), strID_pipetteTipRack: (0, 0, 0.5)}
+
+        returns
+        ----------
+        None
+        '''
+
+        lstMissing = [strName for strName in dicOffsets if strName not in self.labware]
+        if lstMissing:
+            raise Exception(f"Labware not loaded in this run: {', '.join(lstMissing)}")
+
+        for strLabwareName, offset in dicOffsets.items():
+            if isinstance(offset, dict):
+                offset = (offset.get("x", 0), offset.get("y", 0), offset.get("z", 0))
+            fltXOffset, fltYOffset, fltZOffset = offset
+            self.addLabwareOffsets(strLabwareName, fltXOffset, fltYOffset, fltZOffset)
+
     def lights(self,
                strState: str = 'true'
                )-> None:
@@ -1531,16 +2116,16 @@ class opentronsClient:
         }
 
         # dump to string
-        strCommand = json.dumps(dicCommand)
+        strCommand = dumps(dicCommand)
 
 
         # LOG - info
-        LOGGER.info(f"Lights On: {strState}")
+        LOGGER.info("Lights On: %s", strState)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
         # make request
-        response = requests.post(
+        response = self.session.post(
             url = f"http://{self.robotIP}:31950/robot/lights",
             headers = self.headers,
             data = strCommand,
@@ -1548,19 +2133,20 @@ class opentronsClient:
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 200:
             # LOG - info
-            LOGGER.info(f"Light change successful.")
+            LOGGER.info("Light change successful.")
         else:
             # LOG - error
-            LOGGER.error(f"Failed to turn lights {strState}.")
+            LOGGER.error("Failed to turn lights %s.", strState)
             # raise exception
             raise Exception(f"Failed to turn lights {strState}.\nError code: {response.status_code}\n Error message: {response.text}")
 
     def controlAction(self,
-                      strAction: str):
+                      strAction: str,
+                      strRunID: str = None):
         '''
         performs a control action
 
@@ -1570,6 +2156,10 @@ class opentronsClient:
             the action to be performed
             options: "pause", "play", "stop"
 
+        strRunID: str
+            run to act on
+            default: None (this client's run)
+
         returns
         ----------
         None
@@ -1587,30 +2177,131 @@ class opentronsClient:
                 "actionType": strAction,
         }}
 
-        strCommand = json.dumps(dicCommand)
+        strCommand = dumps(dicCommand)
 
         # LOG - info
-        LOGGER.info(f"Performing action: {strAction}")
+        LOGGER.info("Performing action: %s", strAction)
         # LOG - debug
-        LOGGER.debug(f"Command: {strCommand}")
+        LOGGER.debug("Command: %s", strCommand)
 
-        response = requests.post(
-            url = f"http://{self.robotIP}:31950/runs/{self.runID}/actions",
+        response = self.session.post(
+            url = f"http://{self.robotIP}:31950/runs/{strRunID or self.runID}/actions",
             headers = self.headers,
             data = strCommand,
             timeout=30
         )
 
         # LOG - debug
-        LOGGER.debug(f"Response: {response.text}")
+        LOGGER.debug("Response: %s", LazyText(response))
 
         if response.status_code == 201:
             # LOG - info
-            LOGGER.info(f"Action: {strAction} successful.")
+            LOGGER.info("Action: %s successful.", strAction)
         else:
             raise Exception(f"Failed to perform action.\nError code: {response.status_code}\n Error message: {response.text}")
         
 
+
+    def uploadProtocol(self,
+                       strProtocolPath: str):
+        '''
+        uploads a protocol file (e.g. a JSON protocol from command_recorder.render_protocol) to the robot
+
+        arguments
+        ----------
+        strProtocolPath: str
+            path of the protocol file
+
+        returns
+        ----------
+        strProtocolID: str
+            the ID of the uploaded protocol (reusable for any number of runs)
+        '''
+
+        # LOG - info
+        LOGGER.info("Uploading protocol: %s", strProtocolPath)
+
+        with open(strProtocolPath, 'rb') as f:
+            response = self.session.post(
+                url = f"http://{self.robotIP}:31950/protocols",
+                headers = self.headers,
+                files = [("files", (strProtocolPath.replace("\\", "/").split("/")[-1], f))],
+                timeout=120
+            )
+
+        # LOG - debug
+        LOGGER.debug("Response: %s", LazyText(response))
+
+        if response.status_code in (200, 201):
+            strProtocolID = loads(response.content)['data']['id']
+            # LOG - info
+            LOGGER.info("Protocol uploaded with ID: %s", strProtocolID)
+            return strProtocolID
+        else:
+            raise Exception(f"Failed to upload protocol.\nError code: {response.status_code}\n Error message: {response.text}")
+
+    def runProtocol(self,
+                    strProtocolID: str,
+                    boolWait: bool = True,
+                    fltPollInterval: float = 5.0):
+        '''
+        creates a run from an uploaded protocol and plays it; the commands execute on the robot
+        the protocol run replaces this client's run as the robot's current run: self.runID can
+        no longer accept commands, so do not use this client afterwards; create a new
+        opentronsClient (or attach one with strRunID) to send commands again
+
+        arguments
+        ----------
+        strProtocolID: str
+            the ID returned by uploadProtocol
+
+        boolWait: bool
+            block until the run finishes
+            default: True
+
+        fltPollInterval: float
+            seconds between status checks while waiting
+            default: 5.0
+
+        returns
+        ----------
+        strRunID: str
+            the ID of the protocol run
+
+        strStatus: str
+            the run status ("succeeded", "failed", "stopped", or the current status if not waiting)
+        '''
+
+        strRunURL = f"http://{self.robotIP}:31950/runs"
+        response = self.session.post(url=strRunURL,
+                                 headers=self.headers,
+                                 data=dumps({"data": {"protocolId": strProtocolID}}),
+                                 timeout=30
+                                 )
+
+        if response.status_code != 201:
+            raise Exception(f"Failed to create a protocol run.\nError code: {response.status_code}\n Error message: {response.text}")
+
+        strRunID = loads(response.content)['data']['id']
+        # LOG - info
+        LOGGER.info("Protocol run created with ID: %s", strRunID)
+        # LOG - warning
+        LOGGER.warning("Run %s is no longer current; this client can not send commands to it", self.runID)
+
+        self.controlAction("play", strRunID = strRunID)
+
+        strStatus = "running"
+        while True:
+            response = self.session.get(url=f"{strRunURL}/{strRunID}", headers=self.headers, timeout=30)
+            if response.status_code == 200:
+                strStatus = loads(response.content)['data']['status']
+            if not boolWait or strStatus in ("succeeded", "failed", "stopped"):
+                break
+            time.sleep(fltPollInterval)
+
+        # LOG - info
+        LOGGER.info("Protocol run %s: %s", strRunID, strStatus)
+        return strRunID, strStatus
             
     '''
     TODO LIST 
@@ -0,0 +1,298 @@
+# pipeline_executor.py
+# Run per-well workflow stages concurrently on shared lab resources.
+#
+# The notebook runs every well strictly in sequence, so the OT-2 idles during
+# the minutes-long CP deposition and the potentiostat idles during washes.
+# Here each well is a chain of stages (fill -> heat -> deposit -> ...); a stage
+# names the resources it needs and only holds them while it runs:
+#
+#   pool = ResourcePool({"robot": 1, "potentiostat": ["ch1", "ch2"], "heater": 1, "pumps": 1})
+#   ex = PipelinedExecutor(pool)
+#   report = ex.run([
+#       ("A1", [Stage("fill", fill_A1, ["robot"]), Stage("deposit", dep_A1, ["potentiostat"]), ...]),
+#       ("A2", [...]),
+#   ])
+#   print(report.summary())
+#
+# Stage functions get a StageContext: ctx.well, ctx.stage and ctx.units (which
+# unit of each resource was granted, e.g. {"potentiostat": "ch2"}; units listed
+# explicitly are handed out as given, so "potentiostat": [1, 2] grants 1 or 2).
+# Stages of one well never overlap; stages of different wells do whenever
+# their resources are free. All resources of a stage are taken atomically, so
+# there is no lock-ordering deadlock.
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import traceback
+from typing import Callable, Hashable, Iterable, Mapping, Optional, Sequence, Union
+
+
+# -----------------------------------------------------------------------------
+# Resources
+# -----------------------------------------------------------------------------
+class ResourcePool:
+    """
+    Named resources, each with one or more interchangeable units.
+
+        {"robot": 1}                      -> one unit "robot"
+        {"heater": 2}                     -> units "heater#0", "heater#1"
+        {"potentiostat": ["ch1", "ch2"]}  -> units "ch1", "ch2"
+        {"potentiostat": [1, 2]}          -> units 1, 2 (listed units are kept as given)
+
+    acquire() grants every requested resource at once or waits; waiting
+    requests are served by priority (higher first), then arrival order.
+    Busy time is accounted per unit for utilization reports.
+    """
+
+    def __init__(self, resources: Mapping[str, Union[int, Sequence[Hashable]]]) -> None:
+        self._free: dict[str, list[Hashable]] = {}
+        self.units: dict[str, list[Hashable]] = {}
+        for name, spec in resources.items():
+            if isinstance(spec, int):
+                units = [name] if spec == 1 else [f"{name}#{i}" for i in range(spec)]
+            else:
+                units = list(spec)
+            if not units:
+                raise ValueError(f"Resource '{name}' has no units")
+            self.units[name] = units
+            self._free[name] = list(units)
+
+        self._cond = threading.Condition()
+        self._waiters: list[tuple[float, int, tuple[str, ...]]] = []
+        self._seq = 0
+        self._busy_since: dict[Hashable, float] = {}
+        self.busy_s: dict[Hashable, float] = {u: 0.0 for units in self.units.values() for u in units}
+
+    def _check(self, names: Iterable[str]) -> tuple[str, ...]:
+        names = tuple(names)
+        for n in names:
+            if n not in self.units:
+                raise KeyError(f"Unknown resource '{n}' (have: {', '.join(self.units)})")
+        return names
+
+    def _available(self, names: tuple[str, ...]) -> bool:
+        need: dict[str, int] = {}
+        for n in names:
+            need[n] = need.get(n, 0) + 1
+        return all(len(self._free[n]) >= k for n, k in need.items())
+
+    def _my_turn(self, key: tuple[float, int, tuple[str, ...]]) -> bool:
+        # a request goes first unless an earlier-ranked waiter could run now
+        # and wants one of the same resources
+        mine = set(key[2])
+        for other in sorted(self._waiters):
+            if other == key:
+                return True
+            if mine & set(other[2]) and self._available(other[2]):
+                return False
+        return True
+
+    def acquire(self, names: Iterable[str], priority: float = 0.0,
+                timeout: Optional[float] = None) -> dict[str, Hashable]:
+        """Take one unit of each resource in `names`; returns {resource: unit}."""
+        names = self._check(names)
+        if not names:
+            return {}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._seq += 1
+            key = (-priority, self._seq, names)
+            self._waiters.append(key)
+            try:
+                while not (self._available(names) and self._my_turn(key)):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"Timed out waiting for {', '.join(names)}")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters.remove(key)
+            now = time.monotonic()
+            granted = {}
+            for n in names:
+                unit = self._free[n].pop(0)
+                granted[n] = unit
+                self._busy_since[unit] = now
+            return granted
+
+    def release(self, granted: Mapping[str, Hashable]) -> None:
+        if not granted:
+            return
+        with self._cond:
+            now = time.monotonic()
+            for n, unit in granted.items():
+                self.busy_s[unit] += now - self._busy_since.pop(unit)
+                self._free[n].append(unit)
+            self._cond.notify_all()
+
+
+# -----------------------------------------------------------------------------
+# Stages
+# -----------------------------------------------------------------------------
+class StageContext:
+    def __init__(self, well: str, stage: str, units: dict[str, Hashable]) -> None:
+        self.well = well
+        self.stage = stage
+        self.units = units
+
+
+class Stage:
+    """
+    One step of a well's chain.
+
+    func      : called as func(ctx: StageContext)
+    resources : resource names held for the whole stage
+    est_s     : optional duration estimate (reporting / planning only)
+    priority  : higher goes first when several stages wait for a resource
+    """
+
+    def __init__(self, name: str, func: Callable[[StageContext], object],
+                 resources: Sequence[str] = (), est_s: Optional[float] = None,
+                 priority: float = 0.0) -> None:
+        self.name = name
+        self.func = func
+        self.resources = tuple(resources)
+        self.est_s = est_s
+        self.priority = priority
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r}, resources={list(self.resources)})"
+
+
+# -----------------------------------------------------------------------------
+# Report
+# -----------------------------------------------------------------------------
+class PipelineReport:
+    """
+    Timeline of a run. Each record is a dict:
+    {"well", "stage", "units", "queued", "start", "end", "wait_s", "run_s", "error"}
+    (times in seconds from the start of the run).
+    """
+
+    def __init__(self, records: list[dict], makespan_s: float, busy_s: dict[Hashable, float]) -> None:
+        self.records = records
+        self.makespan_s = makespan_s
+        self.serial_s = sum(r["run_s"] for r in records)
+        self.saved_s = self.serial_s - makespan_s
+        self.utilization = {u: (b / makespan_s if makespan_s > 0 else 0.0) for u, b in busy_s.items()}
+        self.errors = [r for r in records if r["error"]]
+
+    @property
+    def speedup(self) -> float:
+        return self.serial_s / self.makespan_s if self.makespan_s > 0 else 1.0
+
+    def to_dict(self) -> dict:
+        return {
+            "makespan_s": round(self.makespan_s, 3),
+            "serial_s": round(self.serial_s, 3),
+            "saved_s": round(self.saved_s, 3),
+            "speedup": round(self.speedup, 3),
+            "utilization": {u: round(v, 3) for u, v in self.utilization.items()},
+            "records": self.records,
+        }
+
+    def summary(self) -> str:
+        lines = [
+            f"Makespan {self.makespan_s:.1f} s vs serial {self.serial_s:.1f} s "
+            f"-> saved {self.saved_s:.1f} s (x{self.speedup:.2f})",
+            "Utilization:",
+        ]
+        for unit, u in sorted(self.utilization.items(), key=lambda kv: str(kv[0])):
+            lines.append(f"  {unit:<16} {u * 100:5.1f} %")
+        if self.errors:
+            lines.append(f"{len(self.errors)} stage(s) failed:")
+            for r in self.errors:
+                lines.append(f"  {r['well']}/{r['stage']}: {r['error'].strip().splitlines()[-1]}")
+        return "\n".join(lines)
+
+
+# -----------------------------------------------------------------------------
+# Executor
+# -----------------------------------------------------------------------------
+class PipelinedExecutor:
+    """
+    Runs each well's stage chain in its own thread; stages of different wells
+    overlap whenever their resources allow.
+
+    max_wells_in_flight : cap on wells started but not finished (None = all)
+    stop_on_error       : a failed stage stops new stages in every well
+                          (default: only the failing well stops)
+    """
+
+    def __init__(self, pool: ResourcePool, max_wells_in_flight: Optional[int] = None,
+                 stop_on_error: bool = False) -> None:
+        self.pool = pool
+        self.max_wells_in_flight = max_wells_in_flight
+        self.stop_on_error = stop_on_error
+        self._abort = threading.Event()
+
+    def run(self, jobs: Sequence[tuple[str, Sequence[Stage]]]) -> PipelineReport:
+        records: list[dict] = []
+        records_lock = threading.Lock()
+        slots = threading.Semaphore(self.max_wells_in_flight or max(1, len(jobs)))
+        busy_before = dict(self.pool.busy_s)
+        self._abort.clear()
+        t0 = time.monotonic()
+
+        def run_well(well: str, stages: Sequence[Stage]) -> None:
+            try:
+                for stage in stages:
+                    if self._abort.is_set():
+                        return
+                    queued = time.monotonic()
+                    units = self.pool.acquire(stage.resources, priority=stage.priority)
+                    start = time.monotonic()
+                    error = None
+                    try:
+                        logging.info("[%s] %s started on %s", well, stage.name, units or "-")
+                        stage.func(StageContext(well, stage.name, units))
+                    except Exception:
+                        error = traceback.format_exc()
+                        logging.error("[%s] %s failed:\n%s", well, stage.name, error)
+                    finally:
+                        end = time.monotonic()
+                        self.pool.release(units)
+                    with records_lock:
+                        records.append({
+                            "well": well,
+                            "stage": stage.name,
+                            "units": units,
+                            "queued": round(queued - t0, 3),
+                            "start": round(start - t0, 3),
+                            "end": round(end - t0, 3),
+                            "wait_s": round(start - queued, 3),
+                            "run_s": round(end - start, 3),
+                            "error": error,
+                        })
+                    if error is not None:
+                        if self.stop_on_error:
+                            self._abort.set()
+                        return
+            finally:
+                slots.release()
+
+        # wells are admitted in list order as in-flight slots free up
+        threads = []
+        for well, stages in jobs:
+            slots.acquire()
+            if self._abort.is_set():
+                slots.release()
+                break
+            t = threading.Thread(target=run_well, args=(well, stages), name=f"well-{well}", daemon=True)
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        makespan = time.monotonic() - t0
+        busy = {u: self.pool.busy_s[u] - busy_before.get(u, 0.0) for u in self.pool.busy_s}
+        records.sort(key=lambda r: (r["start"], r["well"]))
+        report = PipelineReport(records, makespan, busy)
+        logging.info("Pipeline finished:\n%s", report.summary())
+        return report
+
+    def abort(self) -> None:
+        """Let running stages finish but start no new ones."""
+        self._abort.set()
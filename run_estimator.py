@@ -0,0 +1,372 @@
+# run_estimator.py
+# Predict how long an experiment plan takes before anything moves.
+#
+# Per-stage duration models feed task_graph.compile_experiment(), and the
+# simulated schedule gives the total time and the time per resource (robot,
+# potentiostat channels, heater, pumps):
+#
+#   est = RunEstimator(deposit=[ocvParams_1mins, lambda w: cp_for(w)],
+#                      characterize=[ocvParams_10sec, peisParams_noOER, cvParams_20, lpParams_lsv_wOCP])
+#   wells, errors = load_experiment_csv(path)
+#   print(est.report(wells, channels=2))
+#   est.plan_batches(wells, channels=(1, 2, 4))        # wells/day per batch size
+#
+# The electrochemistry stages are timed from the biologic technique params
+# (OCV rest_time_T, CP/CA step durations x cycles, PEIS frequency sweep, CV /
+# LP scan ranges over scan rates), the fill from the solution volumes and the
+# wash from its cycle count. The models are rough on purpose; each stage is
+# calibrated against recorded timings of past runs:
+#
+#   est.calibrate(report.records, wells)             # run_graph() PipelineReport
+#   est.calibrate(records_from_checkpoint("checkpoint.json"), wells)
+#   est.save_calibration("estimator_calibration.json")
+#
+# Preview from the command line:
+#   python run_estimator.py experiment_params.csv [--channels 2] [--calibration file] [--batches]
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence, Union
+
+from task_graph import DEFAULT_DURATIONS, LAB_RESOURCES, STAGES, compile_experiment
+
+# start/stop of one technique on a channel (load firmware, relay, data flush)
+TECHNIQUE_OVERHEAD_S = 3.0
+# PEIS: shortest time spent on one frequency point, however high the frequency
+PEIS_MIN_POINT_S = 0.5
+# wash: one fill/drain rinse with the pumps, plus picking up / returning the nozzle
+WASH_CYCLES = 4
+WASH_CYCLE_S = 2 + 10.0
+WASH_TOOL_S = 60.0
+# setting up a plate between batches (deck reload, reservoirs, tips)
+BATCH_OVERHEAD_S = 1800.0
+
+DAY_S = 86400.0
+
+
+# -----------------------------------------------------------------------------
+# Technique models
+# -----------------------------------------------------------------------------
+def _cycles(params) -> int:
+    return int(getattr(params, "n_cycles", 0) or 0) + 1
+
+
+def _ocv_s(p) -> float:
+    return float(p.rest_time_T)
+
+
+def _steps_s(p) -> float:
+    # CP / CA: every step's duration, repeated n_cycles + 1 times
+    return sum(float(s.duration) for s in p.steps) * _cycles(p)
+
+
+def _peis_frequencies(p) -> list[float]:
+    n = max(1, int(p.frequency_number))
+    fi, ff = float(p.initial_frequency), float(p.final_frequency)
+    if n == 1:
+        return [fi]
+    logarithmic = getattr(getattr(p, "sweep", None), "name", "Logarithmic") == "Logarithmic"
+    if logarithmic and fi > 0 and ff > 0:
+        return [fi * (ff / fi) ** (i / (n - 1)) for i in range(n)]
+    return [fi + (ff - fi) * i / (n - 1) for i in range(n)]
+
+
+def _peis_s(p) -> float:
+    # wait_for_steady + average_n_times periods per frequency, plus the initial potential step
+    periods = float(getattr(p, "wait_for_steady", 0) or 0) + max(1, int(getattr(p, "average_n_times", 1) or 1))
+    sweep = sum(max(PEIS_MIN_POINT_S, periods / f) if f > 0 else PEIS_MIN_POINT_S for f in _peis_frequencies(p))
+    return float(getattr(p, "duration_step", 0) or 0) + sweep
+
+
+def _pzir_s(p) -> float:
+    periods = float(getattr(p, "wait_for_steady", 0) or 0) + max(1, int(getattr(p, "average_n_times", 1) or 1))
+    return max(PEIS_MIN_POINT_S, periods / float(p.frequency))
+
+
+def _cv_s(p) -> float:
+    # Ei -> E1 -> E2 -> Ei, n_cycles + 1 times, then -> Ef; each leg at the target vertex's scan rate
+    def leg(a, b):
+        return abs(float(b.voltage) - float(a.voltage)) / float(b.scan_rate) if b.scan_rate else 0.0
+    cycle = leg(p.Ei, p.E1) + leg(p.E1, p.E2) + leg(p.E2, p.Ei)
+    return cycle * _cycles(p) + leg(p.Ei, p.Ef)
+
+
+def _lp_s(p) -> float:
+    scan = abs(float(p.El.voltage_scan) - float(p.Ei.voltage_scan)) / float(p.El.scan_rate)
+    return float(getattr(p, "rest_time_T", 0) or 0) + scan * max(1, int(getattr(p, "scan_number", 1) or 1))
+
+
+def _cpp_s(p) -> float:
+    v, r = list(p.voltage_scan), list(p.scan_rate)
+    scan = sum(abs(v[i + 1] - v[i]) / r[i + 1] for i in range(len(v) - 1) if r[i + 1])
+    return float(p.rest_time_T) + scan + float(getattr(p, "t_b", 0) or 0)
+
+
+# params class name -> seconds
+TECHNIQUE_MODELS: dict[str, Callable[[Any], float]] = {
+    "OCVParams": _ocv_s,
+    "CPParams": _steps_s,
+    "CAParams": _steps_s,
+    "PEISParams": _peis_s,
+    "PZIRParams": _pzir_s,
+    "CVParams": _cv_s,
+    "LPParams": _lp_s,
+    "CPPParams": _cpp_s,
+}
+
+
+def technique_s(technique: Any) -> float:
+    """
+    Predicted run time of one technique: a biologic *Params object, a
+    Technique (its .params), or a plain number of seconds.
+    """
+    if isinstance(technique, (int, float)):
+        return float(technique)
+    params = getattr(technique, "params", technique)
+    model = TECHNIQUE_MODELS.get(type(params).__name__)
+    if model is None:
+        raise KeyError(f"No duration model for technique params {type(params).__name__}")
+    return model(params) + TECHNIQUE_OVERHEAD_S
+
+
+# a technique sequence entry: params / Technique / seconds, or f(well) returning one of those or a list
+TechniqueSpec = Union[Any, Callable[[dict], Any]]
+
+
+def sequence_s(techniques: Iterable[TechniqueSpec], well: dict) -> float:
+    total = 0.0
+    for spec in techniques:
+        item = spec(well) if callable(spec) and not hasattr(spec, "params") else spec
+        for t in (item if isinstance(item, (list, tuple)) else [item]):
+            if t is not None:
+                total += technique_s(t)
+    return total
+
+
+# -----------------------------------------------------------------------------
+# Estimator
+# -----------------------------------------------------------------------------
+class RunEstimator:
+    def __init__(self,
+                 deposit: Optional[Sequence[TechniqueSpec]] = None,
+                 characterize: Optional[Sequence[TechniqueSpec]] = None,
+                 wash_cycles: int = WASH_CYCLES,
+                 stage_models: Optional[Mapping[str, Callable[[dict], float]]] = None) -> None:
+        """
+        deposit / characterize: technique sequences per well (None keeps the
+        task_graph defaults: depositionTime_s + overhead, fixed characterization).
+        Wells without a depositionTime_s get no deposit stage either way.
+        stage_models overrides or adds f(well) -> seconds per stage kind.
+        """
+        self.deposit = list(deposit) if deposit is not None else None
+        self.characterize = list(characterize) if characterize is not None else None
+        self.wash_cycles = wash_cycles
+        self.models: dict[str, Callable[[dict], float]] = dict(DEFAULT_DURATIONS)
+        if self.deposit is not None:
+            # like the task_graph default: no deposition time, no deposit stage
+            self.models["deposit"] = lambda w: sequence_s(self.deposit, w) if w.get("depositionTime_s") else 0.0
+        if self.characterize is not None:
+            self.models["characterize"] = lambda w: sequence_s(self.characterize, w)
+        self.models["wash"] = lambda w: self.wash_cycles * WASH_CYCLE_S + WASH_TOOL_S
+        self.models.update(stage_models or {})
+        # stage kind -> (scale, offset_s): calibrated = scale * model + offset
+        self.calibration: dict[str, tuple[float, float]] = {}
+
+    # Models
+    def raw_s(self, kind: str, well: dict) -> float:
+        if kind not in self.models:
+            raise KeyError(f"No duration model for stage '{kind}'")
+        return self.models[kind](well)
+
+    def stage_s(self, kind: str, well: dict) -> float:
+        raw = self.raw_s(kind, well)
+        if raw <= 0:
+            return 0.0
+        scale, offset = self.calibration.get(kind, (1.0, 0.0))
+        return max(0.0, scale * raw + offset)
+
+    def durations(self) -> dict[str, Callable[[dict], float]]:
+        """Calibrated f(well) -> seconds per stage, for compile_experiment(durations=...)."""
+        return {kind: (lambda w, kind=kind: self.stage_s(kind, w)) for kind in self.models}
+
+    # Calibration
+    def calibrate(self, records: Iterable[dict], wells: Optional[Sequence[dict]] = None,
+                  min_samples: int = 1) -> dict[str, dict]:
+        """
+        Fit calibrated = scale * model + offset per stage from recorded timings:
+        dicts with "stage" (or a "task" id "<well>:<stage>"), "run_s" and optionally
+        "well" / "error". With `wells` the model is re-evaluated for each record's
+        well; otherwise the record's "est_s" is taken as the uncalibrated prediction.
+        """
+        by_name = {w["well_name"]: w for w in (wells or [])}
+        samples: dict[str, list[tuple[float, float]]] = {}
+        for r in records:
+            if r.get("error") or r.get("run_s") is None:
+                continue
+            well_name, kind = r.get("well"), r.get("stage")
+            if kind is None and ":" in str(r.get("task", "")):
+                well_name, kind = r["task"].split(":", 1)
+            if kind not in self.models:
+                continue
+            if well_name in by_name:
+                predicted = self.raw_s(kind, by_name[well_name])
+            elif r.get("est_s") is not None:
+                predicted = float(r["est_s"])
+            else:
+                continue
+            if predicted > 0:
+                samples.setdefault(kind, []).append((predicted, float(r["run_s"])))
+
+        fitted = {}
+        for kind, pts in samples.items():
+            if len(pts) < min_samples:
+                continue
+            n = len(pts)
+            mx, my = sum(p for p, _ in pts) / n, sum(a for _, a in pts) / n
+            sxx = sum((p - mx) ** 2 for p, _ in pts)
+            scale, offset = my / mx, 0.0
+            if n >= 3 and sxx > 1e-9 * max(1.0, mx * mx):
+                slope = sum((p - mx) * (a - my) for p, a in pts) / sxx
+                if slope > 0:
+                    scale, offset = slope, my - slope * mx
+            self.calibration[kind] = (scale, offset)
+            err = math.sqrt(sum((scale * p + offset - a) ** 2 for p, a in pts) / n)
+            fitted[kind] = {"samples": n, "scale": round(scale, 4), "offset_s": round(offset, 1),
+                            "rms_error_s": round(err, 1)}
+            logging.info("Estimator: %s calibrated from %d run(s): x%.3f %+.0f s (rms %.0f s)",
+                         kind, n, scale, offset, err)
+        return fitted
+
+    def save_calibration(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump({k: {"scale": s, "offset_s": o} for k, (s, o) in self.calibration.items()}, f, indent=2)
+
+    def load_calibration(self, path: str) -> None:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        self.calibration.update({k: (float(v["scale"]), float(v.get("offset_s", 0.0))) for k, v in data.items()})
+
+    # Estimates
+    def estimate(self, wells: Sequence[dict], resources: Optional[Mapping[str, Union[int, Sequence]]] = None,
+                 channels: Optional[int] = None, stages: Sequence[str] = STAGES) -> dict:
+        """
+        Simulated run of `wells`. Returns makespan, serial time, busy seconds and
+        utilization per resource, busy seconds per unit (e.g. per potentiostat
+        channel) as the simulated schedule assigned them, seconds per stage kind
+        and per well, and wells/day.
+        channels overrides the number of potentiostat channels in `resources`.
+        """
+        lab = dict(resources or LAB_RESOURCES)
+        if channels is not None:
+            lab["potentiostat"] = list(range(1, channels + 1))
+        graph = compile_experiment(wells, stages, durations=self.durations())
+        sim = graph.estimate(lab)
+        unit_busy = sim["unit_busy_s"]
+        busy = {r: sum(units.values()) for r, units in unit_busy.items()}
+        per_stage: dict[str, float] = {}
+        per_well: dict[str, float] = {}
+        for t in graph.tasks.values():
+            per_stage[t.kind] = per_stage.get(t.kind, 0.0) + t.duration_s
+            per_well[t.well] = per_well.get(t.well, 0.0) + t.duration_s
+        makespan = sim["makespan_s"]
+        return {
+            "wells": len(wells),
+            "makespan_s": makespan,
+            "serial_s": sim["serial_s"],
+            "resource_s": busy,
+            "unit_s": unit_busy,
+            "utilization": sim["utilization"],
+            "stage_s": per_stage,
+            "well_s": per_well,
+            "wells_per_day": len(wells) / makespan * DAY_S if makespan > 0 else 0.0,
+        }
+
+    def plan_batches(self, wells: Sequence[dict], batch_sizes: Optional[Iterable[int]] = None,
+                     channels: Iterable[int] = (1,), batch_overhead_s: float = BATCH_OVERHEAD_S,
+                     resources: Optional[Mapping[str, Union[int, Sequence]]] = None) -> list[dict]:
+        """
+        Wells per day for each batch size (the first n wells of the plan) and
+        potentiostat channel count, counting batch_overhead_s of plate setup per
+        batch; best first.
+        """
+        sizes = sorted(set(batch_sizes or range(1, len(wells) + 1)))
+        rows = []
+        for ch in channels:
+            for n in sizes:
+                if not 0 < n <= len(wells):
+                    continue
+                est = self.estimate(wells[:n], resources, channels=ch)
+                cycle_s = est["makespan_s"] + batch_overhead_s
+                rows.append({"batch_size": n, "channels": ch, "makespan_s": est["makespan_s"],
+                             "wells_per_day": n / cycle_s * DAY_S})
+        rows.sort(key=lambda r: (-r["wells_per_day"], r["channels"], r["batch_size"]))
+        return rows
+
+    def report(self, wells: Sequence[dict], channels: Optional[int] = None,
+               resources: Optional[Mapping[str, Union[int, Sequence]]] = None) -> str:
+        est = self.estimate(wells, resources, channels=channels)
+        lines = [f"{est['wells']} well(s): estimated {est['makespan_s'] / 3600:.2f} h "
+                 f"(serial {est['serial_s'] / 3600:.2f} h, {est['wells_per_day']:.1f} wells/day)",
+                 "Per resource:"]
+        for r, s in est["resource_s"].items():
+            lines.append(f"  {r:<14} {s / 3600:7.2f} h busy  {est['utilization'].get(r, 0.0) * 100:5.1f} %")
+            units = est["unit_s"].get(r, {})
+            if len(units) > 1:
+                for u, us in units.items():
+                    util = us / est["makespan_s"] if est["makespan_s"] else 0.0
+                    lines.append(f"    {u:<12} {us / 3600:7.2f} h busy  {util * 100:5.1f} %")
+        lines.append("Per stage:")
+        for k, s in est["stage_s"].items():
+            cal = " (calibrated)" if k in self.calibration else ""
+            lines.append(f"  {k:<14} {s / 3600:7.2f} h{cal}")
+        return "\n".join(lines)
+
+
+def records_from_checkpoint(checkpoint) -> list[dict]:
+    """Timing records from a checkpoint.CheckpointStore (or its path) written by run_graph()."""
+    if isinstance(checkpoint, str):
+        with open(checkpoint, 'r') as f:
+            steps = json.load(f).get("steps", {})
+    else:
+        steps = checkpoint.data["steps"]
+    records = []
+    for step, info in steps.items():
+        if info.get("status") == "done" and info.get("run_s") is not None and ":" in step:
+            well, stage = step.split(":", 1)
+            records.append({"task": step, "well": well, "stage": stage, "run_s": info["run_s"]})
+    return records
+
+
+# -----------------------------------------------------------------------------
+# CLI preview
+# -----------------------------------------------------------------------------
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Estimate the run time of an experiment plan")
+    ap.add_argument("csv", help="experiment_params.csv")
+    ap.add_argument("--channels", type=int, default=1, help="potentiostat channels available")
+    ap.add_argument("--calibration", help="calibration file from RunEstimator.save_calibration()")
+    ap.add_argument("--batches", action="store_true", help="wells/day per batch size and channel count")
+    args = ap.parse_args(argv)
+
+    from workflow_helpers import load_experiment_csv
+
+    wells, errors = load_experiment_csv(args.csv)
+    for e in errors:
+        print(" -", e)
+    est = RunEstimator()
+    if args.calibration:
+        est.load_calibration(args.calibration)
+    print(est.report(wells, channels=args.channels))
+    if args.batches:
+        print(f"\n{'batch':>5} {'channels':>8} {'makespan_h':>10} {'wells/day':>9}")
+        for r in est.plan_batches(wells, channels=sorted({1, args.channels}))[:10]:
+            print(f"{r['batch_size']:>5} {r['channels']:>8} {r['makespan_s'] / 3600:10.2f} {r['wells_per_day']:9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -20,6 +20,7 @@ from kbio.types import (
 )
 
 from biologic.channel import Channel
+from biologic.messages import MessageListener
 from biologic.deviceinfo import (
     DeviceFamily, DeviceInfo, ChannelInfo, format_device_info, format_channel_info,
 )
@@ -86,8 +87,7 @@ def connect(
     bl = BioLogic(address, api, dev_id, dev_info, force_load=force_load)
     bl.log.info("Device connected.")
 
-    for chan in bl.channels():
-        chan.start_message_listener()
+    bl.start_message_listener()
 
     return bl
 
@@ -125,6 +125,9 @@ class BioLogic:
 
         self._log = logging.LoggerAdapter(_log, dict(address=address, dev_id=device_id))
 
+        #: polls GetMessage for all channels on one thread
+        self.message_listener = MessageListener(self)
+
         ch_numbers = ( i+1 for i in range(device_info.num_channels) )
         self._chan = { n : Channel(self, n) for n in ch_numbers }
 
@@ -146,6 +149,8 @@ class BioLogic:
         self._log.debug(f"Load firmware={fw_path}, fpga={fpga_path}, force={force}.")
         channel_map = [ ch_num in channels for ch_num in sorted(self._chan.keys()) ]
         self.api.LoadFirmware(self.id, channel_map, firmware=fw_path, fpga=fpga_path, silent=True, force=force)
+        for ch_num in channels:
+            self._chan[ch_num].invalidate_info()
 
     def _test_all_channels(self) -> None:
         self._log.info("Testing device channels...")
@@ -196,10 +201,19 @@ class BioLogic:
     def is_connected(self) -> bool:
         return self.api.TestConnection(self.id)
 
+    def start_message_listener(self) -> None:
+        """Log the informational messages of every channel (one listener thread for the device)."""
+        for chan in self._chan.values():
+            self.message_listener.add_channel(chan)
+        self.message_listener.start()
+
+    def stop_message_listener(self) -> None:
+        """Stop the device's message listener thread."""
+        self.message_listener.stop()
+
     def close(self) -> None:
         """Disconnect the potentiostat."""
-        for chan in self._chan.values():
-            chan.stop_message_listener()
+        self.stop_message_listener()
 
         if self.is_connected():
             self.api.Disconnect(self.id)
@@ -7,7 +7,8 @@ from __future__ import annotations
 
 import time
 import logging
-from threading import Thread, Lock
+from dataclasses import replace
+from threading import Lock
 from typing import TYPE_CHECKING, NamedTuple
 
 from kbio.api import KBIO_api
@@ -81,13 +82,18 @@ class Channel:
         self._log = logging.LoggerAdapter(bl.log, dict(chan=self._chan))
         self.message_level = logging.INFO  #: the logging level to use for channel messages
 
-        self._msg_thread = Thread(None, self._message_listener)
-        self._msg_stop = False
-
         self._gen = None  # a generator used to pump data for the currently running technique
         self._runner = None
         self._lock = Lock()
 
+        # cached channel info; the state is also updated from every GetData
+        self._info = None
+        self._info_time = 0.0
+        self._state = None
+        self._state_time = 0.0
+        self._info_gen = 0  # bumped by invalidate_info() so in-flight queries are not cached
+        self._info_lock = Lock()
+
     def __repr__(self) -> str:
         return f'<{self.__class__.__name__}: id={self._bl.id}, chan={self._chan}>'
 
@@ -119,10 +125,53 @@ class Channel:
     def _id(self) -> int:
         return self._bl.id
 
-    def get_info(self) -> ChannelInfo:
-        """Query channel info."""
+    info_ttl = 0.5  #: seconds that queried channel info (and its state) is reused
+    def get_info(self, max_age: Optional[float] = None) -> ChannelInfo:
+        """Query channel info.
+        Info queried less than max_age seconds ago (default: info_ttl) is returned from the cache,
+        with the state kept current by GetData. Use max_age=0 to always query the device."""
+        if max_age is None:
+            max_age = self.info_ttl
+        with self._info_lock:
+            if self._info is not None and time.monotonic() - self._info_time < max_age:
+                return self._info
+            gen = self._info_gen
+
         raw_info = self._api.GetChannelInfo(self._id, self._chan)
-        return ChannelInfo.from_kbio(raw_info)
+        info = ChannelInfo.from_kbio(raw_info)
+
+        with self._info_lock:
+            if gen == self._info_gen:
+                self._info = info
+                self._info_time = self._state_time = time.monotonic()
+                self._state = info.state
+        return info
+
+    def get_state(self, max_age: Optional[float] = None) -> PROG_STATE:
+        """The channel's program state, from the last GetData or channel info query if it is
+        younger than max_age seconds (default: info_ttl), otherwise queried from the device."""
+        if max_age is None:
+            max_age = self.info_ttl
+        with self._info_lock:
+            if self._state is not None and time.monotonic() - self._state_time < max_age:
+                return self._state
+        return self.get_info(0).state
+
+    def invalidate_info(self) -> None:
+        """Drop the cached channel info, e.g. after the channel was started or stopped."""
+        with self._info_lock:
+            self._info = None
+            self._state = None
+            self._info_gen += 1
+
+    def _update_state(self, state: PROG_STATE, gen: int) -> None:
+        with self._info_lock:
+            if gen != self._info_gen:
+                return  # read before the channel was started/stopped
+            self._state = state
+            self._state_time = time.monotonic()
+            if self._info is not None and self._info.state != state:
+                self._info = replace(self._info, state=state)
 
     def is_plugged(self) -> bool:
         """Check if the channel is plugged in."""
@@ -132,25 +181,23 @@ class Channel:
         """Stop the channel.
         This will cause any active TechniqueRunner to fail with a ChannelStopped exception."""
         with self._lock:
-            info = self.get_info()
-            if info.state == PROG_STATE.STOP:
+            if self.get_state() == PROG_STATE.STOP:
                 return
 
             self._close_gen()
             self._api.StopChannel(self.bl.id, self._chan)
+            self.invalidate_info()
 
             self._gen = None
             self._runner = None
 
     def is_busy(self) -> bool:
-        info = self.get_info()
-        return info.is_busy()
+        return self.get_state() != PROG_STATE.STOP
 
     def is_active(self, runner: TechniqueRunner) -> bool:
         """Return True if the channel is running with the given runner instance."""
         with self._lock:
-            info = self.get_info()
-            if info.state == PROG_STATE.RUN:
+            if self.get_state() == PROG_STATE.RUN:
                 return self._runner is runner
         return False
 
@@ -172,6 +219,7 @@ class Channel:
 
             self._load_techniques(techs)
             self._api.StartChannel(self._bl.id, self._chan)
+            self.invalidate_info()
 
             if self._gen is not None:
                 self._gen.close()
@@ -212,7 +260,10 @@ class Channel:
 
     def _get_data(self) -> Generator[BLData]:
         while True:
-            yield BLData(*self._api.GetData(self._bl.id, self._chan))
+            gen = self._info_gen
+            data = BLData(*self._api.GetData(self._bl.id, self._chan))
+            self._update_state(data.prog_state, gen)
+            yield data
 
     def _close_gen(self) -> None:
         if self._gen is None:
@@ -231,40 +282,16 @@ class Channel:
         self._gen = None
 
     def start_message_listener(self) -> None:
-        """Start the message listener thread, which will log informational messages emitted by
-        the potentiostat channel. This is normally called by the connect() function when the
-        potentiostat is connected."""
-        if not self._msg_thread.is_alive():
-            self._msg_thread.start()
+        """Log informational messages emitted by the potentiostat channel. Messages of all
+        channels are polled by one listener thread per device (BioLogic.message_listener).
+        This is normally called by the connect() function when the potentiostat is connected."""
+        listener = self._bl.message_listener
+        listener.add_channel(self)
+        listener.start()
 
     def stop_message_listener(self) -> None:
-        """Stop the message listener thread. This is normally called by the close() method when
-        the potentiostat is closed."""
-        if not self._msg_thread.is_alive():
-            return
-
-        self._msg_stop = True
-        self._msg_thread.join(5.0)
-        if self._msg_thread.is_alive():
-            self._log.warning("Timeout expired while waiting for message listener to exit.")
-
-    _msg_loop_interval = 1.0
-    def _message_listener(self) -> None:
-        self._log.debug("Starting message listener.")
-
-        errors = 0
-        while errors < 10 and not self._msg_stop:
-            try:
-                msg = self._api.GetMessage(self._id, self._chan)
-                while msg:
-                    self._log.log(self.message_level, msg)
-                    msg = self._api.GetMessage(self._id, self._chan)
-            except:
-                self._log.error("Unhandled exception raised from message listener!", exc_info=True)
-                errors += 1
-            else:
-                errors = 0
-
-            time.sleep(self._msg_loop_interval)
-
-        self._log.debug("Message listener stopped.")
+        """Stop logging messages from this channel. This is normally called by the close() method
+        when the potentiostat is closed."""
+        listener = getattr(self._bl, 'message_listener', None)
+        if listener is not None:
+            listener.remove_channel(self)
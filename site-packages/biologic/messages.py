@@ -0,0 +1,114 @@
+""" One message-listener thread per BioLogic device.
+
+The listener polls GetMessage for every enabled channel in turn and logs each
+message through that channel's logger. After a sweep that found messages it
+polls again after min_interval; every quiet sweep doubles the wait, up to
+max_interval.
+"""
+
+from __future__ import annotations
+
+from threading import Thread, Event, Lock
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Optional
+    from biologic import BioLogic
+    from biologic.channel import Channel
+
+__all__ = (
+    'MessageListener',
+)
+
+
+class MessageListener:
+    """Polls channel messages of a device on a single background thread."""
+
+    max_errors = 10  #: consecutive failures after which a channel is no longer polled
+
+    def __init__(self, bl: BioLogic, min_interval: float = 0.1, max_interval: float = 1.0):
+        self._bl = bl
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        self._channels: dict[int, Channel] = {}
+        self._errors: dict[int, int] = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}: id={self._bl.id}, channels={sorted(self._channels)}>'
+
+    def add_channel(self, chan: Channel) -> None:
+        with self._lock:
+            self._channels[chan.num] = chan
+            self._errors[chan.num] = 0
+
+    def remove_channel(self, chan: Channel) -> None:
+        with self._lock:
+            self._channels.pop(chan.num, None)
+            self._errors.pop(chan.num, None)
+
+    def is_listening(self, chan: Channel) -> bool:
+        return self.is_alive() and chan.num in self._channels
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(None, self._run, name=f'biologic-messages-{self._bl.id}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if not self.is_alive():
+            return
+
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self._bl.log.warning("Timeout expired while waiting for message listener to exit.")
+
+    def _poll(self, chan: Channel) -> int:
+        api, dev_id = self._bl.api, self._bl.id
+        count = 0
+        msg = api.GetMessage(dev_id, chan.num)
+        while msg:
+            chan.log.log(chan.message_level, msg)
+            count += 1
+            msg = api.GetMessage(dev_id, chan.num)
+        return count
+
+    def _run(self) -> None:
+        self._bl.log.debug("Starting message listener.")
+
+        interval = self.min_interval
+        while not self._stop.is_set():
+            with self._lock:
+                channels = [ chan for num, chan in sorted(self._channels.items()) if self._errors[num] < self.max_errors ]
+
+            received = 0
+            for chan in channels:
+                if self._stop.is_set():
+                    break
+                try:
+                    received += self._poll(chan)
+                except:
+                    chan.log.error("Unhandled exception raised from message listener!", exc_info=True)
+                    with self._lock:
+                        if chan.num in self._errors:
+                            self._errors[chan.num] += 1
+                            if self._errors[chan.num] >= self.max_errors:
+                                chan.log.error("Too many errors, no longer listening for messages.")
+                else:
+                    with self._lock:
+                        if chan.num in self._errors:
+                            self._errors[chan.num] = 0
+
+            interval = self.min_interval if received > 0 else min(interval * 2, self.max_interval)
+            self._stop.wait(interval)
+
+        self._bl.log.debug("Message listener stopped.")
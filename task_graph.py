@@ -0,0 +1,473 @@
+# task_graph.py
+# Compile experiment_params.csv rows into an explicit task DAG and schedule it.
+#
+#   wells, errors = load_experiment_csv(path)
+#   graph = compile_experiment(wells)                 # fill -> heat -> deposit -> ...
+#   print(graph.preview())                            # tasks, resources, durations
+#   est = graph.estimate(LAB_RESOURCES)               # simulated makespan, no hardware
+#   report = run_graph(graph, ResourcePool(LAB_RESOURCES), actions)
+#
+# Every task carries the resources it holds and an estimated duration. The
+# scheduler is critical-path-first: when tasks compete for a resource the one
+# with the longest remaining path to the end of the run goes first (its
+# "rank"), which keeps the long deposition/characterization chains moving.
+# estimate() runs the same policy on a simulated clock, so a plan can be
+# previewed, time-estimated and tuned before any hardware moves.
+#
+# Preview from the command line:
+#   python task_graph.py experiment_params.csv [--channels 2]
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import logging
+import math
+import threading
+import time
+import traceback
+from typing import Callable, Hashable, Mapping, Optional, Sequence, Union
+
+from pipeline_executor import PipelineReport, ResourcePool, StageContext
+
+# -----------------------------------------------------------------------------
+# Defaults
+# -----------------------------------------------------------------------------
+STAGES = ("fill", "heat", "deposit", "characterize", "wash", "image")
+
+# resources held by each stage kind
+STAGE_RESOURCES: dict[str, tuple[str, ...]] = {
+    "fill": ("robot",),
+    "heat": ("heater",),
+    "deposit": ("potentiostat", "heater"),
+    "characterize": ("potentiostat", "heater"),
+    "wash": ("robot", "pumps"),
+    "image": ("robot",),
+}
+
+# resources a stage hands straight to the next stage of the same well instead
+# of releasing them: the heater stays with a well from its ramp until its
+# measurements are done, so no other well can change the temperature between
+STAGE_HOLDS: dict[str, tuple[str, ...]] = {
+    "heat": ("heater",),
+    "deposit": ("heater",),
+}
+
+# what the lab has (one OT-2, one heater base, one BioLogic channel, one pump node)
+LAB_RESOURCES: dict[str, Union[int, Sequence]] = {
+    "robot": 1,
+    "heater": 1,
+    "potentiostat": [1],
+    "pumps": 1,
+}
+
+# rough timings (s), measured on the notebook workflow
+TIP_CYCLE_S = 25.0         # pick up + drop a tip
+TRANSFER_S = 20.0          # one aspirate/dispense round trip
+MAX_TRANSFER_UL = 1000     # p1000
+MIX_S = 30.0
+HEAT_RAMP_C_PER_S = 0.05   # base heater ramp
+HEAT_SETTLE_S = 60.0
+AMBIENT_C = 25.0
+DEPOSIT_OVERHEAD_S = 60.0  # OCV rest + relay switching before CP
+CHARACTERIZE_S = 1800.0    # OCV/PEIS/CV/LP sequence
+WASH_S = 4 * (2 + 10) + 60.0
+IMAGE_S = 10.0
+
+
+def _fill_s(well: dict) -> float:
+    sols = well.get("solutions", [])
+    total = 0.0
+    for sol in sols:
+        transfers = max(1, math.ceil(sol["volume_mL"] * 1000 / MAX_TRANSFER_UL))
+        total += TIP_CYCLE_S + transfers * TRANSFER_S
+    return total + (MIX_S if len(sols) > 1 else 0.0)
+
+
+def _heat_s(well: dict) -> float:
+    target = well.get("temperature_C")
+    if target is None or target <= AMBIENT_C:
+        return 0.0
+    return (target - AMBIENT_C) / HEAT_RAMP_C_PER_S + HEAT_SETTLE_S
+
+
+def _deposit_s(well: dict) -> float:
+    # no deposition time -> no deposit task (the potentiostat is not touched)
+    t = well.get("depositionTime_s")
+    if not t:
+        return 0.0
+    return float(t) + DEPOSIT_OVERHEAD_S
+
+
+DEFAULT_DURATIONS: dict[str, Callable[[dict], float]] = {
+    "fill": _fill_s,
+    "heat": _heat_s,
+    "deposit": _deposit_s,
+    "characterize": lambda w: CHARACTERIZE_S,
+    "wash": lambda w: WASH_S,
+    "image": lambda w: IMAGE_S,
+}
+
+
+# -----------------------------------------------------------------------------
+# Graph
+# -----------------------------------------------------------------------------
+class Task:
+    """
+    A node of the plan: `kind` of work on `well`, holding `resources` for ~`duration_s`.
+    `hold`: resources kept after the task and handed to the successor that uses them.
+    """
+
+    def __init__(self, task_id: str, well: str, kind: str, resources: Sequence[str],
+                 duration_s: float, deps: Sequence[str] = (), params: Optional[dict] = None,
+                 hold: Sequence[str] = ()) -> None:
+        self.id = task_id
+        self.well = well
+        self.kind = kind
+        self.resources = tuple(resources)
+        self.duration_s = float(duration_s)
+        self.deps = list(deps)
+        self.params = params or {}
+        self.hold = tuple(hold)
+        self.rank = 0.0  # longest path from this task to the end (incl. itself)
+
+    def __repr__(self) -> str:
+        return f"Task({self.id!r}, {self.duration_s:.0f}s, resources={list(self.resources)})"
+
+
+class TaskGraph:
+    def __init__(self) -> None:
+        self.tasks: dict[str, Task] = {}
+
+    def add(self, task: Task) -> Task:
+        if task.id in self.tasks:
+            raise ValueError(f"Duplicate task id '{task.id}'")
+        self.tasks[task.id] = task
+        return task
+
+    def _handoffs(self, succ: dict[str, list[str]]) -> dict[str, dict[str, str]]:
+        # task -> {held resource: successor that receives it}
+        out: dict[str, dict[str, str]] = {}
+        for t in self.tasks.values():
+            for r in t.hold:
+                s = next((s for s in succ[t.id] if r in self.tasks[s].resources), None)
+                if s is not None:
+                    out.setdefault(t.id, {})[r] = s
+        return out
+
+    def successors(self) -> dict[str, list[str]]:
+        succ: dict[str, list[str]] = {t: [] for t in self.tasks}
+        for t in self.tasks.values():
+            for d in t.deps:
+                if d not in self.tasks:
+                    raise KeyError(f"Task '{t.id}' depends on unknown task '{d}'")
+                succ[d].append(t.id)
+        return succ
+
+    def topological_order(self) -> list[str]:
+        succ = self.successors()
+        indeg = {t: len(self.tasks[t].deps) for t in self.tasks}
+        ready = [t for t, n in indeg.items() if n == 0]
+        order = []
+        while ready:
+            t = ready.pop(0)
+            order.append(t)
+            for s in succ[t]:
+                indeg[s] -= 1
+                if indeg[s] == 0:
+                    ready.append(s)
+        if len(order) != len(self.tasks):
+            raise ValueError("Task graph has a cycle")
+        return order
+
+    def compute_ranks(self) -> None:
+        succ = self.successors()
+        for tid in reversed(self.topological_order()):
+            t = self.tasks[tid]
+            t.rank = t.duration_s + max((self.tasks[s].rank for s in succ[tid]), default=0.0)
+
+    def critical_path(self) -> list[Task]:
+        self.compute_ranks()
+        succ = self.successors()
+        roots = [t for t in self.tasks.values() if not t.deps]
+        if not roots:
+            return []
+        path = [max(roots, key=lambda t: t.rank)]
+        while succ[path[-1].id]:
+            path.append(max((self.tasks[s] for s in succ[path[-1].id]), key=lambda t: t.rank))
+        return path
+
+    @property
+    def serial_s(self) -> float:
+        return sum(t.duration_s for t in self.tasks.values())
+
+    def preview(self) -> str:
+        self.compute_ranks()
+        lines = [f"{'task':<20} {'resources':<22} {'est_s':>8} {'rank_s':>8}  deps"]
+        for tid in self.topological_order():
+            t = self.tasks[tid]
+            lines.append(f"{t.id:<20} {','.join(t.resources):<22} {t.duration_s:8.0f} {t.rank:8.0f}  "
+                         f"{','.join(t.deps)}")
+        cp = self.critical_path()
+        lines.append(f"{len(self.tasks)} tasks, serial {self.serial_s / 60:.1f} min, "
+                     f"critical path {sum(t.duration_s for t in cp) / 60:.1f} min "
+                     f"({' -> '.join(t.id for t in cp)})")
+        return "\n".join(lines)
+
+    def estimate(self, resources: Mapping[str, Union[int, Sequence]]) -> dict:
+        """
+        Simulate critical-path-first list scheduling on `resources`, handing out
+        units the way ResourcePool does (first free unit, released to the back).
+        Returns {"makespan_s", "serial_s", "saved_s", "utilization", "unit_busy_s",
+        "schedule"}; unit_busy_s is {resource: {unit: seconds}} and each schedule
+        entry has the {resource: [units]} the task ran on.
+        """
+        self.compute_ranks()
+        pool = ResourcePool(resources)  # only used for unit names
+        free = {n: list(u) for n, u in pool.units.items()}
+        unit_busy = {n: {u: 0.0 for u in units} for n, units in pool.units.items()}
+        succ = self.successors()
+        handoffs = self._handoffs(succ)
+        carried: dict[str, dict[str, list[Hashable]]] = {}  # task -> units handed over by its predecessor
+        held: dict[str, dict[str, list[Hashable]]] = {}     # running task -> units
+        waiting = {t: len(self.tasks[t].deps) for t in self.tasks}
+        ready = [t for t, n in waiting.items() if n == 0]
+        running: list[tuple[float, str]] = []
+        schedule = []
+        now = 0.0
+        while ready or running:
+            ready.sort(key=lambda t: -self.tasks[t].rank)
+            for tid in list(ready):
+                t = self.tasks[tid]
+                need = {}
+                for r in t.resources:
+                    if r not in free:
+                        raise KeyError(f"Task '{tid}' needs unknown resource '{r}'")
+                    if r in carried.get(tid, {}):
+                        continue
+                    need[r] = need.get(r, 0) + 1
+                if all(len(free[r]) >= k for r, k in need.items()):
+                    units = carried.pop(tid, {})
+                    for r, k in need.items():
+                        units[r] = [free[r].pop(0) for _ in range(k)]
+                    for r, us in units.items():
+                        for u in us:
+                            unit_busy[r][u] += t.duration_s
+                    held[tid] = units
+                    ready.remove(tid)
+                    heapq.heappush(running, (now + t.duration_s, tid))
+                    schedule.append({"task": tid, "start": now, "end": now + t.duration_s,
+                                     "units": {r: list(us) for r, us in units.items()}})
+            if not running:
+                raise RuntimeError(f"Unschedulable tasks: {ready}")
+            now, tid = heapq.heappop(running)
+            finished = [tid]
+            while running and running[0][0] <= now:
+                finished.append(heapq.heappop(running)[1])
+            for tid in finished:
+                for r, us in held.pop(tid).items():
+                    if r in handoffs.get(tid, {}):
+                        carried.setdefault(handoffs[tid][r], {})[r] = us
+                    else:
+                        free[r].extend(us)
+                for s in succ[tid]:
+                    waiting[s] -= 1
+                    if waiting[s] == 0:
+                        ready.append(s)
+        makespan = now
+        return {
+            "makespan_s": makespan,
+            "serial_s": self.serial_s,
+            "saved_s": self.serial_s - makespan,
+            "utilization": {r: (sum(ub.values()) / (makespan * len(ub)) if makespan else 0.0)
+                            for r, ub in unit_busy.items()},
+            "unit_busy_s": unit_busy,
+            "schedule": schedule,
+        }
+
+
+# -----------------------------------------------------------------------------
+# Compiler
+# -----------------------------------------------------------------------------
+def compile_experiment(
+    wells: Sequence[dict],
+    stages: Sequence[str] = STAGES,
+    durations: Optional[Mapping[str, Union[float, Callable[[dict], float]]]] = None,
+    resources: Optional[Mapping[str, Sequence[str]]] = None,
+) -> TaskGraph:
+    """
+    Turn load_experiment_csv() wells into a DAG: per well, `stages` form a chain
+    (<well>:fill -> <well>:heat -> ...). Stages with zero duration (e.g. heat at
+    room temperature, deposit without a depositionTime_s) are left out.
+    `durations` / `resources` override the defaults per stage kind (a duration
+    can be a number or f(well) -> seconds). STAGE_HOLDS resources pass from a
+    task to the next one of its well when both use them.
+    """
+    dur = dict(DEFAULT_DURATIONS)
+    for k, v in (durations or {}).items():
+        dur[k] = v if callable(v) else (lambda w, v=v: float(v))
+    res = dict(STAGE_RESOURCES)
+    res.update(resources or {})
+
+    graph = TaskGraph()
+    for well in wells:
+        name = well["well_name"]
+        prev = None
+        for kind in stages:
+            if kind not in dur:
+                raise KeyError(f"No duration model for stage '{kind}'")
+            d = dur[kind](well)
+            if d <= 0:
+                continue
+            task = graph.add(Task(f"{name}:{kind}", name, kind, res.get(kind, ()), d,
+                                  deps=[prev.id] if prev else [], params=well))
+            if prev is not None:
+                prev.hold = tuple(r for r in STAGE_HOLDS.get(prev.kind, ()) if r in prev.resources
+                                  and r in task.resources)
+            prev = task
+    graph.compute_ranks()
+    return graph
+
+
+# -----------------------------------------------------------------------------
+# Execution
+# -----------------------------------------------------------------------------
+def run_graph(
+    graph: TaskGraph,
+    pool: ResourcePool,
+    actions: Mapping[str, Callable[[StageContext, Task], object]],
+    stop_on_error: bool = True,
+    checkpoint=None,
+) -> PipelineReport:
+    """
+    Execute the DAG on real hardware. actions[kind](ctx, task) does the work;
+    a task starts once its deps are done and waits for its resources with
+    priority = critical-path rank. A failed task blocks its successors (and,
+    with stop_on_error, every task not yet started).
+
+    With a checkpoint.CheckpointStore, tasks already done are skipped and
+    every finished task is checkpointed (so a re-run resumes where it failed).
+    """
+    graph.compute_ranks()
+    missing = {t.kind for t in graph.tasks.values()} - set(actions)
+    if missing:
+        raise KeyError(f"No action for stage(s): {', '.join(sorted(missing))}")
+
+    succ = graph.successors()
+    handoffs = graph._handoffs(succ)
+    carried: dict[str, dict[str, Hashable]] = {}  # task -> units handed over by its predecessor
+    waiting = {t: len(graph.tasks[t].deps) for t in graph.tasks}
+    records: list[dict] = []
+    cond = threading.Condition()
+    running = 0
+    failed = threading.Event()
+    busy_before = dict(pool.busy_s)
+    t0 = time.monotonic()
+
+    skipped = set()
+    if checkpoint is not None:
+        for tid in graph.topological_order():
+            if checkpoint.is_done(tid) and waiting[tid] == 0:
+                skipped.add(tid)
+                for s in succ[tid]:
+                    waiting[s] -= 1
+        if skipped:
+            logging.info("Checkpoint: %d task(s) already done", len(skipped))
+
+    def run_task(task: Task) -> None:
+        nonlocal running
+        queued = time.monotonic()
+        with cond:
+            inherited = carried.pop(task.id, {})
+        units = {**inherited, **pool.acquire([r for r in task.resources if r not in inherited],
+                                             priority=task.rank)}
+        start = time.monotonic()
+        error = None
+        try:
+            if failed.is_set() and stop_on_error:
+                error = "skipped after earlier failure"
+            else:
+                logging.info("[%s] %s started on %s", task.well, task.kind, units or "-")
+                actions[task.kind](StageContext(task.well, task.kind, units), task)
+        except Exception:
+            error = traceback.format_exc()
+            logging.error("[%s] %s failed:\n%s", task.well, task.kind, error)
+        finally:
+            end = time.monotonic()
+            passed = handoffs.get(task.id, {}) if error is None else {}
+            pool.release({r: u for r, u in units.items() if r not in passed})
+        if checkpoint is not None:
+            if error is None:
+                checkpoint.mark_done(task.id, run_s=round(end - start, 3))
+            else:
+                checkpoint.mark_failed(task.id, error.strip().splitlines()[-1])
+        with cond:
+            records.append({
+                "task": task.id, "well": task.well, "stage": task.kind, "units": units,
+                "queued": round(queued - t0, 3), "start": round(start - t0, 3), "end": round(end - t0, 3),
+                "wait_s": round(start - queued, 3), "run_s": round(end - start, 3),
+                "est_s": task.duration_s, "error": error,
+            })
+            if error is not None:
+                failed.set()
+            else:
+                for r, s in passed.items():
+                    carried.setdefault(s, {})[r] = units[r]
+                for s in succ[task.id]:
+                    waiting[s] -= 1
+                    if waiting[s] == 0:
+                        _launch(graph.tasks[s])
+            running -= 1
+            cond.notify_all()
+
+    def _launch(task: Task) -> None:
+        nonlocal running
+        running += 1
+        threading.Thread(target=run_task, args=(task,), name=f"task-{task.id}", daemon=True).start()
+
+    with cond:
+        roots = [t for t, n in waiting.items() if n == 0 and t not in skipped]
+        for tid in sorted(roots, key=lambda t: -graph.tasks[t].rank):
+            _launch(graph.tasks[tid])
+        while running:
+            cond.wait()
+
+    makespan = time.monotonic() - t0
+    busy = {u: pool.busy_s[u] - busy_before.get(u, 0.0) for u in pool.busy_s}
+    records.sort(key=lambda r: (r["start"], r["task"]))
+    report = PipelineReport(records, makespan, busy)
+    not_run = [t for t in graph.tasks if t not in skipped and t not in {r["task"] for r in records}]
+    if not_run:
+        logging.warning("%d task(s) not run: %s", len(not_run), ", ".join(not_run))
+    logging.info("Graph finished:\n%s", report.summary())
+    return report
+
+
+# -----------------------------------------------------------------------------
+# CLI preview
+# -----------------------------------------------------------------------------
+def main(argv: Optional[list[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Preview and time-estimate an experiment plan")
+    ap.add_argument("csv", help="experiment_params.csv")
+    ap.add_argument("--channels", type=int, default=1, help="potentiostat channels available")
+    args = ap.parse_args(argv)
+
+    from workflow_helpers import load_experiment_csv
+
+    wells, errors = load_experiment_csv(args.csv)
+    for e in errors:
+        print(" -", e)
+    graph = compile_experiment(wells)
+    print(graph.preview())
+    lab = dict(LAB_RESOURCES)
+    lab["potentiostat"] = list(range(1, args.channels + 1))
+    est = graph.estimate(lab)
+    print(f"\nEstimated makespan {est['makespan_s'] / 60:.1f} min "
+          f"(serial {est['serial_s'] / 60:.1f} min, saves {est['saved_s'] / 60:.1f} min)")
+    for r, u in est["utilization"].items():
+        print(f"  {r:<14} {u * 100:5.1f} %")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
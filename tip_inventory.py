@@ -0,0 +1,201 @@
+# tip_inventory.py
+# Which tips are left in which rack, without hand-picked tip IDs.
+#
+# opentronsClient owns one TipInventory (oc.tips). Every tip-rack labware
+# loaded through the client is registered from its definition (its own well
+# ordering, so 96-, 4- or 3-position racks all work). pickUpTip marks the
+# tip used, dropTip puts it back (rack) or retires it (trash), and the client
+# always knows whether a pipette holds a tip (no pipetteHasTip round trip).
+#
+#   oc.tips.attach_file(os.path.join(strExperimentPath, "..", "tips.json"))  # survive restarts
+#   oc.pickUpNextTip('p1000_single_gen2')                  # any rack with tips
+#   oc.pickUpNextTip('p1000_single_gen2', strTag='KOH')    # per_solution racks
+#
+# Reuse policies (per rack):
+#   "single_use"   : a tip is never picked up twice (default)
+#   "per_solution" : a tip dropped back into the rack may be reused for the
+#                    same tag (solution) only
+#   "reuse"        : tips always go back and are reused (electrode/probe racks)
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+POLICIES = ("single_use", "per_solution", "reuse")
+
+
+class TipsExhaustedError(Exception):
+    """No tip left that the rack policies allow."""
+
+
+class _Rack:
+    def __init__(self, name: str, order: list[str], policy: str) -> None:
+        self.name = name
+        self.order = order
+        self.policy = policy
+        self.used: set[str] = set()        # picked up and not available again
+        self.returned: dict[str, Optional[str]] = {}  # well -> tag, back in the rack
+        self.cursor = 0                    # first index that might still be fresh
+
+    def next_fresh(self) -> Optional[str]:
+        while self.cursor < len(self.order):
+            well = self.order[self.cursor]
+            if well not in self.used and well not in self.returned:
+                return well
+            self.cursor += 1
+        return None
+
+    def remaining(self) -> int:
+        return sum(1 for w in self.order[self.cursor:] if w not in self.used and w not in self.returned)
+
+
+class TipInventory:
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._racks: dict[str, _Rack] = {}
+        self._held: dict[str, tuple[str, str, Optional[str]]] = {}  # pipette -> (rack, well, tag)
+        self._lock = threading.RLock()
+        self._saved: dict = {}
+        self.path = None
+        if path is not None:
+            self.attach_file(path)
+
+    # Racks
+    def register_rack(self, strLabwareName: str, dicDefinition: dict, policy: Optional[str] = None) -> bool:
+        """Register a tip rack from its labware definition; returns False for non-tip-rack labware."""
+        if not dicDefinition.get("parameters", {}).get("isTiprack"):
+            return False
+        order = [w for column in dicDefinition.get("ordering", []) for w in column]
+        with self._lock:
+            rack = _Rack(strLabwareName, order, policy or "single_use")
+            self._racks[strLabwareName] = rack
+            self._restore(rack)
+        logging.info("Tip rack %s: %d of %d tips available (%s)",
+                     strLabwareName, rack.remaining() + len(rack.returned), len(order), rack.policy)
+        return True
+
+    def set_policy(self, strLabwareName: str, policy: str) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown tip policy '{policy}' (use one of {POLICIES})")
+        with self._lock:
+            self._racks[strLabwareName].policy = policy
+            self._save()
+
+    def racks(self) -> list[str]:
+        return list(self._racks)
+
+    def remaining(self, strLabwareName: Optional[str] = None) -> int:
+        names = [strLabwareName] if strLabwareName else list(self._racks)
+        return sum(self._racks[n].remaining() for n in names)
+
+    def set_next(self, strLabwareName: str, strWellName: str) -> None:
+        """Mark every tip before `strWellName` (rack ordering) as used, e.g. to match a manual tip ID."""
+        with self._lock:
+            rack = self._racks[strLabwareName]
+            idx = rack.order.index(strWellName)
+            rack.used.update(rack.order[:idx])
+            rack.cursor = 0
+            self._save()
+
+    def refill(self, strLabwareName: str) -> None:
+        """A fresh rack was put in the slot."""
+        with self._lock:
+            rack = self._racks[strLabwareName]
+            rack.used.clear()
+            rack.returned.clear()
+            rack.cursor = 0
+            self._save()
+
+    # Selection
+    def next_tip(self, strLabwareName: Optional[str] = None, strTag: Optional[str] = None) -> tuple[str, str]:
+        """(rack, well) of the tip to use next, honouring each rack's policy."""
+        with self._lock:
+            names = [strLabwareName] if strLabwareName else list(self._racks)
+            for name in names:
+                rack = self._racks[name]
+                if rack.policy == "reuse" and rack.returned:
+                    return name, next(iter(rack.returned))
+                if rack.policy == "per_solution" and strTag is not None:
+                    for well, tag in rack.returned.items():
+                        if tag == strTag:
+                            return name, well
+            for name in names:
+                well = self._racks[name].next_fresh()
+                if well is not None:
+                    return name, well
+        raise TipsExhaustedError(f"No tips left in {', '.join(names) or 'any registered rack'}")
+
+    # Bookkeeping (called by opentronsClient)
+    def picked_up(self, strPipetteName: str, strLabwareName: str, strWellName: str,
+                  strTag: Optional[str] = None) -> None:
+        with self._lock:
+            rack = self._racks.get(strLabwareName)
+            if rack is not None:
+                if strTag is None:
+                    strTag = rack.returned.get(strWellName)
+                rack.returned.pop(strWellName, None)
+                rack.used.add(strWellName)
+            self._held[strPipetteName] = (strLabwareName, strWellName, strTag)
+            self._save()
+
+    def dropped(self, strPipetteName: str, strLabwareName: Optional[str] = None,
+                strWellName: Optional[str] = None) -> None:
+        """Tip dropped into `strLabwareName/strWellName`, or into the trash if no labware is given."""
+        with self._lock:
+            held = self._held.pop(strPipetteName, None)
+            rack = self._racks.get(strLabwareName) if strLabwareName else None
+            if rack is not None and rack.policy != "single_use":
+                rack.used.discard(strWellName)
+                rack.returned[strWellName] = held[2] if held else None
+            self._save()
+
+    def has_tip(self, strPipetteName: str) -> bool:
+        """Whether the pipette holds a tip, as far as this session's pick-ups/drops know."""
+        return strPipetteName in self._held
+
+    def held(self, strPipetteName: str) -> Optional[tuple[str, str, Optional[str]]]:
+        return self._held.get(strPipetteName)
+
+    # Persistence
+    def attach_file(self, path: str) -> None:
+        """Persist state to `path` (JSON) and restore racks already registered or registered later."""
+        with self._lock:
+            self.path = path
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    self._saved = json.load(f)
+            for rack in self._racks.values():
+                self._restore(rack)
+            self._save()
+
+    def _restore(self, rack: _Rack) -> None:
+        state = self._saved.get(rack.name)
+        if not state:
+            return
+        valid = set(rack.order)
+        rack.policy = state.get("policy", rack.policy)
+        rack.used = set(state.get("used", [])) & valid
+        rack.returned = {w: t for w, t in state.get("returned", {}).items() if w in valid}
+        rack.cursor = 0
+
+    def to_dict(self) -> dict:
+        data = dict(self._saved)
+        for name, rack in self._racks.items():
+            data[name] = {
+                "policy": rack.policy,
+                "used": [w for w in rack.order if w in rack.used],
+                "returned": rack.returned,
+            }
+        return data
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        self._saved = self.to_dict()
+        tmp = self.path + ".part"
+        with open(tmp, 'w') as f:
+            json.dump(self._saved, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
@@ -0,0 +1,221 @@
+# travel_planner.py
+# Lowest collision-free travel height for moves between labware.
+#
+# Between two different labware the robot arcs to the highest item on the
+# whole deck plus a margin, even when the path crosses nothing tall. The
+# planner keeps a deck map (slot origin, footprint and height of every loaded
+# labware, from its definition) and, for a source -> destination hop,
+# finds the tallest item whose footprint the straight XY path passes over.
+# When that is clearly below the deck-wide arc, opentronsClient.moveToWell
+# climbs straight out of the source, crosses at the planned height and
+# descends straight into the destination (forceDirect moves queued as one
+# batch). Otherwise the robot's own arc is used, raised with minimumZHeight
+# if an obstacle the robot does not know about (add_obstacle) needs it.
+#
+#   oc = opentronsClient(strRobotIP, boolPlanTravel=True)
+#   oc.travel.add_obstacle(slot=8, height=120)       # e.g. camera mount
+#   ...
+#   print(oc.travel.summary())
+#
+# Geometry comes from the labware definitions (cornerOffsetFromSlot,
+# dimensions, wells); if any labware on the deck has no known geometry the
+# planner falls back to the robot's default arc for every move.
+
+from __future__ import annotations
+
+import threading
+from typing import Optional, Union
+
+# slot -> (x, y) of the slot's front-left corner in deck coordinates (mm)
+OT2_SLOTS = {
+    "1": (0.0, 0.0), "2": (132.5, 0.0), "3": (265.0, 0.0),
+    "4": (0.0, 90.5), "5": (132.5, 90.5), "6": (265.0, 90.5),
+    "7": (0.0, 181.0), "8": (132.5, 181.0), "9": (265.0, 181.0),
+    "10": (0.0, 271.5), "11": (132.5, 271.5), "12": (265.0, 271.5),
+}
+FLEX_SLOTS = {f"{row}{col}": (164.0 * (col - 1), 107.0 * "DCBA".index(row))
+              for row in "ABCD" for col in (1, 2, 3)}
+SLOT_SIZE = (127.76, 85.48)
+
+# OT-2 fixed trash in slot 12 (opentrons_1_trash_1100ml_fixed)
+OT2_FIXED_TRASH_HEIGHT = 82.0
+
+# protocol engine arc margin between different labware
+ENGINE_ARC_MARGIN_MM = 10.0
+
+
+def _segment_hits_rect(p0, p1, rect) -> bool:
+    # Liang-Barsky clip of the segment p0-p1 against the axis-aligned rect
+    (x0, y0), (x1, y1) = p0, p1
+    xmin, ymin, xmax, ymax = rect
+    dx, dy = x1 - x0, y1 - y0
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x0 - xmin), (dx, xmax - x0), (-dy, y0 - ymin), (dy, ymax - y0)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
+class _Item:
+    __slots__ = ("name", "slot", "rect", "height", "definition", "origin", "known_to_robot")
+
+    def __init__(self, name, slot, rect, height, definition=None, origin=(0.0, 0.0, 0.0), known_to_robot=True):
+        self.name = name
+        self.slot = slot
+        self.rect = rect              # (xmin, ymin, xmax, ymax) in deck coordinates
+        self.height = height          # top, deck z (mm)
+        self.definition = definition
+        self.origin = origin          # labware origin in deck coordinates
+        self.known_to_robot = known_to_robot
+
+
+class TravelPlan:
+    __slots__ = ("from_name", "from_well", "from_top", "to_top", "z", "engine_z", "direct", "minimum_z")
+
+    def __init__(self, from_name, from_well, from_top, to_top, z, engine_z, direct, minimum_z):
+        self.from_name = from_name
+        self.from_well = from_well
+        self.from_top = from_top      # deck z of the source well top
+        self.to_top = to_top          # deck z of the destination well top
+        self.z = z                    # planned travel height (deck z)
+        self.engine_z = engine_z      # the robot's own arc height
+        self.direct = direct          # climb / cross / descend with forceDirect moves
+        self.minimum_z = minimum_z    # minimumZHeight for a normal move (None: not needed)
+
+    def __repr__(self) -> str:
+        mode = "direct" if self.direct else "arc"
+        return f"TravelPlan({mode}, z={self.z:.1f}, robot arc={self.engine_z:.1f})"
+
+
+class TravelPlanner:
+    def __init__(self, strRobot: str = "ot2", margin_mm: float = ENGINE_ARC_MARGIN_MM,
+                 clearance_xy_mm: float = 10.0, min_saving_mm: float = 10.0, enabled: bool = False) -> None:
+        self.robot = strRobot
+        self.slots = FLEX_SLOTS if strRobot == "flex" else OT2_SLOTS
+        self.margin_mm = margin_mm
+        self.clearance_xy_mm = clearance_xy_mm
+        self.min_saving_mm = min_saving_mm
+        self.enabled = enabled
+        self._items: dict[str, _Item] = {}        # labware ID (or obstacle key) -> item
+        self._unknown: set[str] = set()           # loaded labware without geometry
+        self._lock = threading.Lock()
+        self.stats = {"planned": 0, "direct": 0, "raised": 0, "z_saved_mm": 0.0}
+        if strRobot != "flex":
+            self.add_obstacle(12, OT2_FIXED_TRASH_HEIGHT, name="fixed-trash", known_to_robot=True)
+
+    # Deck map
+    def _slot_origin(self, slot: Union[int, str]) -> tuple[float, float]:
+        return self.slots[str(slot)]
+
+    def add_labware(self, strLabwareID: str, strLabwareName: str, slot: Union[int, str],
+                    dicDefinition: Optional[dict]) -> None:
+        if not dicDefinition or str(slot) not in self.slots:
+            with self._lock:
+                self._items.pop(strLabwareID, None)
+                self._unknown.add(strLabwareID)
+            return
+        sx, sy = self._slot_origin(slot)
+        corner = dicDefinition.get("cornerOffsetFromSlot", {})
+        dims = dicDefinition["dimensions"]
+        ox, oy, oz = sx + corner.get("x", 0.0), sy + corner.get("y", 0.0), corner.get("z", 0.0)
+        item = _Item(strLabwareName, str(slot), (ox, oy, ox + dims["xDimension"], oy + dims["yDimension"]),
+                     oz + dims["zDimension"], dicDefinition, (ox, oy, oz))
+        with self._lock:
+            self._items[strLabwareID] = item
+            self._unknown.discard(strLabwareID)
+
+    def stack_labware(self, strLabwareID: str, strParentID: str) -> None:
+        """moveLabware onto another labware: same footprint, stacked on the parent's top."""
+        with self._lock:
+            item, parent = self._items.get(strLabwareID), self._items.get(strParentID)
+            if item is None or parent is None:
+                self._items.pop(strLabwareID, None)
+                self._unknown.add(strLabwareID)
+                return
+            dims = item.definition["dimensions"]
+            corner = item.definition.get("cornerOffsetFromSlot", {})
+            ox, oy = parent.rect[0] + corner.get("x", 0.0), parent.rect[1] + corner.get("y", 0.0)
+            oz = parent.height
+            item.slot = parent.slot
+            item.origin = (ox, oy, oz)
+            item.rect = (ox, oy, ox + dims["xDimension"], oy + dims["yDimension"])
+            item.height = oz + dims["zDimension"]
+
+    def add_obstacle(self, slot: Union[int, str], height: float, name: Optional[str] = None,
+                     known_to_robot: bool = False) -> None:
+        """Something tall the robot does not know about (fixtures, mounts), covering a whole slot."""
+        sx, sy = self._slot_origin(slot)
+        key = f"obstacle:{name or slot}"
+        with self._lock:
+            self._items[key] = _Item(name or key, str(slot), (sx, sy, sx + SLOT_SIZE[0], sy + SLOT_SIZE[1]),
+                                     float(height), known_to_robot=known_to_robot)
+
+    def remove(self, strLabwareID: str) -> None:
+        with self._lock:
+            self._items.pop(strLabwareID, None)
+            self._unknown.discard(strLabwareID)
+
+    def well_position(self, strLabwareID: str, strWellName: str) -> Optional[tuple[float, float, float]]:
+        """(x, y, z of the well top) in deck coordinates."""
+        item = self._items.get(strLabwareID)
+        if item is None or item.definition is None:
+            return None
+        well = item.definition["wells"].get(strWellName)
+        if well is None:
+            return None
+        ox, oy, oz = item.origin
+        return ox + well["x"], oy + well["y"], oz + well["z"] + well["depth"]
+
+    # Planning
+    def plan(self, from_location: Optional[tuple], strLabwareID: str, strWellName: str,
+             fltOffsetX: float = 0.0, fltOffsetY: float = 0.0) -> Optional[TravelPlan]:
+        """
+        Plan the hop from from_location = (labware ID, well, x offset, y offset)
+        to a well. None when the robot's default move should be used as is
+        (same labware, unknown start or unknown geometry).
+        """
+        if not self.enabled or from_location is None:
+            return None
+        from_id, from_well, from_dx, from_dy = from_location
+        if from_id == strLabwareID:
+            return None
+        with self._lock:
+            if self._unknown:
+                return None
+            start = self.well_position(from_id, from_well)
+            end = self.well_position(strLabwareID, strWellName)
+            if start is None or end is None:
+                return None
+            p0 = (start[0] + from_dx, start[1] + from_dy)
+            p1 = (end[0] + fltOffsetX, end[1] + fltOffsetY)
+            c = self.clearance_xy_mm
+            crossed = [item for key, item in self._items.items()
+                       if key in (from_id, strLabwareID)
+                       or _segment_hits_rect(p0, p1, (item.rect[0] - c, item.rect[1] - c,
+                                                      item.rect[2] + c, item.rect[3] + c))]
+            z = max(item.height for item in crossed) + self.margin_mm
+            engine_z = max(item.height for item in self._items.values() if item.known_to_robot) \
+                + ENGINE_ARC_MARGIN_MM
+            direct = z + self.min_saving_mm <= engine_z
+            minimum_z = None if direct or z <= engine_z else z
+            self.stats["planned"] += 1
+            if direct:
+                self.stats["direct"] += 1
+                self.stats["z_saved_mm"] += 2 * (engine_z - z)
+            elif minimum_z is not None:
+                self.stats["raised"] += 1
+            return TravelPlan(self._items[from_id].name, from_well, start[2], end[2], z, engine_z, direct, minimum_z)
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"Travel planner: {s['planned']} hop(s) planned, {s['direct']} direct "
+                f"({s['z_saved_mm']:.0f} mm of Z travel saved), {s['raised']} raised for extra obstacles")
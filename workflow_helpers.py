@@ -5,10 +5,17 @@ import json
 import logging 
 import threading 
 import csv 
+import queue
+from collections import deque
 from datetime import datetime
 
 import cv2 
-import paramiko 
+
+from camera_service import get_camera, get_capture_pipeline
+from liquid_classes import get_liquid_classes
+
+# lowest tip position when mixing at a tracked liquid level (mm above the well bottom)
+MIX_MIN_FROM_BOTTOM_MM = 1.0
 
 # define helper functions to manage solution
 def fillWell(
@@ -27,8 +34,9 @@ def fillWell(
     fltOffsetX_to: float = 0,
     fltOffsetY_to: float = 0,
     fltOffsetZ_to: float = 0,
-    intMoveSpeed : int = 100, 
+    intMoveSpeed : int = None, 
     needMixing: bool = False,
+    strSolutionName: str = None,
 ) -> None:
     '''
     function to manage solution in a well because the maximum volume the opentrons can move is 1000 uL
@@ -66,11 +74,23 @@ def fillWell(
 
     intMoveSpeed : int
         speed to move in mm/s
-        default: 100
+        default: None (the liquid class move speed)
+
+    strSolutionName : str
+        solution being moved, selects the liquid class (flow rates, blowout, air gap, speed)
+        default: None (what the ledger says the source well holds)
     '''
-    
-    # while the volume is greater than 1000 uL
-    while intVolume > 1000:
+    objLiquidClass = _liquid_class(opentronsClient, strLabwareName_from, strWellName_from, strSolutionName)
+    if intMoveSpeed is None:
+        intMoveSpeed = objLiquidClass.move_speed
+    intAirGap = int(objLiquidClass.air_gap_uL)
+    # the air gap shares the 1000 uL tip with the liquid
+    intMaxChunk = 1000 - intAirGap
+
+    # transfer one tip-load at a time
+    while intVolume > 0:
+        intChunk = min(intVolume, intMaxChunk)
+
         # move to the well to aspirate from
         opentronsClient.moveToWell(strLabwareName = strLabwareName_from,
                                    strWellName = strWellName_from,
@@ -82,17 +102,31 @@ def fillWell(
                                    
         time.sleep(0.01)
         
-        # aspirate 1000 uL
+        # aspirate up to one tip
         opentronsClient.aspirate(strLabwareName = strLabwareName_from,
                                  strWellName = strWellName_from,
                                  strPipetteName = strPipetteName,
-                                 intVolume = 1000,
+                                 intVolume = intChunk,
+                                 fltFlowRate = objLiquidClass.aspirate_flow_rate,
                                  strOffsetStart = strOffsetStart_from,
                                  fltOffsetX = fltOffsetX_from,
                                  fltOffsetY = fltOffsetY_from,
                                  fltOffsetZ = fltOffsetZ_from)
 
         time.sleep(0.01)
+
+        # air gap above the source so nothing drips on the way
+        if intAirGap:
+            opentronsClient.moveToWell(strLabwareName = strLabwareName_from,
+                                       strWellName = strWellName_from,
+                                       strPipetteName = strPipetteName,
+                                       strOffsetStart = 'top',
+                                       fltOffsetX = fltOffsetX_from,
+                                       fltOffsetY = fltOffsetY_from,
+                                       intSpeed = intMoveSpeed)
+            opentronsClient.airGap(strPipetteName = strPipetteName,
+                                   intVolume = intAirGap,
+                                   fltFlowRate = objLiquidClass.aspirate_flow_rate)
         
         # move to the well to dispense to
         opentronsClient.moveToWell(strLabwareName = strLabwareName_to,
@@ -105,11 +139,12 @@ def fillWell(
 
         time.sleep(0.01)
         
-        # dispense 1000 uL
+        # dispense the liquid (and the air gap)
         opentronsClient.dispense(strLabwareName = strLabwareName_to,
                                  strWellName = strWellName_to,
                                  strPipetteName = strPipetteName,
-                                 intVolume = 1000,
+                                 intVolume = intChunk + intAirGap,
+                                 fltFlowRate = objLiquidClass.dispense_flow_rate,
                                  strOffsetStart = strOffsetStart_to,
                                  fltOffsetX = fltOffsetX_to,
                                  fltOffsetY = fltOffsetY_to,
@@ -117,92 +152,351 @@ def fillWell(
 
         time.sleep(0.01)
         
-        opentronsClient.blowout(strLabwareName = strLabwareName_to,
-                                strWellName = strWellName_to,
-                                strPipetteName = strPipetteName,
-                                strOffsetStart = strOffsetStart_to,
-                                fltOffsetX = fltOffsetX_to,
-                                fltOffsetY = fltOffsetY_to,
-                                fltOffsetZ = fltOffsetZ_to)
+        if objLiquidClass.blowout:
+            opentronsClient.blowout(strLabwareName = strLabwareName_to,
+                                    strWellName = strWellName_to,
+                                    strPipetteName = strPipetteName,
+                                    fltFlowRate = objLiquidClass.blowout_flow_rate,
+                                    strOffsetStart = strOffsetStart_to,
+                                    fltOffsetX = fltOffsetX_to,
+                                    fltOffsetY = fltOffsetY_to,
+                                    fltOffsetZ = fltOffsetZ_to)
 
-        time.sleep(0.01)
+            time.sleep(0.01)
         
-        # subtract 1000 uL from the volume
-        intVolume -= 1000
-    
-        # move to the well to aspirate from
-    opentronsClient.moveToWell(strLabwareName = strLabwareName_from,
-                               strWellName = strWellName_from,
-                               strPipetteName = strPipetteName,
-                               strOffsetStart = 'top',
-                               fltOffsetX = fltOffsetX_from,
-                               fltOffsetY = fltOffsetY_from,
-                               intSpeed = intMoveSpeed)
-    
-    # aspirate the remaining volume
-    opentronsClient.aspirate(strLabwareName = strLabwareName_from,
-                             strWellName = strWellName_from,
-                             strPipetteName = strPipetteName,
-                             intVolume = intVolume,
-                             strOffsetStart = strOffsetStart_from,
-                             fltOffsetX = fltOffsetX_from,
-                             fltOffsetY = fltOffsetY_from,
-                             fltOffsetZ = fltOffsetZ_from)
-    
-    # move to the well to dispense to
-    opentronsClient.moveToWell(strLabwareName = strLabwareName_to,
-                               strWellName = strWellName_to,
-                               strPipetteName = strPipetteName,
-                               strOffsetStart = 'top',
-                               fltOffsetX = fltOffsetX_to,
-                               fltOffsetY = fltOffsetY_to,
-                               intSpeed = intMoveSpeed)
-    
-    # dispense the remaining volume
-    opentronsClient.dispense(strLabwareName = strLabwareName_to,
-                             strWellName = strWellName_to,
-                             strPipetteName = strPipetteName,
-                             intVolume = intVolume,
-                             strOffsetStart = strOffsetStart_to,
-                             fltOffsetX = fltOffsetX_to,
-                             fltOffsetY = fltOffsetY_to,
-                             fltOffsetZ = fltOffsetZ_to)
-    
-    # blowout
-    opentronsClient.blowout(strLabwareName = strLabwareName_to,
-                            strWellName = strWellName_to,
-                            strPipetteName = strPipetteName,
-                            strOffsetStart = strOffsetStart_to,
-                            fltOffsetX = fltOffsetX_to,
-                            fltOffsetY = fltOffsetY_to,
-                            fltOffsetZ = fltOffsetZ_to)
+        # subtract the transferred volume
+        intVolume -= intChunk
     
     if needMixing: 
-        for i in range(6):
-            print("mixing cycle: ", i+1)
-            opentronsClient.aspirate(strLabwareName = strLabwareName_to,
-                                strWellName = strWellName_to,
-                                strPipetteName = strPipetteName,
-                                intVolume = 1000,
-                                strOffsetStart = strOffsetStart_to,
-                                fltOffsetX = fltOffsetX_to,
-                                fltOffsetY = fltOffsetY_to,
-                                fltOffsetZ = -30)
-                            
-            time.sleep(0.01)
-
-            opentronsClient.dispense(strLabwareName = strLabwareName_to,
-                                strWellName = strWellName_to,
-                                strPipetteName = strPipetteName,
-                                intVolume = 1000,
-                                strOffsetStart = strOffsetStart_to,
-                                fltOffsetX = fltOffsetX_to,
-                                fltOffsetY = fltOffsetY_to,
-                                fltOffsetZ = -30)
+        mix(opentronsClient,
+            strLabwareName = strLabwareName_to,
+            strWellName = strWellName_to,
+            strPipetteName = strPipetteName,
+            intCycles = 6,
+            strOffsetStart = strOffsetStart_to,
+            fltOffsetX = fltOffsetX_to,
+            fltOffsetY = fltOffsetY_to,
+            strSolutionName = strSolutionName)
         
     return
 
 
+def _liquid_class(opentronsClient, strLabwareName, strWellName, strSolutionName=None):
+    # explicit solution name, else what the ledger says the well holds
+    if strSolutionName is None:
+        strSolutionName = opentronsClient.ledger.contents(strLabwareName, strWellName)
+    return get_liquid_classes().for_solution(strSolutionName)
+
+
+def mix(
+    opentronsClient,
+    strLabwareName,
+    strWellName,
+    strPipetteName,
+    intCycles: int = 6,
+    intVolume: int = None,
+    strOffsetStart: str = 'top',
+    fltOffsetX: float = 0,
+    fltOffsetY: float = 0,
+    fltOffsetZ: float = None,
+    strSolutionName: str = None,
+) -> None:
+    '''
+    mixes a well with repeated aspirate/dispense cycles, queued as one command batch
+
+    Parameters
+    ----------
+    intCycles : int
+        number of aspirate/dispense cycles
+        default: 6
+
+    intVolume : int
+        mix volume in uL
+        default: None (80% of the tracked well volume, max 1000 uL, capped so the tip stays
+        submerged after aspirating; 1000 uL if unknown)
+
+    fltOffsetZ : float
+        tip z offset relative to strOffsetStart
+        default: None (submerge depth of the liquid class below the liquid surface left after
+        aspirating intVolume, at least MIX_MIN_FROM_BOTTOM_MM above the bottom; -30 if unknown)
+
+    strSolutionName : str
+        selects the liquid class (flow rates, submerge depth)
+        default: None (the well's ledger contents)
+    '''
+    objLiquidClass = _liquid_class(opentronsClient, strLabwareName, strWellName, strSolutionName)
+    # mix volume / tip depth from the tracked well volume; the old fixed
+    # 1000 uL at z=-30 is only used when the level is unknown
+    fltWellVolume = opentronsClient.ledger.volume(strLabwareName, strWellName)
+    if intVolume is None:
+        intVolume = int(min(1000, 0.8 * fltWellVolume)) if fltWellVolume else 1000
+        # the surface drops by the mix volume while the tip holds its depth:
+        # keep the level after aspirating at least submerge_mm above the
+        # lowest tip position (height is linear in volume)
+        fltHeight = opentronsClient.ledger.liquid_height(strLabwareName, strWellName)
+        if fltWellVolume and fltHeight:
+            fltMinHeight = MIX_MIN_FROM_BOTTOM_MM + objLiquidClass.submerge_mm
+            intVolume = int(max(0, min(intVolume, fltWellVolume * (1 - fltMinHeight / fltHeight))))
+            if intVolume <= 0:
+                logging.warning(f"Skipping mix of {strLabwareName}/{strWellName}: "
+                                f"{fltWellVolume:.0f} uL is too shallow to mix without drawing air")
+                return
+    if fltOffsetZ is None:
+        fltOffsetZ = -30
+        if fltWellVolume:
+            fltZ = opentronsClient.ledger.submerged_z(strLabwareName, strWellName,
+                                                      origin=strOffsetStart,
+                                                      submerge_mm=objLiquidClass.submerge_mm,
+                                                      min_from_bottom_mm=MIX_MIN_FROM_BOTTOM_MM,
+                                                      removed_uL=intVolume)
+            if fltZ is not None:
+                fltOffsetZ = fltZ
+
+    logging.info(f"Mixing {strLabwareName}/{strWellName}: {intCycles} x {intVolume} uL")
+    with opentronsClient.commandBatch():
+        for i in range(intCycles):
+            opentronsClient.aspirate(strLabwareName = strLabwareName,
+                                     strWellName = strWellName,
+                                     strPipetteName = strPipetteName,
+                                     intVolume = intVolume,
+                                     fltFlowRate = objLiquidClass.aspirate_flow_rate,
+                                     strOffsetStart = strOffsetStart,
+                                     fltOffsetX = fltOffsetX,
+                                     fltOffsetY = fltOffsetY,
+                                     fltOffsetZ = fltOffsetZ)
+
+            opentronsClient.dispense(strLabwareName = strLabwareName,
+                                     strWellName = strWellName,
+                                     strPipetteName = strPipetteName,
+                                     intVolume = intVolume,
+                                     fltFlowRate = objLiquidClass.dispense_flow_rate,
+                                     strOffsetStart = strOffsetStart,
+                                     fltOffsetX = fltOffsetX,
+                                     fltOffsetY = fltOffsetY,
+                                     fltOffsetZ = fltOffsetZ)
+
+
+def _pack_volumes(lstTargets, intMaxVolume):
+    # split volumes above the tip capacity, then group consecutive targets so
+    # every group fits in one aspirate
+    lstParts = []
+    for strWell, intVol in lstTargets:
+        while intVol > intMaxVolume:
+            lstParts.append((strWell, intMaxVolume))
+            intVol -= intMaxVolume
+        if intVol > 0:
+            lstParts.append((strWell, intVol))
+    lstGroups, lstGroup, intSum = [], [], 0
+    for strWell, intVol in lstParts:
+        if lstGroup and intSum + intVol > intMaxVolume:
+            lstGroups.append(lstGroup)
+            lstGroup, intSum = [], 0
+        lstGroup.append((strWell, intVol))
+        intSum += intVol
+    if lstGroup:
+        lstGroups.append(lstGroup)
+    return lstGroups
+
+
+def distribute(
+    opentronsClient,
+    strLabwareName_from,
+    strWellName_from,
+    strPipetteName,
+    strLabwareName_to,
+    lstWellNames_to,
+    volumes,
+    strOffsetStart_from: str = 'bottom',
+    strOffsetStart_to: str = 'top',
+    fltOffsetZ_from: float = 0,
+    fltOffsetZ_to: float = 0,
+    intMaxVolume: int = 1000,
+    intDisposalVolume: int = 0,
+    intMoveSpeed: int = None,
+    strSolutionName: str = None,
+) -> int:
+    '''
+    one source into many wells: each aspirate feeds as many dispenses as fit in the tip,
+    all queued as one command batch (the tip stays above the destinations, no contact)
+
+    Parameters
+    ----------
+    lstWellNames_to : list[str]
+        destination wells on strLabwareName_to
+
+    volumes : int | list[int]
+        uL per destination well (one value for all, or one per well)
+
+    intMaxVolume : int
+        tip capacity in uL
+        default: 1000
+
+    intDisposalVolume : int
+        extra uL aspirated with every load and returned to the source at the end of it,
+        so the last dispense is as accurate as the first
+        default: 0
+
+    intMoveSpeed : int
+        gantry speed in mm/s
+        default: None (the liquid class move speed)
+
+    strSolutionName : str
+        selects the liquid class (flow rates, blowout, speed)
+        default: None (the source well's ledger contents)
+
+    Returns
+    -------
+    int
+        number of aspirates (trips to the source)
+    '''
+    if isinstance(volumes, (int, float)):
+        volumes = [volumes] * len(lstWellNames_to)
+    if len(volumes) != len(lstWellNames_to):
+        raise ValueError("distribute: one volume per destination well expected")
+
+    objLiquidClass = _liquid_class(opentronsClient, strLabwareName_from, strWellName_from, strSolutionName)
+    if intMoveSpeed is None:
+        intMoveSpeed = objLiquidClass.move_speed
+
+    lstGroups = _pack_volumes(list(zip(lstWellNames_to, volumes)), intMaxVolume - intDisposalVolume)
+
+    with opentronsClient.commandBatch():
+        for lstGroup in lstGroups:
+            opentronsClient.moveToWell(strLabwareName = strLabwareName_from,
+                                       strWellName = strWellName_from,
+                                       strPipetteName = strPipetteName,
+                                       strOffsetStart = 'top',
+                                       intSpeed = intMoveSpeed)
+            opentronsClient.aspirate(strLabwareName = strLabwareName_from,
+                                     strWellName = strWellName_from,
+                                     strPipetteName = strPipetteName,
+                                     fltFlowRate = objLiquidClass.aspirate_flow_rate,
+                                     intVolume = sum(v for _, v in lstGroup) + intDisposalVolume,
+                                     strOffsetStart = strOffsetStart_from,
+                                     fltOffsetZ = fltOffsetZ_from)
+            for strWell, intVol in lstGroup:
+                opentronsClient.moveToWell(strLabwareName = strLabwareName_to,
+                                           strWellName = strWell,
+                                           strPipetteName = strPipetteName,
+                                           strOffsetStart = 'top',
+                                           intSpeed = intMoveSpeed)
+                opentronsClient.dispense(strLabwareName = strLabwareName_to,
+                                         strWellName = strWell,
+                                         strPipetteName = strPipetteName,
+                                         fltFlowRate = objLiquidClass.dispense_flow_rate,
+                                         intVolume = intVol,
+                                         strOffsetStart = strOffsetStart_to,
+                                         fltOffsetZ = fltOffsetZ_to)
+            # return the disposal volume and clear the tip over the source
+            if intDisposalVolume:
+                opentronsClient.dispense(strLabwareName = strLabwareName_from,
+                                         strWellName = strWellName_from,
+                                         strPipetteName = strPipetteName,
+                                         fltFlowRate = objLiquidClass.dispense_flow_rate,
+                                         intVolume = intDisposalVolume,
+                                         strOffsetStart = 'top')
+            opentronsClient.blowout(strLabwareName = strLabwareName_from,
+                                    strWellName = strWellName_from,
+                                    strPipetteName = strPipetteName,
+                                    fltFlowRate = objLiquidClass.blowout_flow_rate,
+                                    strOffsetStart = 'top')
+
+    logging.info(f"Distributed {strLabwareName_from}/{strWellName_from} into {len(lstWellNames_to)} well(s) "
+                 f"with {len(lstGroups)} aspirate(s)")
+    return len(lstGroups)
+
+
+def consolidate(
+    opentronsClient,
+    strLabwareName_from,
+    lstWellNames_from,
+    volumes,
+    strPipetteName,
+    strLabwareName_to,
+    strWellName_to,
+    strOffsetStart_from: str = 'bottom',
+    strOffsetStart_to: str = 'top',
+    fltOffsetZ_from: float = 0,
+    fltOffsetZ_to: float = 0,
+    intMaxVolume: int = 1000,
+    intMoveSpeed: int = None,
+    strSolutionName: str = None,
+) -> int:
+    '''
+    many wells into one: aspirates from several sources per load, then one dispense + blowout
+    into the destination, all queued as one command batch
+
+    Parameters
+    ----------
+    lstWellNames_from : list[str]
+        source wells on strLabwareName_from
+
+    volumes : int | list[int]
+        uL to take from each source well (one value for all, or one per well)
+
+    intMoveSpeed : int
+        gantry speed in mm/s
+        default: None (the liquid class move speed)
+
+    strSolutionName : str
+        selects the liquid class (flow rates, blowout, speed)
+        default: None (the source well's ledger contents)
+
+    Returns
+    -------
+    int
+        number of dispenses (trips to the destination)
+    '''
+    if isinstance(volumes, (int, float)):
+        volumes = [volumes] * len(lstWellNames_from)
+    if len(volumes) != len(lstWellNames_from):
+        raise ValueError("consolidate: one volume per source well expected")
+
+    objLiquidClass = _liquid_class(opentronsClient, strLabwareName_from, lstWellNames_from[0] if lstWellNames_from else None, strSolutionName)
+    if intMoveSpeed is None:
+        intMoveSpeed = objLiquidClass.move_speed
+
+    lstGroups = _pack_volumes(list(zip(lstWellNames_from, volumes)), intMaxVolume)
+
+    with opentronsClient.commandBatch():
+        for lstGroup in lstGroups:
+            for strWell, intVol in lstGroup:
+                opentronsClient.moveToWell(strLabwareName = strLabwareName_from,
+                                           strWellName = strWell,
+                                           strPipetteName = strPipetteName,
+                                           strOffsetStart = 'top',
+                                           intSpeed = intMoveSpeed)
+                opentronsClient.aspirate(strLabwareName = strLabwareName_from,
+                                         strWellName = strWell,
+                                         strPipetteName = strPipetteName,
+                                         fltFlowRate = objLiquidClass.aspirate_flow_rate,
+                                         intVolume = intVol,
+                                         strOffsetStart = strOffsetStart_from,
+                                         fltOffsetZ = fltOffsetZ_from)
+            opentronsClient.moveToWell(strLabwareName = strLabwareName_to,
+                                       strWellName = strWellName_to,
+                                       strPipetteName = strPipetteName,
+                                       strOffsetStart = 'top',
+                                       intSpeed = intMoveSpeed)
+            opentronsClient.dispense(strLabwareName = strLabwareName_to,
+                                     strWellName = strWellName_to,
+                                     strPipetteName = strPipetteName,
+                                     fltFlowRate = objLiquidClass.dispense_flow_rate,
+                                     intVolume = sum(v for _, v in lstGroup),
+                                     strOffsetStart = strOffsetStart_to,
+                                     fltOffsetZ = fltOffsetZ_to)
+            opentronsClient.blowout(strLabwareName = strLabwareName_to,
+                                    strWellName = strWellName_to,
+                                    strPipetteName = strPipetteName,
+                                    fltFlowRate = objLiquidClass.blowout_flow_rate,
+                                    strOffsetStart = strOffsetStart_to,
+                                    fltOffsetZ = fltOffsetZ_to)
+
+    logging.info(f"Consolidated {len(lstWellNames_from)} well(s) into {strLabwareName_to}/{strWellName_to} "
+                 f"with {len(lstGroups)} dispense(s)")
+    return len(lstGroups)
+
+
 # define helper function to wash reactor
 def washReactor(oc,
                 strID_NISreactor,
@@ -212,7 +506,10 @@ def washReactor(oc,
                 pumps,
                 prePictureName = None, 
                 postPictureName = None,
-                type='NIS'
+                type='NIS',
+                useSchedule = False,
+                backgroundPictures = False,
+                strMetadataPath = None
                 ):
     '''
     function to wash reactor
@@ -228,6 +525,19 @@ def washReactor(oc,
     intCycle : int
         number of cycles to wash electrode
 
+    useSchedule : bool
+        run the 4x fill/drain rinse as one device-side pump schedule
+        (needs pump firmware with <base>/schedule support)
+        default: False
+
+    backgroundPictures : bool
+        download/write the pre/post pictures in the background while the
+        robot keeps moving (call wait_pictures() before using the files)
+        default: False
+
+    strMetadataPath : str
+        if given, capture info of each picture is recorded in the well metadata
+
     '''
 
     # rinse cycle 4 times: nozzle immerse 3 times
@@ -270,8 +580,7 @@ def washReactor(oc,
 
         time.sleep(0.01)
 
-        pumps.on(3, 10000)  # out for 10 s (auto-off)
-        time.sleep(11)
+        pumps.pulse(3, 10000)  # out for 10 s (returns on OFF ack)
 
         oc.moveToWell(
                 strLabwareName=strID_NISreactor,
@@ -284,8 +593,7 @@ def washReactor(oc,
                 intSpeed=50
             )
 
-        pumps.on(3, 10000)  # out for 10 s (auto-off)
-        time.sleep(11)
+        pumps.pulse(3, 10000)  # out for 10 s (returns on OFF ack)
 
         oc.moveToWell(
                 strLabwareName=strID_NISreactor,
@@ -300,8 +608,7 @@ def washReactor(oc,
 
         time.sleep(0.01)
 
-        pumps.on(3, 10000)  # out for 10 s (auto-off)
-        time.sleep(11)
+        pumps.pulse(3, 10000)  # out for 10 s (returns on OFF ack)
 
     elif type == 'Yang':
         oc.moveToWell(
@@ -317,8 +624,7 @@ def washReactor(oc,
 
         time.sleep(0.01)
 
-        pumps.on(3, 10000)  # out for 10 s (auto-off)
-        time.sleep(11)
+        pumps.pulse(3, 10000)  # out for 10 s (returns on OFF ack)
 
         oc.moveToWell(
                 strLabwareName=strID_NISreactor,
@@ -331,8 +637,7 @@ def washReactor(oc,
                 intSpeed=50
             )
 
-        pumps.on(3, 10000)  # out for 10 s (auto-off)
-        time.sleep(11)
+        pumps.pulse(3, 10000)  # out for 10 s (returns on OFF ack)
 
         oc.moveToWell(
                 strLabwareName=strID_NISreactor,
@@ -347,8 +652,7 @@ def washReactor(oc,
 
         time.sleep(0.01)
 
-        pumps.on(3, 10000)  # out for 10 s (auto-off)
-        time.sleep(11)
+        pumps.pulse(3, 10000)  # out for 10 s (returns on OFF ack)
 
     if prePictureName is not None:
         # put nozzle back to tip rack
@@ -391,7 +695,8 @@ def washReactor(oc,
 
         time.sleep(0.01)
 
-        take_picture(oc, strID_NISreactor, strWell2Test, prePictureName, well_path)
+        take_picture(oc, strID_NISreactor, strWell2Test, prePictureName, well_path,
+                     background=backgroundPictures, strMetadataPath=strMetadataPath)
         logging.info("Taken pre-wash picture.")
 
         time.sleep(0.01)
@@ -435,11 +740,16 @@ def washReactor(oc,
 
         time.sleep(0.01)
 
-    for i in range(4):
-        pumps.on(2, 2000)  # add H2O for 2 s (auto-off)
-        time.sleep(3)
-        pumps.on(3, 10000)  # out for 10 s (auto-off)
-        time.sleep(11)
+    if useSchedule:
+        # one publish; the pump node times the whole rinse and reports completion
+        pumps.schedule([(2, "on", 2000), (3, "on", 10000)], repeat=4)
+    else:
+        for i in range(4):
+            pumps.pulse(2, 2000)  # add H2O for 2 s (returns on OFF ack)
+            pumps.pulse(3, 10000)  # out for 10 s (returns on OFF ack)
+
+    # the pumps drained the well behind the pipette's back
+    oc.ledger.set_volume(strID_NISreactor, strWell2Test, 0)
 
     # put nozzle back to tip rack
     oc.moveToWell(
@@ -482,7 +792,8 @@ def washReactor(oc,
     time.sleep(0.01)
 
     if postPictureName is not None:
-        take_picture(oc, strID_NISreactor, strWell2Test, postPictureName, well_path)
+        take_picture(oc, strID_NISreactor, strWell2Test, postPictureName, well_path,
+                     background=backgroundPictures, strMetadataPath=strMetadataPath)
         logging.info("Taken post-wash picture.")
 
     logging.info("Finished washing reactor in well %s.", strWell2Test)
@@ -543,10 +854,8 @@ def washTip(
         )
         time.sleep(1)
 
-        # Sonicate
-        ultra.on(sonicator_channel, sonication_ms)
-        # sonication_ms is in ms; wait a bit longer than the sonication
-        time.sleep(sonication_ms / 1000.0 + 1)
+        # Sonicate; returns as soon as the node acknowledges OFF
+        ultra.pulse(sonicator_channel, sonication_ms)
 
         # Move back above bath
         oc.moveToWell(
@@ -567,7 +876,25 @@ def washTip(
     _wash_in_well("A1")  # water
 
 
-def take_picture(oc, strID_NISreactor, strWellName, imageName, well_dir): 
+# Raspberry Pi camera (persistent session, see camera_service.py)
+PI_HOSTNAME = '192.168.0.108'
+# PI_HOSTNAME = '100.66.74.87'  # ⬅️ Replace this with your Raspberry Pi's real IP address
+PI_USERNAME = 'ot2-pi'
+PI_PASSWORD = '1144'
+
+
+def take_picture(oc, strID_NISreactor, strWellName, imageName, well_dir, camera=None, settle_s=1.0,
+                 background=False, strMetadataPath=None):
+    """
+    Move above the well, lights off, take a picture, lights back on.
+
+    background=False : download + write happen before returning (as before)
+    background=True  : only the exposure is synchronous; the JPEG is downloaded,
+                       checked and written by a worker while the robot moves on.
+                       Returns a Future; call wait_pictures() before relying on the files.
+    If strMetadataPath is given the capture info (well, time, lighting) is added
+    to the well metadata as soon as the image is on disk.
+    """
     oc.moveToWell(strLabwareName = strID_NISreactor,
                 strWellName = strWellName,
                 strPipetteName = 'p1000_single_gen2',
@@ -579,60 +906,46 @@ def take_picture(oc, strID_NISreactor, strWellName, imageName, well_dir):
     time.sleep(3)  # wait for 2 seconds to stabilize
     oc.lights(False)
 
-    # === CONFIGURATION ===
-    hostname = '192.168.0.108'
-
-    # hostname = '100.66.74.87'  # ⬅️ Replace this with your Raspberry Pi's real IP address
-    username = 'ot2-pi'
-    password = '1144'
-    remote_image_path = '/home/ot2-pi/remote_image.jpg'
-    local_image_path = 'remote_image.jpg'
-
-    # === CONNECT TO PI OVER SSH ===
-    print(f"[+] Connecting to {hostname}...")
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(hostname, username=username, password=password)
-    print("[+] SSH connection established.")
-
-    # === RUN REMOTE CAMERA SCRIPT ===
-    command = (
-        "python3 -c \""
-        "from picamera2 import Picamera2; import time; "
-        "picam2 = Picamera2(); "
-        "config=picam2.create_still_configuration(main={'size': (2028, 1520)}); "
-        "picam2.configure(config); "
-        "picam2.set_controls({'AwbEnable': True}); "
-        "picam2.start(); "
-        "time.sleep(2); "
-        f"picam2.capture_file('{remote_image_path}'); "
-        "picam2.close(); "
-        "print('Image captured');"
-        "\""
-    )
-
-    print("[+] Capturing image on the Pi...")
-    stdin, stdout, stderr = ssh.exec_command(command)
-    stdout_output = stdout.read().decode()
-    stderr_output = stderr.read().decode()
+    # camera daemon stays connected and warm between shots; the JPEG is
+    # streamed straight into the well directory (no remote temp file / SFTP)
+    if camera is None:
+        camera = get_camera(PI_HOSTNAME, PI_USERNAME, PI_PASSWORD)
 
     local_image_path = os.path.join(well_dir, imageName)
-
-    if stderr_output:
+    info = {
+        "well": strWellName,
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "lights": "off",
+        "settle_s": settle_s,
+    }
+    try:
+        print("[+] Capturing image on the Pi...")
+        if background:
+            image_id = camera.trigger(settle_s=settle_s)
+        else:
+            camera.capture(local_image_path, settle_s=settle_s)
+            print(f"[+] Image downloaded to {local_image_path}")
+    except Exception as e:
         print("[-] Error during image capture:")
-        print(stderr_output)
-    else:
-        print("[+] Remote output:")
-        print(stdout_output)
+        print(e)
+        logging.error("Image capture failed for %s: %s", local_image_path, e)
+        raise
+    finally:
+        oc.lights(True)
+
+    def _saved(path, info):
+        print(f"[+] Image downloaded to {path}")
+        if strMetadataPath is not None:
+            record_image(strMetadataPath, imageName, info)
+
+    if background:
+        return get_capture_pipeline().submit(camera, image_id, local_image_path, info, _saved)
+    _saved(local_image_path, info)
 
-    # === DOWNLOAD IMAGE FROM PI ===
-    print("[+] Downloading image to laptop...")
-    sftp = ssh.open_sftp()
-    sftp.get(remote_image_path, local_image_path)
-    sftp.close()
-    ssh.close()
-    print(f"[+] Image downloaded to {local_image_path}")
-    oc.lights(True)
+
+def wait_pictures(timeout=None):
+    """Wait until every background picture from take_picture() is on disk."""
+    return get_capture_pipeline().wait(timeout=timeout)
 
 
 def getPipetteTipLocById(intId) -> str:
@@ -689,7 +1002,7 @@ def fillWell_autoSource(
     fltOffsetX_to: float = 0,
     fltOffsetY_to: float = 0,
     fltOffsetZ_to: float = 0,
-    intMoveSpeed: int = 100,
+    intMoveSpeed: int = None,
     needMixing: bool = False,
     experimentName: str = None,
     strMetadataPath: str = None,
@@ -728,6 +1041,7 @@ def fillWell_autoSource(
             fltOffsetZ_to=fltOffsetZ_to,
             intMoveSpeed=intMoveSpeed,
             needMixing=needMixing,
+            strSolutionName=solution_name,
         )
 
 def getWellName(index: int) -> str:
@@ -750,18 +1064,79 @@ def wellNameToIndex(wellName: str) -> int:
     return row * 5 + col + 1
 
 class VideoRecorder:
-    def __init__(self, camera_index=0, width=1280, height=720, fps=30, out_path="experiment.mp4"):
+    """
+    Webcam recorder: a capture thread grabs frames and hands them over a
+    bounded buffer to an encoder thread, so slow writes never stall the camera.
+
+    - frames are kept on a wall-clock grid of 1/fps (extra camera frames are
+      skipped, gaps are filled by repeating the last frame), so video time
+      matches real time
+    - if the encoder falls behind for more than `buffer_s`, frames are dropped
+      and counted instead of blocking capture (see stats())
+    - preroll_s > 0 keeps the last N seconds (JPEG-compressed) in memory;
+      save_preroll() dumps them to a clip, e.g. right after a deposition fails.
+      With record=False only the pre-roll is kept (no full-run file).
+    - segment_s splits the recording into fixed-length files
+      (experiment_0000.mp4, experiment_0001.mp4, ...) plus a sidecar
+      experiment.index.json; mark(name) / record_event(..., recorder=rec)
+      put events in the index so extract_clip() only opens the segments it
+      needs. keep_segments deletes old segments that hold no events.
+    """
+
+    def __init__(self, camera_index=0, width=1280, height=720, fps=30, out_path="experiment.mp4",
+                 preroll_s=0, record=True, buffer_s=2.0, segment_s=None, keep_segments=None,
+                 index_path=None):
         self.camera_index = camera_index
         self.width = width
         self.height = height
         self.fps = fps
         self.out_path = out_path
+        self.preroll_s = preroll_s
+        self.record = record
+        self.buffer_s = buffer_s
+        self.segment_s = segment_s
+        self.keep_segments = keep_segments
+        stem, ext = os.path.splitext(out_path)
+        self._stem, self._ext = stem, ext or ".mp4"
+        self.index_path = index_path or (stem + ".index.json" if segment_s else None)
 
         self.cap = None
         self.out = None
         self.thread = None
+        self.encoder_thread = None
         self.running = False
 
+        self._queue = None
+        self._preroll = deque(maxlen=max(1, int(preroll_s * fps))) if preroll_s > 0 else None
+        self._preroll_lock = threading.Lock()
+        self._t0 = None
+        self._index = None
+        self._index_lock = threading.Lock()
+        self._index_file_lock = threading.Lock()
+        self._encoder_done = threading.Event()
+        self._last_written = None  # (capture time, frame number) of the newest camera frame in the file
+        self._segment = -1
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.frames_captured = 0   # frames accepted from the camera
+        self.frames_written = 0    # frames in the output file (incl. repeats)
+        self.frames_skipped = 0    # camera delivered faster than fps
+        self.frames_dropped = 0    # encoder buffer full
+        self.frames_repeated = 0   # gaps filled to keep real-time pacing
+        self.read_failures = 0
+
+    def stats(self):
+        return {
+            "captured": self.frames_captured,
+            "written": self.frames_written,
+            "skipped": self.frames_skipped,
+            "dropped": self.frames_dropped,
+            "repeated": self.frames_repeated,
+            "read_failures": self.read_failures,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+        }
+
     def start(self):
         if self.running:
             print("Camera is already running.")
@@ -775,35 +1150,336 @@ class VideoRecorder:
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
         self.cap.set(cv2.CAP_PROP_FPS, self.fps)
 
-        # Define the codec and create VideoWriter object
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        self.out = cv2.VideoWriter(self.out_path, fourcc, self.fps, (self.width, self.height))
+        self._reset_stats()
+        self._queue = queue.Queue(maxsize=max(1, int(self.buffer_s * self.fps)))
+        self._t0 = time.monotonic()
+        self._index = {
+            "fps": self.fps,
+            "segment_frames": self._segment_frames(),
+            "start": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "segments": [],
+            "events": [],
+        }
+        self._segment = -1
+        self._last_written = None
+        self._encoder_done.clear()
+        if self.record:
+            self._open_segment(0)
+            self._save_index()
         self.running = True
         self.thread = threading.Thread(target=self._record_loop, daemon=True)
+        self.encoder_thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self.encoder_thread.start()
         self.thread.start()
 
-        logging.info(f"Video recording started -> {self.out_path}")
+        logging.info(f"Video recording started -> {self.out_path if self.record else 'pre-roll only'}")
 
     def _record_loop(self):
+        period = 1.0 / self.fps
+        next_due = self._t0
+        backoff = 0.01
         while self.running:
             ok, frame = self.cap.read()
+            now = time.monotonic()
             if not ok:
-                logging.error("Failed to read frame from camera")
+                # back off instead of spinning; log the first and then every 50th
+                if self.read_failures % 50 == 0:
+                    logging.error("Failed to read frame from camera (%d so far)", self.read_failures + 1)
+                self.read_failures += 1
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 0.5)
                 continue
-            self.out.write(frame)
-            time.sleep(1 / self.fps)
+            backoff = 0.01
 
-    def stop(self):
-        """Stop the video recording."""
+            if now < next_due - period / 2:
+                self.frames_skipped += 1
+                continue
+            next_due = max(next_due + period, now + period / 2)
+
+            self.frames_captured += 1
+            try:
+                self._queue.put_nowait((now, frame))
+            except queue.Full:
+                self.frames_dropped += 1
+
+    def _encode_loop(self):
+        try:
+            self._encode_frames()
+        except Exception:
+            # capture keeps running (frames are dropped once the buffer is
+            # full); stop() notices the dead thread and does not wait for it
+            logging.exception("Video encoder failed after %d frames; no more frames are written",
+                              self.frames_written)
+        finally:
+            self._encoder_done.set()
+
+    def _encode_frames(self):
+        last = None
+        next_index = 0
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            ts, frame = item
+            if self._preroll is not None:
+                ok, jpg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                if ok:
+                    with self._preroll_lock:
+                        self._preroll.append((ts, jpg))
+            if self.out is None:
+                continue
+            index = int(round((ts - self._t0) * self.fps))
+            # repeat the previous frame over gaps (dropped/failed reads) so the
+            # file stays on a real-time clock
+            while last is not None and next_index < index:
+                self._write(last)
+                next_index += 1
+                self.frames_repeated += 1
+            self._write(frame)
+            self._last_written = (ts, self.frames_written - 1)
+            next_index = max(next_index, index) + 1
+            last = frame
+
+    # Segments / index
+    def _segment_frames(self):
+        return int(round(self.segment_s * self.fps)) if self.segment_s else None
+
+    def _segment_file(self, n):
+        if not self.segment_s:
+            return self.out_path
+        return f"{self._stem}_{n:04d}{self._ext}"
+
+    def _open_segment(self, n):
+        if self.out is not None:
+            self.out.release()
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.out = cv2.VideoWriter(self._segment_file(n), fourcc, self.fps, (self.width, self.height))
+        self._segment = n
+        with self._index_lock:
+            self._index["segments"].append({
+                "file": os.path.basename(self._segment_file(n)),
+                "first_frame": self.frames_written,
+                "frames": 0,
+                "start": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            })
+        if n > 0:
+            self._apply_keep_segments()
+            self._save_index()
+
+    def _write(self, frame):
+        seg_frames = self._segment_frames()
+        if seg_frames and self.frames_written // seg_frames != self._segment:
+            self._open_segment(self.frames_written // seg_frames)
+        self.out.write(frame)
+        self.frames_written += 1
+        with self._index_lock:
+            self._index["segments"][-1]["frames"] += 1
+
+    def _locate(self, frame):
+        seg_frames = self._segment_frames()
+        if not seg_frames:
+            return {"file": os.path.basename(self.out_path), "segment": 0, "frame": frame, "offset": frame}
+        n = frame // seg_frames
+        return {"file": os.path.basename(self._segment_file(n)), "segment": n,
+                "frame": frame, "offset": frame - n * seg_frames}
+
+    def mark(self, name, **extra):
+        """
+        Put event `name` (e.g. "before_deposition", "A1_start") at the current
+        frame in the index; returns {"file", "segment", "frame", "offset"}.
+        The frame is counted from the newest camera frame the encoder wrote
+        (the file runs on a real-time clock from its first frame), so camera
+        start-up latency and frames still queued do not shift it.
+        """
+        if not self.running:
+            raise RuntimeError("Recorder is not running")
+        now = time.monotonic()
+        ref = self._last_written
+        # before the first frame reached the file the event belongs at its start
+        frame = 0 if ref is None else max(0, ref[1] + int(round((now - ref[0]) * self.fps)))
+        loc = self._locate(frame)
+        entry = {"name": name, "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **loc, **extra}
+        with self._index_lock:
+            self._index["events"].append(entry)
+        self._save_index()
+        return loc
+
+    def _save_index(self):
+        if not self.index_path or self._index is None:
+            return
+        # called from mark() and from the encoder thread (new segment): one
+        # writer at a time on the temp file, newest snapshot written last
+        with self._index_file_lock:
+            with self._index_lock:
+                data = json.dumps(self._index, ensure_ascii=False, indent=2)
+            tmp = self.index_path + ".part"
+            with open(tmp, 'w') as f:
+                f.write(data)
+            os.replace(tmp, self.index_path)
+
+    def _apply_keep_segments(self):
+        if not self.keep_segments:
+            return
+        with self._index_lock:
+            deleted = _prune_segments(self._index, os.path.dirname(os.path.abspath(self.out_path)),
+                                      keep_last=self.keep_segments + 1)  # +1: the one being written
+        for f in deleted:
+            logging.info("Deleted old video segment %s", f)
+
+    def save_preroll(self, out_path, seconds=None):
+        """
+        Write the buffered last `seconds` (default: all of preroll_s) to `out_path`.
+        Returns the number of frames written.
+        """
+        if self._preroll is None:
+            raise RuntimeError("Pre-roll is disabled (preroll_s=0)")
+        with self._preroll_lock:
+            frames = list(self._preroll)
+        if seconds is not None and frames:
+            cutoff = frames[-1][0] - seconds
+            frames = [f for f in frames if f[0] >= cutoff]
+        if not frames:
+            return 0
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        writer = cv2.VideoWriter(out_path, fourcc, self.fps, (self.width, self.height))
+        try:
+            for _, jpg in frames:
+                writer.write(cv2.imdecode(jpg, cv2.IMREAD_COLOR))
+        finally:
+            writer.release()
+        logging.info("Saved %.1f s pre-roll -> %s", len(frames) / self.fps, out_path)
+        return len(frames)
+
+    def stop(self, timeout=30.0):
+        """
+        Stop the video recording. Waits up to `timeout` s for the encoder to
+        write the buffered frames; the camera is released in any case.
+        """
         if not self.running:
             print("Camera is not running.")
             return
         self.running = False
-        self.thread.join()
-        self.cap.release()
-        self.out.release()
-        cv2.destroyAllWindows()
-        logging.info(f"Video recording stopped -> {self.out_path}")
+        try:
+            self.thread.join(timeout)
+            # the sentinel only fits once the encoder takes frames off the
+            # queue; a dead encoder never will
+            deadline = time.monotonic() + timeout
+            while not self._encoder_done.is_set():
+                try:
+                    self._queue.put(None, timeout=0.5)
+                    break
+                except queue.Full:
+                    if time.monotonic() > deadline:
+                        break
+            self.encoder_thread.join(max(0.0, deadline - time.monotonic()))
+            if self.encoder_thread.is_alive():
+                logging.error("Video encoder did not finish within %.0f s; %d frames still queued",
+                              timeout, self._queue.qsize())
+        finally:
+            self.cap.release()
+            if self.out is not None and not self.encoder_thread.is_alive():
+                self.out.release()
+                self.out = None
+            self._save_index()
+            cv2.destroyAllWindows()
+        logging.info(f"Video recording stopped -> {self.out_path} {self.stats()}")
+
+def _prune_segments(index, directory, keep_last=None, max_age_s=None, keep_events=True):
+    """Delete segment files by policy; updates `index` in place, returns deleted file names."""
+    segs = [s for s in index["segments"] if not s.get("deleted")]
+    event_segments = {e["segment"] for e in index["events"]} if keep_events else set()
+    now = datetime.now()
+    deleted = []
+    for pos, seg in enumerate(segs):
+        n = index["segments"].index(seg)
+        too_many = keep_last is not None and pos < len(segs) - keep_last
+        too_old = max_age_s is not None and (
+            now - datetime.strptime(seg["start"], "%Y-%m-%d %H:%M:%S")).total_seconds() > max_age_s
+        if not (too_many or too_old) or n in event_segments:
+            continue
+        try:
+            os.remove(os.path.join(directory, seg["file"]))
+        except FileNotFoundError:
+            pass
+        seg["deleted"] = True
+        deleted.append(seg["file"])
+    return deleted
+
+
+def apply_video_retention(index_path, keep_last=None, max_age_s=None, keep_events=True):
+    """
+    Delete old segments of a segmented recording (see VideoRecorder(segment_s=...)).
+    Segments that contain an indexed event are kept unless keep_events=False.
+    """
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    deleted = _prune_segments(index, os.path.dirname(os.path.abspath(index_path)),
+                              keep_last=keep_last, max_age_s=max_age_s, keep_events=keep_events)
+    with open(index_path, 'w') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    logging.info("Video retention removed %d segment(s).", len(deleted))
+    return deleted
+
+
+def extract_clip(index_path, start_event, end_event=None, out_path=None, pad_s=0.0, max_s=None):
+    """
+    Cut the video between two indexed events (end defaults to start + max_s,
+    or the end of the recording) into `out_path`. Only the segments covering
+    the range are opened, and each one is seeked straight to its offset.
+    """
+    with open(index_path, 'r') as f:
+        index = json.load(f)
+    fps = index["fps"]
+    events = {e["name"]: e for e in index["events"]}
+    if start_event not in events:
+        raise KeyError(f"Event '{start_event}' not in {index_path}")
+    start = max(0, int(events[start_event]["frame"] - pad_s * fps))
+    total = sum(s["frames"] for s in index["segments"]) if index["segments"] else 0
+    if end_event is not None:
+        if end_event not in events:
+            raise KeyError(f"Event '{end_event}' not in {index_path}")
+        end = int(events[end_event]["frame"] + pad_s * fps)
+    elif max_s is not None:
+        end = start + int(max_s * fps)
+    else:
+        end = total
+    end = min(end, total)
+    if out_path is None:
+        base = os.path.splitext(index_path)[0].replace(".index", "")
+        out_path = f"{base}_{start_event}{'_' + end_event if end_event else ''}.mp4"
+
+    directory = os.path.dirname(os.path.abspath(index_path))
+    writer = None
+    written = 0
+    try:
+        for seg in index["segments"]:
+            first, last = seg["first_frame"], seg["first_frame"] + seg["frames"]
+            if last <= start or first >= end:
+                continue
+            if seg.get("deleted"):
+                raise FileNotFoundError(f"Segment {seg['file']} was deleted by retention")
+            cap = cv2.VideoCapture(os.path.join(directory, seg["file"]))
+            try:
+                offset = max(0, start - first)
+                if offset:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, offset)
+                for _ in range(min(last, end) - first - offset):
+                    ok, frame = cap.read()
+                    if not ok:
+                        break
+                    if writer is None:
+                        h, w = frame.shape[:2]
+                        writer = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+                    writer.write(frame)
+                    written += 1
+            finally:
+                cap.release()
+    finally:
+        if writer is not None:
+            writer.release()
+    logging.info("Extracted %d frames (%s -> %s) -> %s", written, start_event, end_event, out_path)
+    return out_path
+
 
 VALID_WELLS = {f"{row}{col}" for row in ["A", "B", "C"] for col in range(1, 6)}
 
@@ -904,7 +1580,21 @@ def load_experiment_csv(path):
 
 # LOGGING------------------------------------------------------------------------------------
 
-def record_event(strMetadataPath: str, name: str, temp: float | None = None):
+# metadata files are also written from background capture workers
+_metadata_lock = threading.RLock()
+
+
+def _metadata_writer(func):
+    def wrapper(*args, **kwargs):
+        with _metadata_lock:
+            return func(*args, **kwargs)
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+@_metadata_writer
+def record_event(strMetadataPath: str, name: str, temp: float | None = None, recorder=None):
     if os.path.exists(strMetadataPath):
         with open(strMetadataPath, 'r') as f:
             meta = json.load(f)
@@ -917,6 +1607,9 @@ def record_event(strMetadataPath: str, name: str, temp: float | None = None):
     entry = {"time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
     if temp is not None:
         entry["temp_C"] = temp
+    if recorder is not None and recorder.running:
+        # where this event is in the (segmented) video, see VideoRecorder.mark
+        entry["video"] = recorder.mark(name)
     events[name] = entry
 
     meta["events"] = events
@@ -925,6 +1618,7 @@ def record_event(strMetadataPath: str, name: str, temp: float | None = None):
 
     logging.info(f"Recorded event '{name}' in metadata.")
 
+@_metadata_writer
 def record_ph_series(strMetadataPath: str, series):
     """
     Store the pH time series into metadata as a list of 
@@ -946,6 +1640,7 @@ def record_ph_series(strMetadataPath: str, series):
 
     logging.info(f"Recorded %d pH points in metadata.", len(series))
 
+@_metadata_writer
 def record_experiment_data(
     strMetadataPath: str,
     section: str,
@@ -1018,3 +1713,25 @@ def record_experiment_data(
         json.dump(meta, f, ensure_ascii=False, indent=2)
 
     logging.info(f"Recorded {section}.{key} in metadata.")
+
+
+@_metadata_writer
+def record_image(strMetadataPath: str, imageName: str, info: dict):
+    """
+    Store capture info for one picture into metadata["images"][imageName]
+    (well, timestamp, lighting, bytes, transfer time...).
+    """
+    if os.path.exists(strMetadataPath):
+        with open(strMetadataPath, 'r') as f:
+            meta = json.load(f)
+    else:
+        meta = {}
+
+    images = meta.get("images", {})
+    images[imageName] = info
+
+    meta["images"] = images
+    with open(strMetadataPath, 'w') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    logging.info(f"Recorded image '{imageName}' in metadata.")